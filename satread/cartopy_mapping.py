@@ -182,4 +182,38 @@ ycoords = np.append(out[:, 1], out[0, 1])
 ax.plot(xcoords, ycoords)
 ax.plot(center_point[0], center_point[1], "go", markersize=10)
 
+# %% [markdown]
+# ## Many maps in one projection
+#
+# Each figure above re-projects the GSHHS coastline.  For a batch of
+# quicklooks that share a projection, extent and size, satcode.overlay
+# rasterizes the coastlines and gridlines once and blends the cached
+# mask onto every image
+
 # %%
+from satcode.overlay import composite, overlay_mask
+
+nrows, ncols = 500, 500
+alpha = overlay_mask(projection, new_extent, (nrows, ncols), cache_dir=context.data_dir)
+background = np.full((nrows, ncols, 4), 255, dtype=np.uint8)
+plt.figure(figsize=(5, 5))
+plt.imshow(composite(background, alpha))
+
+# %%
+
+# %% [markdown]
+# ## Just the Vancouver part of the granule
+#
+# satcode.roi finds the swath window around a point from every 10th
+# geolocation pixel, reads only that window of the band and resamples
+# only the subset
+
+# %%
+from satcode.roi import find_window, resample_roi
+
+print(find_window(context.modis_sat, point=(van_lon, van_lat), radius_km=150))
+images, roi_def = resample_roi(
+    context.modis_sat, bands=["31"], point=(van_lon, van_lat), radius_km=150
+)
+plt.figure(figsize=(5, 5))
+plt.imshow(images["31"])
@@ -27,7 +27,6 @@ import pprint
 import cartopy
 from pyhdf.SD import SD
 from pyhdf.SD import SDC
-from pyresample import kd_tree
 modis_image = context.modis_sat
 print(modis_image)
 
@@ -70,10 +69,17 @@ pprint.pprint(map_dict)
 
 # %%
 from pyresample import SwathDefinition
+from satcode import instrument
+from satcode.area_plan import check_coverage, plan_area_from_file
 
 proj_params = map_dict["proj4_params"]
 swath_def = SwathDefinition(lons, lats)
-area_def = swath_def.compute_optimal_bb_area(proj_dict=proj_params)
+#
+# plan the grid from the G-ring and the swath edges instead of
+# swath_def.compute_optimal_bb_area, which projects every pixel
+#
+area_def = plan_area_from_file(m3_path, proj_params=proj_params)
+print(f"fraction of swath outside the area: {check_coverage(area_def, lons, lats)}")
 
 # %%
 dir(area_def)
@@ -82,16 +88,18 @@ dir(area_def)
 # # resample the longitudes on this grid
 
 # %%
-fill_value = -9999.0
+from satcode.resample import resample
+
 area_name = "modis swath 5min granule"
-image_lons = kd_tree.resample_nearest(
-    swath_def,
-    lons.ravel(),
-    area_def,
-    radius_of_influence=5000,
-    nprocs=2,
-    fill_value=fill_value,
-)
+#
+# float32 with NaN in the cells no swath pixel reaches, so there is
+# no -9999 fill to replace afterwards
+#
+with instrument.span("resample_nearest") as the_span:
+    image_lons = resample(
+        swath_def, lons, area_def, method="nearest", radius_of_influence=5000
+    )
+    the_span.add("pixels_resampled", lons.size)
 print(f"\ndump area definition:\n{area_def}\n")
 print(
     (
@@ -101,23 +109,52 @@ print(
 )
 
 # %% [markdown]
-# # replace missing values with floating point nan
+# # Plot the image using cartopy
 
 # %%
-nan_value = np.array([np.nan], dtype=np.float32)[0]
-image_lons[image_lons < -9000] = nan_value
+with instrument.span("plot_map"):
+    crs = area_def.to_cartopy_crs()
+    ax = plt.axes(projection=crs)
+    ax.coastlines()
+    ax.set_global()
+    plt.imshow(image_lons, transform=crs, extent=crs.bounds, origin="upper")
+    plt.colorbar()
 
 # %% [markdown]
-# # Plot the image using cartopy
+# # Save the grid as a cloud optimized GeoTIFF
+#
+# tiled and compressed, with overviews, so a viewer only fetches the
+# tiles and zoom level it shows
 
 # %%
-crs = area_def.to_cartopy_crs()
+from satcode.cog import write_cog
+
+write_cog(image_lons, area_def, context.data_dir / "image_lons.tif")
+
+# %% [markdown]
+# # Compare with elliptical weighted averaging
+#
+# nearest neighbour aliases near the swath edges.  satcode.resample
+# computes ewa (or bilinear/gaussian) weights once as a sparse matrix,
+# so each extra band is a single sparse matrix product
+
+# %%
+ewa_lons = resample(swath_def, lons, area_def, method="ewa")
+plt.figure()
 ax = plt.axes(projection=crs)
 ax.coastlines()
-ax.set_global()
-plt.imshow(image_lons, transform=crs, extent=crs.bounds, origin="upper")
+plt.imshow(ewa_lons, transform=crs, extent=crs.bounds, origin="upper")
 plt.colorbar()
 
+# %% [markdown]
+# # Where did the time go?
+#
+# Run with `instrument.enable()` in the first cell (or with the
+# SATCODE_TRACE environment variable set) to see the span timings
+
+# %%
+instrument.print_summary()
+
 # %%
 crs.globe.to_proj4_params()
 
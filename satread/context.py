@@ -8,6 +8,7 @@ root_dir = this_dir.parent
 data_dir = root_dir / 'data'
 
 before_dir = data_dir / 'before_image'
+after_dir = data_dir / 'after_image'
 modis_sat = data_dir / 'MYD021KM.A2013222.2105.061.2018047235850.hdf'
 
 sys.path.insert(0, str(lib_dir))
@@ -28,6 +28,19 @@ scn = Scene(reader="generic_image", filenames=before_files)
 scn.load(['image'])
 scn.save_datasets(writer='simple_image',filename='b6.png',datasets=['image'])
 
+# %% [markdown]
+# # Composites and indices from all the bands
+#
+# satcode.landsat calibrates with the scene's MTL file and works through
+# the scene in windows, reading the bands for each window concurrently
+
+# %%
+from satcode.landsat import LandsatScene, make_product
+
+scene = LandsatScene(context.before_dir)
+for product in ["true_color", "ndvi", "bt"]:
+    print(make_product(scene, product, Path(context.data_dir) / f"before_{product}.tif"))
+
 # %%
 from PIL import Image               # to load images
 from IPython.display import display # to display images
@@ -40,3 +53,17 @@ display(thumbnail)
 #display(pil_im)
 
 # %%
+
+# %% [markdown]
+# # The same scene through the reader registry
+#
+# satcode.readers gives Landsat scenes, MODIS granules and GOES files one
+# lazy interface: metadata, geolocation and bands as chunked dask arrays
+
+# %%
+from satcode.readers import open_granule
+
+reader = open_granule(context.before_dir)
+print(reader.name, reader.metadata()["start"], reader.band_names())
+nir = reader.band("nir")
+print(nir)
@@ -0,0 +1,342 @@
+"""
+  satcode.area_plan
+  _________________
+
+  plans the target grid for a swath from its G-ring corners (parseMeta)
+  plus a decimated swath boundary, instead of projecting every pixel the
+  way SwathDefinition.compute_optimal_bb_area does.
+
+  A map projection takes the swath's outline to the outline of the
+  projected swath, so the bounding box of the projected boundary is the
+  bounding box of the projected swath.  Only the boundary is needed:
+  O(perimeter) instead of O(pixels).  Between the decimated boundary
+  samples the edge can bow outwards a little, so the extent is padded by
+  a bound on that bow computed from the second differences of the
+  projected samples, plus one output pixel.
+
+  With a filename, only the four edges of Latitude/Longitude are read
+  from the hdf file (pyhdf start/count/stride reads).
+
+  to run from the command line::
+
+    python -m satcode.area_plan MYD03.A2013222.2105.061.2018047235850.hdf
+
+  to run from a python script::
+
+    from satcode.area_plan import plan_area_from_file
+    area_def = plan_area_from_file(m3_file, proj_params=map_dict['proj4_params'])
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+
+def swath_boundary(lons, lats, step=10):
+    """
+    decimated outline of a swath, going around the edges in order
+    (first row, last column, last row reversed, first column reversed),
+    always including the four corners
+
+    Returns
+    -------
+
+    lons, lats: 1-d float64 arrays
+    """
+    nrows, ncols = lons.shape
+
+    def ring(values):
+        cols = np.unique(np.append(np.arange(0, ncols, step), ncols - 1))
+        rows = np.unique(np.append(np.arange(0, nrows, step), nrows - 1))
+        return np.concatenate(
+            [
+                values[0, cols],
+                values[rows, -1],
+                values[-1, cols[::-1]],
+                values[rows[::-1], 0],
+            ]
+        ).astype(np.float64)
+
+    return ring(lons), ring(lats)
+
+
+def finite_boundary(lons, lats, step=10):
+    """
+    decimated outline of the pixels with finite geolocation, for grids
+    whose edges are partly off the earth (GOES ABI sectors near the limb):
+    down the first finite column of every sampled row, then back up the
+    last one
+
+    Returns
+    -------
+
+    lons, lats: 1-d float64 arrays
+    """
+    nrows = lons.shape[0]
+    rows = np.unique(np.append(np.arange(0, nrows, step), nrows - 1))
+    finite = np.isfinite(lons[rows]) & np.isfinite(lats[rows])
+    rows, finite = rows[finite.any(axis=1)], finite[finite.any(axis=1)]
+    if rows.size == 0:
+        raise ValueError("no pixel has finite geolocation")
+    first = np.argmax(finite, axis=1)
+    last = finite.shape[1] - 1 - np.argmax(finite[:, ::-1], axis=1)
+    ring_rows = np.concatenate([rows, rows[::-1]])
+    ring_cols = np.concatenate([first, last[::-1]])
+    return (
+        lons[ring_rows, ring_cols].astype(np.float64),
+        lats[ring_rows, ring_cols].astype(np.float64),
+    )
+
+
+def read_boundary(filename, step=10):
+    """
+    read only the edges of the Latitude/Longitude datasets of a MODIS
+    hdf4 file
+
+    Returns
+    -------
+
+    lons, lats: 1-d float64 arrays
+       in the same order as swath_boundary
+    """
+    from pyhdf.SD import SD, SDC
+
+    the_file = SD(str(filename), SDC.READ)
+    out = []
+    with instrument.span("read_boundary") as the_span:
+        for name in ["Longitude", "Latitude"]:
+            sds = the_file.select(name)
+            nrows, ncols = sds.info()[2]
+            ncol_samples = (ncols - 1) // step + 1
+            nrow_samples = (nrows - 1) // step + 1
+            top = sds.get(start=(0, 0), count=(1, ncol_samples), stride=(1, step))
+            bottom = sds.get(
+                start=(nrows - 1, 0), count=(1, ncol_samples), stride=(1, step)
+            )
+            left = sds.get(start=(0, 0), count=(nrow_samples, 1), stride=(step, 1))
+            right = sds.get(
+                start=(0, ncols - 1), count=(nrow_samples, 1), stride=(step, 1)
+            )
+            corners = sds.get(start=(0, 0), count=(2, 2), stride=(nrows - 1, ncols - 1))
+            sds.endaccess()
+            #
+            # add the last row/column when the stride skips it
+            #
+            top = np.append(top.ravel(), corners[0, 1])
+            bottom = np.append(bottom.ravel(), corners[1, 1])
+            left = np.append(left.ravel(), corners[1, 0])
+            right = np.append(right.ravel(), corners[1, 1])
+            edge = np.concatenate([top, right, bottom[::-1], left[::-1]])
+            out.append(edge.astype(np.float64))
+            the_span.add("bytes_read", 4 * edge.size)
+    the_file.end()
+    return out[0], out[1]
+
+
+def _bow_margin(x, y):
+    """
+    bound on how far the true edge can bulge between boundary samples:
+    for a smooth curve the chord error is about |second difference| / 8
+    """
+    points = np.stack([x, y])
+    second = points[:, 2:] - 2.0 * points[:, 1:-1] + points[:, :-2]
+    if second.size == 0:
+        return 0.0
+    return float(np.max(np.abs(second))) / 8.0
+
+
+def default_projection(meta):
+    """LAEA on a sphere, centred on the granule, as in cartopy_mapping"""
+    return dict(
+        proj="laea",
+        lat_0=float(meta["lat_0"]),
+        lon_0=float(meta["lon_0"]),
+        a=6_371_228.0,
+        units="m",
+    )
+
+
+def plan_area(
+    boundary_lons,
+    boundary_lats,
+    meta=None,
+    proj_params=None,
+    resolution=None,
+    step=10,
+    area_id="granule",
+):
+    """
+    target area covering a swath
+
+    Parameters
+    ----------
+
+    boundary_lons, boundary_lats: 1-d arrays
+       outline from swath_boundary or read_boundary
+
+    meta: optional dict
+       parseMeta output; its G-ring corners are added to the outline and
+       its centre is used for the default projection
+
+    proj_params: optional dict
+       proj4 parameters (e.g. map_dict['proj4_params'] from corners.json),
+       defaults to default_projection(meta)
+
+    resolution: optional float
+       pixel size in projection units; defaults to the smallest typical
+       pixel spacing along the boundary (nadir-like pixels)
+
+    step: int
+       swath pixels between boundary samples, used for the default
+       resolution
+
+    Returns
+    -------
+
+    area_def: pyresample AreaDefinition
+    """
+    import pyproj
+    from pyresample.geometry import AreaDefinition
+
+    if proj_params is None:
+        if meta is None:
+            raise ValueError("need meta or proj_params to choose a projection")
+        proj_params = default_projection(meta)
+    with instrument.span("plan_area") as the_span:
+        transformer = pyproj.Transformer.from_crs(
+            "EPSG:4326", pyproj.CRS(proj_params), always_xy=True
+        )
+        x, y = transformer.transform(boundary_lons, boundary_lats)
+        x, y = np.asarray(x), np.asarray(y)
+        good = np.isfinite(x) & np.isfinite(y)
+        x, y = x[good], y[good]
+        the_span.add("points_projected", x.size)
+        if resolution is None:
+            spacing = np.hypot(np.diff(x), np.diff(y))
+            resolution = float(np.percentile(spacing[spacing > 0], 10)) / step
+        all_x, all_y = x, y
+        if meta is not None:
+            gx, gy = transformer.transform(
+                np.asarray(meta["lon_list"], dtype=float),
+                np.asarray(meta["lat_list"], dtype=float),
+            )
+            all_x = np.concatenate([x, np.asarray(gx)])
+            all_y = np.concatenate([y, np.asarray(gy)])
+        pad = _bow_margin(x, y) + resolution
+        x_min, x_max = np.nanmin(all_x) - pad, np.nanmax(all_x) + pad
+        y_min, y_max = np.nanmin(all_y) - pad, np.nanmax(all_y) + pad
+        width = int(np.ceil((x_max - x_min) / resolution))
+        height = int(np.ceil((y_max - y_min) / resolution))
+        area_extent = (
+            x_min,
+            y_min,
+            x_min + width * resolution,
+            y_min + height * resolution,
+        )
+        area_def = AreaDefinition(
+            area_id,
+            "swath bounding box from boundary",
+            area_id,
+            proj_params,
+            width,
+            height,
+            area_extent,
+        )
+    return area_def
+
+
+def check_coverage(area_def, lons, lats, step=50):
+    """
+    check that a decimated sample of the whole swath falls inside area_def
+
+    Returns
+    -------
+
+    fraction_outside: float
+       0.0 when every sampled pixel with finite geolocation is inside
+    """
+    sample_lons = np.asarray(lons)[::step, ::step]
+    sample_lats = np.asarray(lats)[::step, ::step]
+    finite = np.isfinite(sample_lons) & np.isfinite(sample_lats)
+    if not finite.any():
+        #
+        # a sector mostly off the earth can miss every sample point, so
+        # take every step-th pixel of the ones with finite geolocation
+        #
+        sample_lons, sample_lats = np.asarray(lons), np.asarray(lats)
+        finite = np.isfinite(sample_lons) & np.isfinite(sample_lats)
+        if not finite.any():
+            return 1.0
+        sample_lons, sample_lats = (
+            sample_lons[finite][::step],
+            sample_lats[finite][::step],
+        )
+    else:
+        sample_lons, sample_lats = sample_lons[finite], sample_lats[finite]
+    cols, rows = area_def.get_array_coordinates_from_lonlat(sample_lons, sample_lats)
+    cols, rows = np.asarray(cols), np.asarray(rows)
+    inside = (
+        (cols >= -0.5)
+        & (cols <= area_def.width - 0.5)
+        & (rows >= -0.5)
+        & (rows <= area_def.height - 0.5)
+    )
+    return 1.0 - float(np.mean(inside))
+
+
+def plan_area_from_file(filename, proj_params=None, resolution=None, step=10):
+    """
+    plan_area reading only the G-ring metadata and the swath edges
+
+    Parameters
+    ----------
+
+    filename: str or Path
+       MODIS hdf4 file with Latitude/Longitude and CoreMetadata.0
+       (MYD03 for a 1 km grid, MYD021KM for its 5 km geolocation)
+
+    step: int
+       boundary decimation in pixels
+    """
+    from satcode.modismeta_read import parseMeta
+
+    meta = parseMeta(filename)
+    lons, lats = read_boundary(filename, step)
+    return plan_area(
+        lons,
+        lats,
+        meta=meta,
+        proj_params=proj_params,
+        resolution=resolution,
+        step=step,
+        area_id=Path(filename).stem,
+    )
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("filename", type=str, help="MYD03 or MYD021KM hdf4 file")
+    parser.add_argument("--resolution", type=float, default=None, help="meters")
+    parser.add_argument("--step", type=int, default=10, help="boundary decimation")
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    area_def = plan_area_from_file(
+        args.filename, resolution=args.resolution, step=args.step
+    )
+    print(area_def)
+
+
+if __name__ == "__main__":
+    main()
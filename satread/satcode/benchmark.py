@@ -0,0 +1,434 @@
+"""
+  satcode.benchmark
+  _________________
+
+  times the satread hot paths (download, read_mda, parseMeta,
+  kd-tree resampling, projection transforms and the satpy save path)
+  against synthetic fixtures, so nothing needs the network or the real
+  MYD021KM granule.
+
+  Every stage runs in a fresh process, and is called once to warm up
+  before it is timed.  The peak resident set size reported for it is
+  the peak during the ``repeat`` timed calls minus the RSS after the
+  fixtures were built and the warm-up call returned, so it is the
+  memory one call needs, not the size of the fixtures.  rss growth is
+  what the timed calls left resident.  Each stage is then run once more
+  under tracemalloc to count the peak bytes allocated by python and
+  numpy.
+
+  to run from the command line::
+
+    python -m satcode.benchmark
+
+    or
+
+    python -m satcode.benchmark --stages parseMeta resample_nearest --repeat 5 --save bench.json
+
+    python -m satcode.benchmark --compare bench.json
+
+  to run from a python script::
+
+    from satcode.benchmark import run_benchmarks, print_report
+    results = run_benchmarks(['read_mda', 'parseMeta'])
+    print_report(results)
+"""
+import argparse
+import contextlib
+import functools
+import http.server
+import io
+import json
+import multiprocessing
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from satcode import synthetic
+from satcode.synthetic import modis_cols, modis_rows
+
+
+def rss_bytes():
+    """
+    peak resident set size of this process so far, in bytes
+    (ru_maxrss is in kbytes on linux and bytes on macos)
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def current_rss_bytes():
+    """
+    resident set size of this process now, in bytes, or None where
+    there is no /proc
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+
+def reset_peak_rss():
+    """
+    restart the peak that rss_bytes() reports from the current RSS.
+    Only linux can do this; returns False where it can't
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def _http_server(directory):
+    """
+    serve directory on a random localhost port for the download stage
+    """
+    handler = functools.partial(_QuietHandler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+#
+# each stage is a setup function taking (workdir, scale) and returning
+# (run, units, amount): run() is the timed callable, amount is the
+# number of units it processes per call
+#
+
+
+def _setup_download(workdir, scale):
+    served = workdir / "served"
+    served.mkdir()
+    payload = served / "payload.bin"
+    nbytes = int(50e6 * scale)
+    payload.write_bytes(np.random.default_rng(0).bytes(nbytes))
+    from satcode.data_read import download
+
+    stack = contextlib.ExitStack()
+    root = stack.enter_context(_http_server(served))
+    counter = iter(range(sys.maxsize))
+
+    def run():
+        dest = workdir / f"dest{next(counter)}"
+        with contextlib.redirect_stdout(io.StringIO()):
+            download(payload.name, root=root, dest_folder=dest)
+
+    return run, "bytes", nbytes, stack
+
+
+def _setup_read_mda(workdir, scale):
+    from satcode.modismeta_read import read_mda
+
+    lons, lats = synthetic.swath_geolocation(10, 10)
+    corner_lons, corner_lats = synthetic.gring_corners(lons, lats)
+    text = synthetic.core_metadata("bench.hdf", corner_lons, corner_lats)
+    ncopies = max(1, int(200 * scale))
+
+    def run():
+        for _ in range(ncopies):
+            read_mda(text)
+
+    return run, "bytes", len(text) * ncopies, None
+
+
+def _setup_parseMeta(workdir, scale):
+    from satcode.modismeta_read import parseMeta
+
+    nfiles = max(1, int(20 * scale))
+    filenames = [
+        synthetic.write_modis_03(workdir / f"MYD03.bench{count}.hdf", 50, 40)
+        for count in range(nfiles)
+    ]
+
+    def run():
+        for filename in filenames:
+            parseMeta(filename)
+
+    return run, "files", nfiles, None
+
+
+def _scaled_shape(scale):
+    rows = max(10, int(modis_rows * np.sqrt(scale)) // 10 * 10)
+    cols = max(10, int(modis_cols * np.sqrt(scale)))
+    return rows, cols
+
+
+def _laea_area(lons, lats):
+    from pyresample import geometry
+
+    proj_dict = dict(
+        proj="laea",
+        lat_0=float(np.mean(lats)),
+        lon_0=float(np.mean(lons)),
+        a=6371228.0,
+        units="m",
+    )
+    swath_def = geometry.SwathDefinition(lons, lats)
+    area_def = swath_def.compute_optimal_bb_area(proj_dict=proj_dict)
+    return swath_def, area_def
+
+
+def _setup_resample_nearest(workdir, scale):
+    from pyresample import kd_tree
+
+    shape = _scaled_shape(scale)
+    lons, lats = synthetic.swath_geolocation(*shape)
+    swath_def, area_def = _laea_area(lons, lats)
+
+    def run():
+        plan = kd_tree.get_neighbour_info(
+            swath_def, area_def, 5000, neighbours=1, nprocs=1
+        )
+        kd_tree.get_sample_from_neighbour_info(
+            "nn", area_def.shape, lons.ravel(), *plan[:3], fill_value=np.nan
+        )
+
+    return run, "pixels", lons.size, None
+
+
+def _setup_transform(workdir, scale):
+    import pyproj
+
+    shape = _scaled_shape(scale)
+    lons, lats = synthetic.swath_geolocation(*shape)
+    transformer = pyproj.Transformer.from_crs(
+        "EPSG:4326",
+        "+proj=laea +lat_0=45 +lon_0=-115 +a=6371228 +units=m",
+        always_xy=True,
+    )
+
+    def run():
+        transformer.transform(lons, lats)
+
+    return run, "pixels", lons.size, None
+
+
+def _setup_satpy_save(workdir, scale):
+    import xarray
+    from satpy import Scene
+
+    rows, cols = _scaled_shape(scale)
+    image = np.random.default_rng(0).random((rows, cols), dtype=np.float32)
+    scn = Scene()
+    scn["image"] = xarray.DataArray(image, dims=("y", "x"), attrs=dict(name="image"))
+    outfile = str(workdir / "bench.png")
+
+    def run():
+        scn.save_dataset("image", writer="simple_image", filename=outfile)
+
+    return run, "pixels", image.size, None
+
+
+stages = {
+    "download": _setup_download,
+    "read_mda": _setup_read_mda,
+    "parseMeta": _setup_parseMeta,
+    "resample_nearest": _setup_resample_nearest,
+    "transform": _setup_transform,
+    "satpy_save": _setup_satpy_save,
+}
+
+
+def _run_stage(name, repeat, scale):
+    """
+    run a single stage inside the current (fresh) process and
+    return a dictionary of measurements
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run, units, amount, cleanup = stages[name](Path(tmpdir), scale)
+        try:
+            run()  # warm up caches and lazy imports
+            #
+            # where the peak can't be reset, count only how far the timed
+            # calls push it past the setup and warm-up peak, for both the
+            # peak and the growth
+            #
+            rss_before = current_rss_bytes() if reset_peak_rss() else None
+            peak_before = rss_bytes()
+            times = []
+            for _ in range(repeat):
+                tic = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - tic)
+            peak_rss = rss_bytes() - peak_before
+            rss_growth = peak_rss
+            if rss_before is not None:
+                rss_growth = current_rss_bytes() - rss_before
+            tracemalloc.start()
+            run()
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            if cleanup is not None:
+                cleanup.close()
+    best = min(times)
+    return dict(
+        stage=name,
+        units=units,
+        amount=amount,
+        repeat=repeat,
+        best_s=best,
+        median_s=float(np.median(times)),
+        throughput=amount / best if best > 0 else float("inf"),
+        peak_rss=peak_rss,
+        rss_growth=rss_growth,
+        alloc_peak=traced_peak,
+    )
+
+
+def run_benchmarks(stage_names=None, repeat=3, scale=1.0, isolate=True):
+    """
+    run the selected benchmark stages
+
+    Parameters
+    ----------
+
+    stage_names: optional list of str
+       names from ``stages``, defaults to all of them
+
+    repeat: int
+       number of timed calls per stage
+
+    scale: float
+       multiplies the fixture sizes; 1.0 means one full MODIS granule
+
+    isolate: bool
+       if True run each stage in its own spawned process so that
+       peak RSS is per stage
+
+    Returns
+    -------
+
+    results: list of dict
+       one dictionary of measurements per stage.  Stages whose
+       optional dependencies are missing are reported with an
+       ``error`` key instead of timings
+    """
+    if stage_names is None:
+        stage_names = list(stages.keys())
+    results = []
+    for name in stage_names:
+        if name not in stages:
+            raise ValueError(f"unknown stage {name}, choose from {list(stages)}")
+        try:
+            if isolate:
+                ctx = multiprocessing.get_context("spawn")
+                with ctx.Pool(1) as pool:
+                    result = pool.apply(_run_stage, (name, repeat, scale))
+            else:
+                result = _run_stage(name, repeat, scale)
+        except ImportError as e:
+            result = dict(stage=name, error=f"skipped: {e}")
+        results.append(result)
+    return results
+
+
+_short_units = dict(bytes="B", files="f", pixels="px")
+
+
+def _human(value, unit=""):
+    for prefix in ["", "k", "M", "G"]:
+        if abs(value) < 1000.0:
+            return f"{value:7.2f} {prefix}{unit}"
+        value /= 1000.0
+    return f"{value:7.2f} T{unit}"
+
+
+def print_report(results, baseline=None, threshold=0.1):
+    """
+    print a table of results.  If a baseline result list is given, flag
+    stages whose best time got worse by more than threshold (fractional)
+    """
+    old = {}
+    if baseline is not None:
+        old = {item["stage"]: item for item in baseline if "error" not in item}
+    header = (
+        f"{'stage':18s} {'best':>10s} {'throughput':>16s} {'peak rss':>12s} "
+        f"{'rss growth':>12s} {'allocs':>12s}"
+    )
+    print(header)
+    print("-" * len(header))
+    for item in results:
+        if "error" in item:
+            print(f"{item['stage']:18s} {item['error']}")
+            continue
+        line = (
+            f"{item['stage']:18s} {item['best_s']*1.e3:8.2f}ms "
+            f"{_human(item['throughput'], _short_units[item['units']] + '/s'):>16s} "
+            f"{_human(item['peak_rss'], 'B'):>12s} "
+            f"{_human(item['rss_growth'], 'B'):>12s} "
+            f"{_human(item['alloc_peak'], 'B'):>12s}"
+        )
+        if item["stage"] in old:
+            ratio = item["best_s"] / old[item["stage"]]["best_s"] - 1.0
+            flag = "  REGRESSION" if ratio > threshold else ""
+            line += f"  {ratio*100.:+6.1f}%{flag}"
+        print(line)
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument(
+        "--stages", nargs="+", default=None, help=f"subset of {list(stages)}"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per stage")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="fixture size relative to one granule"
+    )
+    parser.add_argument("--save", type=str, default=None, help="write results to json")
+    parser.add_argument(
+        "--compare", type=str, default=None, help="json file from an earlier --save"
+    )
+    parser.add_argument(
+        "--no-isolate",
+        action="store_true",
+        help="run all stages in this process (earlier stages' imports and caches stay resident)",
+    )
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    results = run_benchmarks(
+        args.stages, repeat=args.repeat, scale=args.scale, isolate=not args.no_isolate
+    )
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(results, baseline=baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+  satcode.bowtie
+  ______________
+
+  MODIS scans 10 detector rows at a time.  Away from nadir each scan's
+  footprint grows along track (the "bow-tie"), so neighbouring scans
+  overlap and the same ground is seen twice near the swath edges --
+  about a third of the pixels in the outer parts of the swath.
+
+  bowtie_mask finds, column by column, the rows of each scan that lie
+  past the midpoint to the neighbouring scan centre and marks them as
+  duplicates.  Dropping them shrinks the resampling input and removes
+  the saw-tooth seams from mosaics.  The work is done in chunks of
+  whole scans so memory stays bounded for full granules.
+
+  to run from a python script::
+
+    from satcode.bowtie import bowtie_mask, deduplicate
+    keep = bowtie_mask(lons, lats)
+    print(f"dropping {1 - keep.mean():.1%} of the swath")
+    swath_1d, index = deduplicate(lons, lats, keep)
+
+    # or let the resampler do it:
+    from satcode.resample import resample
+    image = resample(swath_def, band, area_def, method='nearest', deduplicate=True)
+"""
+import numpy as np
+
+rows_per_scan = 10
+
+
+def scan_chunks(nrows, rows_per_scan=rows_per_scan, scans_per_chunk=20):
+    """
+    row slices covering nrows, each holding scans_per_chunk whole scans
+    (the last one may be shorter)
+    """
+    if nrows % rows_per_scan != 0:
+        raise ValueError(
+            f"{nrows} rows is not a whole number of {rows_per_scan}-row scans"
+        )
+    step = rows_per_scan * scans_per_chunk
+    return [slice(start, min(start + step, nrows)) for start in range(0, nrows, step)]
+
+
+def _unit_vectors(lons, lats):
+    lons = np.deg2rad(lons, dtype=np.float64)
+    lats = np.deg2rad(lats, dtype=np.float64)
+    coslat = np.cos(lats)
+    return np.stack(
+        [coslat * np.cos(lons), coslat * np.sin(lons), np.sin(lats)], axis=-1
+    )
+
+
+def _scan_centres(points):
+    """
+    (nscans, cols, 3) unit vectors halfway between the two middle rows
+    """
+    middle = points.shape[1] // 2
+    centre = points[:, middle - 1] + points[:, middle]
+    return centre / np.linalg.norm(centre, axis=-1, keepdims=True)
+
+
+def bowtie_mask(lons, lats, rows_per_scan=rows_per_scan, scans_per_chunk=20):
+    """
+    Parameters
+    ----------
+
+    lons, lats: arrays of shape (rows, cols)
+       full resolution swath geolocation, rows a multiple of rows_per_scan
+
+    Returns
+    -------
+
+    keep: bool array of shape (rows, cols)
+       False for pixels that a neighbouring scan already covers.  Every
+       ground location keeps at least the pixel from the scan whose
+       centre is nearest to it.
+    """
+    nrows, ncols = lons.shape
+    nscans = nrows // rows_per_scan
+    keep = np.ones((nrows, ncols), dtype=bool)
+    chunks = scan_chunks(nrows, rows_per_scan, scans_per_chunk)
+    if nscans <= 1:
+        #
+        # a single scan has no neighbour to overlap, and no along-track
+        # axis to measure along
+        #
+        return keep
+    for chunk in chunks:
+        first = chunk.start // rows_per_scan
+        last = chunk.stop // rows_per_scan
+        #
+        # one scan of halo on each side to find the neighbour centres
+        #
+        lo, hi = max(first - 1, 0), min(last + 1, nscans)
+        rows = slice(lo * rows_per_scan, hi * rows_per_scan)
+        points = _unit_vectors(lons[rows], lats[rows])
+        points = points.reshape(hi - lo, rows_per_scan, ncols, 3)
+        centres = _scan_centres(points)
+        #
+        # along-track axis through each scan centre, from the previous
+        # to the next centre (one sided at the ends of the granule)
+        #
+        before = np.concatenate([centres[:1], centres[:-1]])
+        after = np.concatenate([centres[1:], centres[-1:]])
+        axis = after - before
+        axis /= np.linalg.norm(axis, axis=-1, keepdims=True)
+        to_next = np.einsum("sci,sci->sc", after - centres, axis) / 2.0
+        to_prev = np.einsum("sci,sci->sc", centres - before, axis) / 2.0
+        offset = np.einsum("srci,sci->src", points - centres[:, np.newaxis], axis)
+        inside = offset <= to_next[:, np.newaxis]
+        inside &= offset > -to_prev[:, np.newaxis]
+        #
+        # the first and last scans of the granule have no neighbour on
+        # one side, keep everything there
+        #
+        if lo == 0:
+            inside[0] |= offset[0] <= 0
+        if hi == nscans:
+            inside[-1] |= offset[-1] > 0
+        inside = inside[first - lo : first - lo + last - first]
+        keep[chunk] = inside.reshape(-1, ncols)
+    return keep
+
+
+def deduplicate(lons, lats, keep=None, rows_per_scan=rows_per_scan):
+    """
+    drop the duplicated pixels
+
+    Returns
+    -------
+
+    swath_def: pyresample SwathDefinition
+       1-d, only the kept pixels
+
+    index: int array
+       flat indices of the kept pixels in the full swath, so a band is
+       reduced with band.ravel()[index]
+    """
+    from pyresample import SwathDefinition
+
+    if keep is None:
+        keep = bowtie_mask(lons, lats, rows_per_scan)
+    index = np.flatnonzero(keep)
+    swath_def = SwathDefinition(lons.ravel()[index], lats.ravel()[index])
+    return swath_def, index
@@ -0,0 +1,523 @@
+"""
+  satcode.catalog
+  _______________
+
+  a footprint catalog of MODIS granules: one small record per granule
+  with its start/stop/equator crossing times, day/night flag, orbit and
+  the G-ring corners from CoreMetadata.0.  Building it reads only the
+  metadata of each file (on a process pool), after that queries never
+  open an hdf file.
+
+  The records are rows of a numpy structured array (record_dtype, about
+  150 bytes per granule), filled straight from the metadata string by
+  core_fields without going through parseMeta's nested dicts, so a
+  million granules fit in a couple of hundred megabytes and every field
+  is a column for vectorized queries.  Catalogs are saved as .npz, or as
+  json lines for a .jsonl name.
+
+  covering finds the granules whose footprint contains a lon/lat point,
+  vectorized over the whole catalog: the G-ring edges are great circles,
+  so a point is inside when it is on the same side of all four of them.
+  TimeIndex answers "granules in this time window" with a binary search
+  over the sorted start times.
+
+  to run from the command line::
+
+    python -m satcode.catalog build ../data/*.hdf --out ../data/catalog.npz
+
+    python -m satcode.catalog query ../data/catalog.npz --point -123.1207 49.2827
+
+  to run from a python script::
+
+    from satcode.catalog import TimeIndex, build_catalog, covering
+    catalog = build_catalog(filenames)
+    over_vancouver = covering(catalog, -123.1207, 49.2827)
+    august = TimeIndex(catalog).window('2013-08-01', '2013-09-01')
+"""
+import argparse
+import concurrent.futures
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+earth_radius_km = 6371.0
+
+
+#
+# one catalog row; about 150 bytes against several kilobytes for the
+# nested dicts and lists of a parseMeta result
+#
+record_dtype = np.dtype(
+    [
+        ("filename", "S64"),
+        ("folder", "i4"),
+        ("orbit", "i4"),
+        ("start", "M8[ms]"),
+        ("stop", "M8[ms]"),
+        ("equator", "M8[ms]"),
+        ("daynight", "S5"),
+        ("lon_list", "f4", (4,)),
+        ("lat_list", "f4", (4,)),
+        ("bbox", "f4", (4,)),
+        ("lon_0", "f4"),
+        ("lat_0", "f4"),
+    ]
+)
+#
+# the CoreMetadata.0 objects a catalog row needs
+#
+core_objects = [
+    "LOCALGRANULEID",
+    "ORBITNUMBER",
+    "DAYNIGHTFLAG",
+    "RANGEBEGINNINGDATE",
+    "RANGEBEGINNINGTIME",
+    "RANGEENDINGDATE",
+    "RANGEENDINGTIME",
+    "EQUATORCROSSINGDATE",
+    "EQUATORCROSSINGTIME",
+    "GRINGPOINTLONGITUDE",
+    "GRINGPOINTLATITUDE",
+    "WESTBOUNDINGCOORDINATE",
+    "EASTBOUNDINGCOORDINATE",
+    "NORTHBOUNDINGCOORDINATE",
+    "SOUTHBOUNDINGCOORDINATE",
+]
+_object_pattern = re.compile(
+    r"(?<!END_)OBJECT\s*=\s*(" + "|".join(core_objects) + r")\s*\n"
+    r"(?:(?!END_OBJECT).)*?VALUE\s*=\s*([^\n]*)",
+    re.DOTALL,
+)
+
+
+class Catalog:
+    """
+    granule footprints as a numpy structured array (record_dtype), one
+    row per granule, plus the list of folders the files are in
+
+    Indexing with an int gives the granule as a dict; a slice, mask or
+    index array gives a smaller Catalog sharing the folder list
+    """
+
+    __slots__ = ("records", "folders")
+
+    def __init__(self, records=None, folders=()):
+        self.records = np.zeros(0, dtype=record_dtype) if records is None else records
+        self.folders = list(folders)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.record(index)
+        return Catalog(self.records[index], self.folders)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.record(index)
+
+    @property
+    def nbytes(self):
+        return self.records.nbytes
+
+    def path(self, index):
+        row = self.records[index]
+        return str(Path(self.folders[row["folder"]]) / row["filename"].decode())
+
+    def record(self, index):
+        """
+        one granule as a dict: filename, path, start, stop, equator (iso
+        strings), daynight, orbit, lon_0, lat_0, lon_list, lat_list and
+        bbox (lon_min, lat_min, lon_max, lat_max, see footprint_bbox)
+        """
+        row = self.records[index]
+        return dict(
+            filename=row["filename"].decode(),
+            path=self.path(index),
+            start=str(row["start"]),
+            stop=str(row["stop"]),
+            equator=str(row["equator"]),
+            daynight=row["daynight"].decode(),
+            orbit=int(row["orbit"]),
+            lon_0=float(row["lon_0"]),
+            lat_0=float(row["lat_0"]),
+            lon_list=row["lon_list"].tolist(),
+            lat_list=row["lat_list"].tolist(),
+            bbox=row["bbox"].tolist(),
+        )
+
+    def sort(self):
+        """sort in place by start time, then filename"""
+        self.records = self.records[
+            np.lexsort((self.records["filename"], self.records["start"]))
+        ]
+
+
+def _value(text):
+    text = text.strip()
+    if text.startswith("("):
+        return [float(item) for item in text.strip("()").split(",")]
+    return text.strip('"')
+
+
+def core_fields(metadata):
+    """
+    the catalog fields of a CoreMetadata.0 string, picked out with one
+    regular expression instead of building parseMeta's nested dicts
+
+    Returns
+    -------
+
+    fields: dict
+       CoreMetadata.0 object name -> value (str, or list of float for the
+       G-ring)
+    """
+    return {name: _value(text) for name, text in _object_pattern.findall(metadata)}
+
+
+def _fill_row(row, fields):
+    """fill one record_dtype row from core_fields"""
+    from satcode.modismeta_read import parse_time
+
+    if "GRINGPOINTLONGITUDE" in fields:
+        lons = np.array(fields["GRINGPOINTLONGITUDE"], dtype=np.float64)
+        lats = np.array(fields["GRINGPOINTLATITUDE"], dtype=np.float64)
+    else:
+        #
+        # level2 products have a bounding rectangle instead of a G-ring,
+        # ccw from lower right as in modismeta_read
+        #
+        west = float(fields["WESTBOUNDINGCOORDINATE"])
+        east = float(fields["EASTBOUNDINGCOORDINATE"])
+        north = float(fields["NORTHBOUNDINGCOORDINATE"])
+        south = float(fields["SOUTHBOUNDINGCOORDINATE"])
+        lons = np.array([east, west, west, east])
+        lats = np.array([south, south, north, north])
+    row["filename"] = fields["LOCALGRANULEID"]
+    row["orbit"] = int(fields["ORBITNUMBER"])
+    row["daynight"] = fields["DAYNIGHTFLAG"]
+    for key, date, time in [
+        ("start", "RANGEBEGINNINGDATE", "RANGEBEGINNINGTIME"),
+        ("stop", "RANGEENDINGDATE", "RANGEENDINGTIME"),
+        ("equator", "EQUATORCROSSINGDATE", "EQUATORCROSSINGTIME"),
+    ]:
+        row[key] = parse_time(fields[date], fields[time])
+    row["lon_list"] = lons
+    row["lat_list"] = lats
+    row["bbox"] = footprint_bbox(lons, lats)
+    row["lon_0"], row["lat_0"] = footprint_centres(lons, lats)
+
+
+def parse_batch(paths):
+    """
+    read the CoreMetadata.0 of each file straight into a Catalog.  Files
+    that can't be read are reported and left out
+    """
+    from pyhdf.SD import SD, SDC
+
+    records = np.zeros(len(paths), dtype=record_dtype)
+    folders = {}
+    good = np.zeros(len(paths), dtype=bool)
+    with instrument.span("parse_batch") as the_span:
+        for index, path in enumerate(paths):
+            path = Path(path).resolve()
+            try:
+                the_file = SD(str(path), SDC.READ)
+                metadata = the_file.attributes()["CoreMetadata.0"]
+                the_file.end()
+                _fill_row(records[index], core_fields(metadata))
+            except Exception as e:
+                print(f"skipping {path}: {e}")
+                continue
+            #
+            # the file name, not LOCALGRANULEID, so renamed files are found
+            #
+            records[index]["filename"] = path.name
+            records[index]["folder"] = folders.setdefault(
+                str(path.parent), len(folders)
+            )
+            good[index] = True
+            the_span.add("bytes_read", len(metadata))
+    return Catalog(records[good], folders)
+
+
+def concatenate(catalogs):
+    """one Catalog from several, merging their folder lists"""
+    folders = {}
+    parts = []
+    for catalog in catalogs:
+        records = catalog.records.copy()
+        mapping = np.array(
+            [folders.setdefault(folder, len(folders)) for folder in catalog.folders],
+            dtype=np.int32,
+        )
+        if len(records):
+            records["folder"] = mapping[records["folder"]]
+        parts.append(records)
+    records = np.concatenate(parts) if parts else None
+    return Catalog(records, folders)
+
+
+def build_catalog(paths, workers=None, batch_size=256):
+    """
+    parse_batch on a process pool, batch_size files per task
+
+    Returns
+    -------
+
+    catalog: Catalog
+       sorted by start time
+    """
+    paths = [str(path) for path in paths]
+    batches = [
+        paths[start : start + batch_size] for start in range(0, len(paths), batch_size)
+    ]
+    with instrument.span("build_catalog") as the_span:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            catalog = concatenate(pool.map(parse_batch, batches))
+        the_span.add("granules", len(catalog))
+    catalog.sort()
+    return catalog
+
+
+def from_dicts(records):
+    """Catalog from a list of record dicts (Catalog.record)"""
+    catalog = Catalog(np.zeros(len(records), dtype=record_dtype))
+    folders = {}
+    for row, record in zip(catalog.records, records):
+        path = Path(record["path"])
+        for key in ["orbit", "daynight", "lon_list", "lat_list", "bbox"]:
+            row[key] = record[key]
+        row["lon_0"], row["lat_0"] = record["lon_0"], record["lat_0"]
+        for key in ["start", "stop", "equator"]:
+            row[key] = np.datetime64(record[key], "ms")
+        row["filename"] = path.name
+        row["folder"] = folders.setdefault(str(path.parent), len(folders))
+    catalog.folders = list(folders)
+    return catalog
+
+
+def save_catalog(catalog, path):
+    """
+    a .npz file holding the structured array, or json lines (one record
+    dict per line) for a .jsonl path
+    """
+    if Path(path).suffix == ".jsonl":
+        with open(path, "w") as f:
+            for record in catalog:
+                f.write(json.dumps(record) + "\n")
+        return
+    np.savez(
+        path, records=catalog.records, folders=np.array(catalog.folders, dtype=str)
+    )
+
+
+def load_catalog(path):
+    if Path(path).suffix == ".jsonl":
+        with open(path) as f:
+            return from_dicts([json.loads(line) for line in f if line.strip()])
+    with np.load(path) as npz:
+        return Catalog(npz["records"], npz["folders"].tolist())
+
+
+def _unit_vectors(lons, lats):
+    lons, lats = np.radians(lons), np.radians(lats)
+    coslat = np.cos(lats)
+    return np.stack(
+        [coslat * np.cos(lons), coslat * np.sin(lons), np.sin(lats)], axis=-1
+    )
+
+
+def footprint_centres(lons, lats):
+    """
+    centre of each footprint, the normalized mean of its corner unit
+    vectors, so granules crossing the antimeridian get a centre on the
+    swath instead of near longitude 0
+
+    Parameters
+    ----------
+
+    lons, lats: arrays, shape (..., 4)
+       G-ring corners
+
+    Returns
+    -------
+
+    lon_0, lat_0: arrays, shape (...)
+    """
+    x, y, z = np.moveaxis(_unit_vectors(lons, lats).mean(axis=-2), -1, 0)
+    return np.degrees(np.arctan2(y, x)), np.degrees(np.arctan2(z, np.hypot(x, y)))
+
+
+def footprint_bbox(lons, lats):
+    """
+    [lon_min, lat_min, lon_max, lat_max] of one G-ring.  For a granule
+    crossing the antimeridian lon_min > lon_max (e.g. [170, 0, -170, 10]),
+    as in GeoJSON; a granule around a pole spans all longitudes up to it
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    corners = _unit_vectors(lons, lats)
+    normals = np.cross(corners, np.roll(corners, -1, axis=0))
+    for pole in [90.0, -90.0]:
+        sines = normals @ np.array([0.0, 0.0, np.sign(pole)])
+        same_side = np.all(sines >= 0) or np.all(sines <= 0)
+        if same_side and corners[:, 2].mean() * pole > 0:
+            if pole > 0:
+                return [-180.0, float(lats.min()), 180.0, 90.0]
+            return [-180.0, -90.0, 180.0, float(lats.max())]
+    #
+    # the smallest longitude interval holding every corner is the
+    # complement of the widest gap between them going around the globe
+    #
+    ordered = np.sort(np.mod(lons + 180.0, 360.0) - 180.0)
+    gaps = np.diff(np.append(ordered, ordered[0] + 360.0))
+    widest = int(np.argmax(gaps))
+    west = ordered[(widest + 1) % len(ordered)]
+    east = ordered[widest]
+    return [float(west), float(lats.min()), float(east), float(lats.max())]
+
+
+def covers(catalog, lon, lat, margin_km=10.0):
+    """
+    boolean array, True for the granules whose G-ring contains (lon, lat)
+
+    margin_km grows each footprint a little, since the real swath edge
+    bows outward between the G-ring corners
+    """
+    if len(catalog) == 0:
+        return np.zeros(0, dtype=bool)
+    corners = _unit_vectors(
+        catalog.records["lon_list"].astype(np.float64),
+        catalog.records["lat_list"].astype(np.float64),
+    )
+    #
+    # normals of the great circles through consecutive corners; the dot
+    # product with the point is the sine of its angular distance from
+    # each edge, positive on one side
+    #
+    point = _unit_vectors(lon, lat)
+    normals = np.cross(corners, np.roll(corners, -1, axis=1))
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    sines = normals @ point
+    margin = np.sin(margin_km / earth_radius_km)
+    inside = np.all(sines >= -margin, axis=1) | np.all(sines <= margin, axis=1)
+    #
+    # the antipode is on the same side of every edge too, so also
+    # require the point to be in the footprint's hemisphere
+    #
+    return inside & (corners.mean(axis=1) @ point > 0)
+
+
+def covering(catalog, lon, lat, margin_km=10.0):
+    """Catalog of the granules whose footprint contains (lon, lat)"""
+    return catalog[covers(catalog, lon, lat, margin_km)]
+
+
+def as_time(value):
+    """str, datetime or numpy.datetime64 as a millisecond datetime64"""
+    return np.datetime64(value, "ms")
+
+
+class TimeIndex:
+    """
+    granules sorted by start time, for logarithmic time window queries
+    over millions of catalog rows
+
+    A granule overlaps [start, stop) when it starts before stop and stops
+    after start.  The starts are sorted, so a binary search
+    (numpy.searchsorted) bounds the first condition, and since no granule
+    lasts longer than max_duration only the granules starting after
+    start - max_duration need checking for the second
+    """
+
+    __slots__ = ("catalog", "order", "starts", "stops", "max_duration")
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.order = np.argsort(catalog.records["start"], kind="stable")
+        self.starts = catalog.records["start"][self.order]
+        self.stops = catalog.records["stop"][self.order]
+        if len(catalog):
+            self.max_duration = np.max(self.stops - self.starts)
+        else:
+            self.max_duration = np.timedelta64(0, "ms")
+
+    def __len__(self):
+        return len(self.order)
+
+    def indices(self, start, stop):
+        """catalog row numbers of the granules overlapping [start, stop), by time"""
+        start, stop = as_time(start), as_time(stop)
+        first = np.searchsorted(self.starts, start - self.max_duration, side="left")
+        last = np.searchsorted(self.starts, stop, side="left")
+        candidates = np.arange(first, last)
+        return self.order[candidates[self.stops[candidates] > start]]
+
+    def window(self, start, stop):
+        """Catalog of the granules overlapping [start, stop)"""
+        return self.catalog[self.indices(start, stop)]
+
+    def at(self, time):
+        """Catalog of the granules in flight at time"""
+        time = as_time(time)
+        return self.window(time, time + np.timedelta64(1, "ms"))
+
+    def nearest(self, time):
+        """catalog row number of the granule starting closest to time"""
+        if len(self) == 0:
+            raise ValueError("empty catalog")
+        time = as_time(time)
+        position = np.searchsorted(self.starts, time)
+        neighbours = [p for p in (position - 1, position) if 0 <= p < len(self)]
+        best = min(neighbours, key=lambda p: abs(self.starts[p] - time))
+        return int(self.order[best])
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="catalog hdf files")
+    build.add_argument("filenames", type=str, nargs="+", help="level1b granules")
+    build.add_argument("--out", type=str, default="catalog.npz")
+    build.add_argument("--workers", type=int, default=None)
+    query = subparsers.add_parser("query", help="granules over a point and/or time")
+    query.add_argument("catalog", type=str, help="catalog.npz or .jsonl")
+    query.add_argument("--point", type=float, nargs=2, default=None, help="lon lat")
+    query.add_argument("--start", type=str, default=None, help="e.g. 2013-08-10T21:00")
+    query.add_argument("--stop", type=str, default=None)
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    if args.command == "build":
+        catalog = build_catalog(args.filenames, args.workers)
+        save_catalog(catalog, args.out)
+        print(f"{len(catalog)} granules written to {args.out}")
+        return
+    catalog = load_catalog(args.catalog)
+    if args.start is not None or args.stop is not None:
+        start = args.start or catalog.records["start"].min()
+        stop = args.stop or catalog.records["stop"].max()
+        catalog = TimeIndex(catalog).window(start, stop)
+    if args.point is not None:
+        catalog = covering(catalog, *args.point)
+    for record in catalog:
+        print(record["start"], record["path"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""
+  satcode.change
+  ______________
+
+  before/after change detection for pairs of Landsat scenes (or any two
+  single band GeoTIFFs, e.g. the NBR or NDVI products of
+  satcode.landsat).
+
+  The after image is co-registered onto the before image's pixel grid
+  over the area the two have in common, through a rasterio WarpedVRT, so
+  scenes with shifted extents or a different UTM zone line up pixel for
+  pixel without writing a resampled copy.  The common grid is processed
+  in windows on a thread pool, a few windows in flight at a time so
+  memory stays bounded for full scenes.  Each window produces the
+  difference (after - before) or ratio (after / before) map, a uint8
+  change mask and running statistics, which are summed at the end.
+
+  to run from the command line::
+
+    python -m satcode.change ../data/before_image ../data/after_image --product nbr --out_folder=../data/change
+
+    python -m satcode.change before_ndvi.tif after_ndvi.tif --method ratio --threshold 0.2
+
+  to run from a python script::
+
+    from satcode.change import detect_change
+    stats = detect_change('before_nbr.tif', 'after_nbr.tif', 'change', threshold=0.1)
+    print(stats['fraction_decrease'])
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+methods = ("difference", "ratio")
+#
+# values of the change mask
+#
+no_change, decrease, increase, no_data = 0, 1, 2, 255
+
+
+def common_grid(before_path, after_path):
+    """
+    the part of the before image's grid that the after image also covers
+
+    Returns
+    -------
+
+    window: rasterio Window
+       of the before image
+
+    profile: dict
+       rasterio profile (crs, transform, width, height) of that window
+    """
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import from_bounds
+
+    with rasterio.open(before_path) as before, rasterio.open(after_path) as after:
+        after_bounds = transform_bounds(after.crs, before.crs, *after.bounds)
+        left = max(before.bounds.left, after_bounds[0])
+        bottom = max(before.bounds.bottom, after_bounds[1])
+        right = min(before.bounds.right, after_bounds[2])
+        top = min(before.bounds.top, after_bounds[3])
+        if left >= right or bottom >= top:
+            raise ValueError(f"{before_path} and {after_path} do not overlap")
+        window = from_bounds(left, bottom, right, top, before.transform)
+        window = window.round_offsets().round_lengths()
+        window = window.intersection(
+            rasterio.windows.Window(0, 0, before.width, before.height)
+        )
+        profile = before.profile.copy()
+        profile.update(
+            width=int(window.width),
+            height=int(window.height),
+            transform=before.window_transform(window),
+        )
+    return window, profile
+
+
+class _Readers(threading.local):
+    """
+    rasterio datasets can't be shared between threads, so each worker
+    thread opens its own before image and warped after image
+    """
+
+    def __init__(self, before_path, after_path, profile, resampling):
+        import rasterio
+        from rasterio.enums import Resampling
+        from rasterio.vrt import WarpedVRT
+
+        self.before = rasterio.open(before_path)
+        self.after_src = rasterio.open(after_path)
+        self.after = WarpedVRT(
+            self.after_src,
+            crs=profile["crs"],
+            transform=profile["transform"],
+            width=profile["width"],
+            height=profile["height"],
+            resampling=getattr(Resampling, resampling),
+            src_nodata=self.after_src.nodata,
+            nodata=np.nan,
+            dtype="float32",
+        )
+
+
+def _as_float(array, nodata):
+    array = array.astype(np.float32, copy=False)
+    if nodata is not None and not np.isnan(nodata):
+        array[array == nodata] = np.nan
+    return array
+
+
+def _compare(readers, window, offset, method, threshold, bins):
+    """
+    change map, mask and statistics for one window of the common grid
+    """
+    from rasterio.windows import Window
+
+    before_window = Window(
+        window.col_off + offset.col_off,
+        window.row_off + offset.row_off,
+        window.width,
+        window.height,
+    )
+    before = _as_float(
+        readers.before.read(1, window=before_window), readers.before.nodata
+    )
+    after = readers.after.read(1, window=window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "difference":
+            change = np.subtract(after, before, out=after)
+            departure = change
+        else:
+            change = np.divide(after, before, out=after)
+            change[~np.isfinite(change)] = np.nan
+            departure = change - np.float32(1.0)
+        valid = np.isfinite(change)
+        mask = np.full(change.shape, no_data, dtype=np.uint8)
+        mask[valid] = no_change
+        mask[valid & (departure < -threshold)] = decrease
+        mask[valid & (departure > threshold)] = increase
+    values = change[valid].astype(np.float64)
+    stats = dict(
+        valid=int(values.size),
+        decrease=int(np.count_nonzero(mask == decrease)),
+        increase=int(np.count_nonzero(mask == increase)),
+        total=float(values.sum()),
+        total_squares=float(np.square(values).sum()),
+        histogram=np.histogram(values, bins=bins)[0],
+    )
+    return change, mask, stats
+
+
+def detect_change(
+    before_path,
+    after_path,
+    out_folder=".",
+    method="difference",
+    threshold=0.1,
+    window_size=1024,
+    workers=None,
+    resampling="bilinear",
+    bins=None,
+):
+    """
+    Parameters
+    ----------
+
+    before_path, after_path: str or Path
+       single band GeoTIFFs; the after image is warped onto the before grid
+
+    out_folder: str or Path
+       gets change.tif (float32), change_mask.tif (uint8:
+       0 no change, 1 decrease, 2 increase, 255 no data) and
+       change_stats.json
+
+    method: str
+       'difference' (after - before) or 'ratio' (after / before)
+
+    threshold: float
+       a pixel has changed where the difference (or ratio - 1) is beyond
+       +- threshold
+
+    window_size: int
+       rows and columns per window, a multiple of 16
+
+    workers: optional int
+       threads; also sets how many windows are held in memory at once
+
+    resampling: str
+       rasterio Resampling name used to warp the after image
+
+    bins: optional array
+       histogram bin edges, default 40 bins over -1..1 for differences,
+       0..3 for ratios
+
+    Returns
+    -------
+
+    stats: dict
+       valid, decrease, increase pixel counts, fraction_decrease,
+       fraction_increase, mean, std, histogram and bins
+    """
+    import rasterio
+    from satcode.landsat import _batches, windows
+
+    if method not in methods:
+        raise ValueError(f"method must be one of {methods}, not {method}")
+    if bins is None:
+        bins = (
+            np.linspace(-1.0, 1.0, 41)
+            if method == "difference"
+            else np.linspace(0.0, 3.0, 41)
+        )
+    workers = workers or os.cpu_count()
+    offset, profile = common_grid(before_path, after_path)
+    shape = (profile["height"], profile["width"])
+    out_folder = Path(out_folder)
+    out_folder.mkdir(parents=True, exist_ok=True)
+    tiled = dict(
+        driver="GTiff",
+        tiled=True,
+        blockxsize=min(window_size, 512),
+        blockysize=min(window_size, 512),
+        compress="deflate",
+        count=1,
+    )
+    change_profile = dict(profile, dtype="float32", nodata=np.nan, predictor=3, **tiled)
+    mask_profile = dict(profile, dtype="uint8", nodata=no_data, **tiled)
+    readers = _Readers(before_path, after_path, profile, resampling)
+    totals = dict(valid=0, decrease=0, increase=0, total=0.0, total_squares=0.0)
+    histogram = np.zeros(len(bins) - 1, dtype=np.int64)
+    all_windows = list(windows(shape, window_size))
+    with instrument.span("detect_change", method=method) as the_span:
+        change_dst = rasterio.open(out_folder / "change.tif", "w", **change_profile)
+        mask_dst = rasterio.open(out_folder / "change_mask.tif", "w", **mask_profile)
+        with change_dst, mask_dst:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                #
+                # a couple of windows per worker in flight at a time
+                #
+                for batch in _batches(all_windows, 2 * workers):
+                    results = pool.map(
+                        lambda window: _compare(
+                            readers, window, offset, method, threshold, bins
+                        ),
+                        batch,
+                    )
+                    for window, (change, mask, stats) in zip(batch, results):
+                        change_dst.write(change, 1, window=window)
+                        mask_dst.write(mask, 1, window=window)
+                        histogram += stats.pop("histogram")
+                        for key, value in stats.items():
+                            totals[key] += value
+        the_span.add("windows", len(all_windows))
+        the_span.add("pixels_compared", totals["valid"])
+    valid = max(totals["valid"], 1)
+    mean = totals["total"] / valid
+    out = dict(
+        method=method,
+        threshold=threshold,
+        valid=totals["valid"],
+        decrease=totals["decrease"],
+        increase=totals["increase"],
+        fraction_decrease=totals["decrease"] / valid,
+        fraction_increase=totals["increase"] / valid,
+        mean=mean,
+        std=float(np.sqrt(max(totals["total_squares"] / valid - mean**2, 0.0))),
+        histogram=histogram.tolist(),
+        bins=np.asarray(bins).tolist(),
+    )
+    with open(out_folder / "change_stats.json", "w") as f:
+        json.dump(out, f, indent=2)
+    return out
+
+
+def scene_change(before_scene, after_scene, out_folder=".", product="nbr", **kwargs):
+    """
+    make the same satcode.landsat product for two scene folders, then
+    detect_change between them (e.g. dNBR for burn scars)
+    """
+    from satcode.landsat import LandsatScene, make_product
+
+    out_folder = Path(out_folder)
+    paths = []
+    for label, folder in [("before", before_scene), ("after", after_scene)]:
+        scene = LandsatScene(folder)
+        paths.append(
+            make_product(scene, product, out_folder / f"{label}_{product}.tif")
+        )
+    return detect_change(paths[0], paths[1], out_folder, **kwargs)
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("before", type=str, help="scene folder or GeoTIFF")
+    parser.add_argument("after", type=str, help="scene folder or GeoTIFF")
+    parser.add_argument("--product", type=str, default="nbr", help="for scene folders")
+    parser.add_argument("--method", choices=methods, default="difference")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--out_folder", type=str, default=".")
+    parser.add_argument("--window_size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    kwargs = dict(
+        method=args.method,
+        threshold=args.threshold,
+        window_size=args.window_size,
+        workers=args.workers,
+    )
+    if Path(args.before).is_dir():
+        stats = scene_change(
+            args.before, args.after, args.out_folder, product=args.product, **kwargs
+        )
+    else:
+        stats = detect_change(args.before, args.after, args.out_folder, **kwargs)
+    for key in ["valid", "fraction_decrease", "fraction_increase", "mean", "std"]:
+        print(f"{key}: {stats[key]}")
+
+
+if __name__ == "__main__":
+    main()
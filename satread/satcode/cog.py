@@ -0,0 +1,202 @@
+"""
+  satcode.cog
+  ___________
+
+  cloud optimized GeoTIFF output for resampled grids.
+
+  A COG is an ordinary tiled, compressed GeoTIFF with its reduced
+  resolution overviews stored inside the file and the tile index at the
+  front, so a viewer can fetch a single zoom level and only the tiles it
+  shows with http range requests instead of the whole image.  The
+  georeferencing (crs and affine transform) comes from the pyresample
+  AreaDefinition.
+
+  write_cog builds the tiled image and its overviews in memory with
+  rasterio, then copies them to disk in COG order.  read_cog reads back
+  the full grid, one overview level or a window, with its
+  AreaDefinition.
+
+  to run from a python script::
+
+    from satcode.cog import write_cog, read_cog
+    write_cog(image, area_def, 'b31.tif')
+    thumbnail, thumb_area = read_cog('b31.tif', level=2)
+"""
+import math
+
+import numpy as np
+
+from satcode import instrument
+
+
+def _rasterio():
+    try:
+        import rasterio
+    except ImportError:
+        raise ImportError("writing COGs needs rasterio (conda install rasterio)")
+    return rasterio
+
+
+def overview_factors(shape, blocksize=512):
+    """
+    2, 4, 8 ... until the smallest overview fits in one tile
+    """
+    largest = max(shape)
+    levels = max(0, math.ceil(math.log2(largest / blocksize))) if largest else 0
+    return [2**level for level in range(1, levels + 1)]
+
+
+def write_cog(
+    image,
+    area_def,
+    filename,
+    nodata=None,
+    blocksize=512,
+    compress="deflate",
+    resampling="average",
+    tags=None,
+):
+    """
+    Parameters
+    ----------
+
+    image: array
+       (rows, cols) or (nbands, rows, cols) on area_def
+
+    area_def: pyresample AreaDefinition
+
+    filename: str or Path
+
+    nodata: optional number
+       defaults to NaN for float data; integer data needs an explicit
+       fill value (e.g. 65535) or has no nodata
+
+    blocksize: int
+       tile size in pixels, a multiple of 16
+
+    compress: str
+       'deflate', 'zstd', 'lzw' ...; the floating point or horizontal
+       predictor is chosen from the dtype
+
+    resampling: str
+       rasterio Resampling name for the overviews ('average', 'nearest',
+       'mode' for class maps)
+
+    tags: optional dict
+       stored as GeoTIFF metadata (e.g. the parseMeta filename and times)
+
+    Returns
+    -------
+
+    filename: str or Path
+    """
+    rasterio = _rasterio()
+    from rasterio.enums import Resampling
+    from rasterio.io import MemoryFile
+    from rasterio.shutil import copy as copy_dataset
+    from rasterio.transform import from_bounds
+
+    image = np.asarray(image)
+    bands = image if image.ndim == 3 else image[np.newaxis]
+    nbands, rows, cols = bands.shape
+    is_float = bands.dtype.kind == "f"
+    if nodata is None and is_float:
+        nodata = np.nan
+    x_min, y_min, x_max, y_max = area_def.area_extent
+    profile = dict(
+        driver="GTiff",
+        width=cols,
+        height=rows,
+        count=nbands,
+        dtype=bands.dtype.name,
+        crs=rasterio.crs.CRS.from_wkt(area_def.crs.to_wkt()),
+        transform=from_bounds(x_min, y_min, x_max, y_max, cols, rows),
+        nodata=nodata,
+        tiled=True,
+        blockxsize=blocksize,
+        blockysize=blocksize,
+    )
+    factors = overview_factors((rows, cols), blocksize)
+    with instrument.span("write_cog") as the_span:
+        with MemoryFile() as memfile:
+            with memfile.open(**profile) as mem:
+                mem.write(bands)
+                if tags:
+                    mem.update_tags(**{key: str(value) for key, value in tags.items()})
+                if factors:
+                    mem.build_overviews(factors, getattr(Resampling, resampling))
+                copy_dataset(
+                    mem,
+                    str(filename),
+                    driver="GTiff",
+                    copy_src_overviews=True,
+                    tiled=True,
+                    blockxsize=blocksize,
+                    blockysize=blocksize,
+                    compress=compress,
+                    predictor=3 if is_float else 2,
+                    interleave="band" if nbands > 1 else "pixel",
+                )
+        the_span.add("bytes_in", bands.nbytes)
+        the_span.add("overviews", len(factors))
+    return filename
+
+
+def read_cog(filename, level=None, window=None):
+    """
+    Parameters
+    ----------
+
+    filename: str or Path
+       any GeoTIFF, typically written by write_cog
+
+    level: optional int
+       overview level, 0 for the first overview (factor 2); None reads
+       full resolution
+
+    window: optional tuple
+       (row_start, row_stop, col_start, col_stop) in pixels of the level
+       being read
+
+    Returns
+    -------
+
+    image: array
+       (rows, cols) for one band, else (nbands, rows, cols); float data
+       has NaN where nodata
+
+    area_def: pyresample AreaDefinition
+       for exactly the pixels returned
+    """
+    rasterio = _rasterio()
+    from rasterio.windows import Window
+    from pyresample.geometry import AreaDefinition
+
+    open_args = {} if level is None else dict(overview_level=level)
+    with instrument.span("read_cog"):
+        with rasterio.open(str(filename), **open_args) as src:
+            if window is None:
+                rasterio_window = None
+                row0, col0, rows, cols = 0, 0, src.height, src.width
+            else:
+                row0, row1, col0, col1 = window
+                rows, cols = row1 - row0, col1 - col0
+                rasterio_window = Window(col0, row0, cols, rows)
+            image = src.read(window=rasterio_window)
+            transform = src.transform
+            crs_wkt = src.crs.to_wkt()
+            nodata = src.nodata
+    if image.dtype.kind == "f" and nodata is not None and not np.isnan(nodata):
+        image[image == nodata] = np.nan
+    x_min = transform.c + col0 * transform.a
+    y_max = transform.f + row0 * transform.e
+    area_extent = (
+        x_min,
+        y_max + rows * transform.e,
+        x_min + cols * transform.a,
+        y_max,
+    )
+    area_def = AreaDefinition(
+        "cog", str(filename), "cog", crs_wkt, cols, rows, area_extent
+    )
+    return (image[0] if len(image) == 1 else image), area_def
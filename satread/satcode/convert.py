@@ -0,0 +1,285 @@
+"""
+  satcode.convert
+  _______________
+
+  transcodes MODIS Level1b (MYD021KM etc.) and geolocation (MYD03) hdf4
+  files into chunked, compressed zarr stores or netcdf4 files, or into a
+  folder of uncompressed .npy arrays that can be memory mapped.
+
+  pyhdf reads are single threaded and not chunk aware, so convert once
+  and let dask workers read the converted copies in parallel.  Every
+  science dataset keeps its hdf attributes (radiance_scales,
+  reflectance_offsets, valid_range, band_names ...) and its _FillValue.
+  The raw CoreMetadata.0 text and the parseMeta dictionary (as json) are
+  stored as global attributes.
+
+  Chunks are aligned with whole 10-row MODIS scans.
+
+  to run from the command line::
+
+    python -m satcode.convert ../data/MYD0*.hdf --format zarr --dest_folder=../data/zarr --workers 4
+
+  to run from a python script::
+
+    from satcode.convert import convert_many, open_converted
+    outputs = convert_many(hdf_files, dest_folder='zarr', fmt='zarr')
+    ds = open_converted(outputs[0])
+    meta = ds.attrs['parseMeta']
+"""
+import argparse
+import concurrent.futures
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+from pyhdf.SD import SD, SDC
+
+from satcode import instrument
+from satcode.modismeta_read import parseMeta
+
+rows_per_scan = 10
+formats = {"zarr": ".zarr", "netcdf": ".nc", "npy": ".npy.d"}
+
+
+def _dim_name(name):
+    """
+    hdf-eos dimension names look like '10*nscans:MODIS_SWATH_Type_L1B',
+    keep the part before the colon and make it a legal netcdf name
+    """
+    name = name.split(":")[0]
+    return re.sub(r"[^0-9A-Za-z_]", "_", name)
+
+
+def _chunks(shape, scans_per_chunk):
+    """
+    one band at a time, scans_per_chunk whole scans, full scan width
+    """
+    rows = rows_per_scan * scans_per_chunk
+    if len(shape) == 3:
+        return (1, min(rows, shape[1]), shape[2])
+    if len(shape) == 2:
+        return (min(rows, shape[0]), shape[1])
+    return shape
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _global_attrs(filename, the_file):
+    attrs = {}
+    for key, value in the_file.attributes().items():
+        if isinstance(value, str):
+            attrs[key] = value.rstrip(" \t\r\n\0")
+        else:
+            attrs[key] = value
+    try:
+        meta = parseMeta(filename)
+    except KeyError:
+        meta = None
+    attrs["parseMeta"] = json.dumps(meta, default=_json_default)
+    attrs["source_file"] = Path(filename).name
+    return attrs
+
+
+def _variables(the_file, scans_per_chunk):
+    """
+    yield (name, dims, array, attrs, fill_value, chunks) one science
+    dataset at a time so only one SDS is in memory
+    """
+    for name in the_file.datasets().keys():
+        sds = the_file.select(name)
+        with instrument.span("hdf_read_sds", sds=name) as the_span:
+            data = sds.get()
+            the_span.add("bytes_read", data.nbytes)
+        attrs = dict(sds.attributes())
+        fill_value = attrs.pop("_FillValue", None)
+        dims = [_dim_name(dim) for dim in sds.dimensions().keys()]
+        sds.endaccess()
+        yield name, dims, data, attrs, fill_value, _chunks(data.shape, scans_per_chunk)
+
+
+def convert_granule(
+    filename, dest_folder=None, fmt="zarr", scans_per_chunk=50, complevel=4
+):
+    """
+    convert one hdf4 file
+
+    Parameters
+    ----------
+
+    filename: str or Path
+       MODIS hdf4 file
+
+    dest_folder: optional str or Path
+       defaults to the folder holding filename
+
+    fmt: str
+       'zarr', 'netcdf' or 'npy'
+
+    scans_per_chunk: int
+       chunk length along track, in 10-row scans
+
+    complevel: int
+       zlib compression level for netcdf (zarr uses its default blosc codec)
+
+    Returns
+    -------
+
+    out_path: Path
+       the new store/file/folder, named after filename
+    """
+    if fmt not in formats:
+        raise ValueError(f"fmt must be one of {list(formats)}, not {fmt}")
+    filename = Path(filename)
+    dest_path = filename.parent if dest_folder is None else Path(dest_folder)
+    dest_path.mkdir(parents=True, exist_ok=True)
+    out_path = dest_path / (filename.stem + formats[fmt])
+    with instrument.span("convert_granule", filename=filename.name, fmt=fmt):
+        the_file = SD(str(filename), SDC.READ)
+        global_attrs = _global_attrs(filename, the_file)
+        variables = _variables(the_file, scans_per_chunk)
+        if fmt == "npy":
+            _write_npy(out_path, variables, global_attrs)
+        else:
+            _write_xarray(out_path, variables, global_attrs, fmt, complevel)
+        the_file.end()
+    print(f"converted {filename.name} -> {out_path}")
+    return out_path
+
+
+def _write_xarray(out_path, variables, global_attrs, fmt, complevel):
+    import xarray
+
+    mode = "w"
+    for name, dims, data, attrs, fill_value, chunks in variables:
+        ds = xarray.Dataset({name: (dims, data, attrs)}, attrs=global_attrs)
+        encoding = {"_FillValue": fill_value}
+        if fmt == "zarr":
+            encoding["chunks"] = chunks
+            ds.to_zarr(out_path, mode=mode, encoding={name: encoding})
+        else:
+            encoding.update(zlib=True, complevel=complevel, chunksizes=chunks)
+            ds.to_netcdf(
+                out_path, mode=mode, format="NETCDF4", encoding={name: encoding}
+            )
+        mode = "a"
+
+
+def _write_npy(out_path, variables, global_attrs):
+    out_path.mkdir(parents=True, exist_ok=True)
+    layout = dict(attrs=global_attrs, variables={})
+    for name, dims, data, attrs, fill_value, chunks in variables:
+        np.save(out_path / f"{name}.npy", data)
+        layout["variables"][name] = dict(
+            dims=dims, attrs=attrs, fill_value=fill_value, chunks=chunks
+        )
+    with open(out_path / "layout.json", "w") as f:
+        json.dump(layout, f, default=_json_default, indent=1)
+
+
+def convert_many(filenames, dest_folder=None, fmt="zarr", workers=None, **kwargs):
+    """
+    convert a list of hdf4 files in a process pool, one file per task
+
+    Returns
+    -------
+
+    out_paths: list of Path
+       in the same order as filenames
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(convert_granule, filename, dest_folder, fmt, **kwargs)
+            for filename in filenames
+        ]
+        return [future.result() for future in futures]
+
+
+def open_converted(path, chunks=None, mmap=True):
+    """
+    open a converted granule as an xarray Dataset backed by dask arrays
+
+    Raw integer counts are returned unscaled (mask_and_scale=False), with
+    the calibration attributes on each variable.  The parseMeta json
+    attribute is decoded back into a dictionary.
+
+    Parameters
+    ----------
+
+    path: str or Path
+       output of convert_granule
+
+    chunks: optional dict or 'auto'
+       dask chunks for the netcdf case, defaults to the chunks on disk;
+       zarr and npy stores always use the chunks they were written with
+
+    mmap: bool
+       for npy folders, memory map the arrays instead of reading them
+    """
+    import xarray
+    import dask.array
+
+    path = Path(path)
+    if path.suffix == ".zarr":
+        ds = xarray.open_zarr(path, mask_and_scale=False)
+    elif path.suffix == ".nc":
+        if chunks is None:
+            chunks = {}
+        ds = xarray.open_dataset(path, chunks=chunks, mask_and_scale=False)
+    else:
+        with open(path / "layout.json", "r") as f:
+            layout = json.load(f)
+        data_vars = {}
+        for name, item in layout["variables"].items():
+            data = np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+            array = dask.array.from_array(data, chunks=tuple(item["chunks"]))
+            attrs = dict(item["attrs"])
+            attrs["_FillValue"] = item["fill_value"]
+            data_vars[name] = (item["dims"], array, attrs)
+        ds = xarray.Dataset(data_vars, attrs=layout["attrs"])
+    ds.attrs["parseMeta"] = json.loads(ds.attrs["parseMeta"])
+    return ds
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("filenames", type=str, nargs="+", help="hdf4 files to convert")
+    parser.add_argument("--format", choices=list(formats), default="zarr")
+    parser.add_argument(
+        "--dest_folder", type=str, default=None, help="defaults to each file's folder"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes, defaults to all cores"
+    )
+    parser.add_argument(
+        "--scans_per_chunk", type=int, default=50, help="chunk length in 10-row scans"
+    )
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    convert_many(
+        args.filenames,
+        dest_folder=args.dest_folder,
+        fmt=args.format,
+        workers=args.workers,
+        scans_per_chunk=args.scans_per_chunk,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,8 @@
 
     python -m a500.utils.data_read *par_9km.nc --root https://oceandata.sci.gsfc.nasa.gov/cgi/getfile --dest_folder=.
 
+    python -m satcode.data_read --manifest granules.csv --dest_folder=../data --workers 8 --order largest
+
   to run from a python script::
 
     from a500.utils.data_read import download
@@ -25,21 +27,199 @@
     filename="A20162092016216.L3m_8D_PAR_par_9km.nc"
     download(filename,root=root)
 
+  or from asyncio code, processing each granule as it arrives::
+
+    from satcode.data_read import adownload_iter
+    async for filename, path in adownload_iter(filenames, concurrency=8):
+        process(path)
+
 """
 import argparse
+import hashlib
+import os
 import requests
 from pathlib import Path
 import shutil
 
+from satcode import instrument
+
 class NoDataException(Exception):
     pass
 
 
+class IntegrityError(Exception):
+    """
+    a downloaded file is truncated, has the wrong checksum or isn't the
+    file format its name says
+    """
+    pass
+
+
+#
+# leading bytes of the formats we download, by file extension
+#
+magic_numbers = {
+    ".hdf": [b"\x0e\x03\x13\x01", b"\x89HDF\r\n\x1a\n"],
+    ".nc": [b"CDF\x01", b"CDF\x02", b"CDF\x05", b"\x89HDF\r\n\x1a\n"],
+    ".h5": [b"\x89HDF\r\n\x1a\n"],
+}
+
+
+def read_checksums(path):
+    """
+    read a checksum list in md5sum/sha256sum format ("<hexdigest>  <filename>"
+    per line); the algorithm is guessed from the digest length
+
+    Returns
+    -------
+
+    checksums: dict
+       filename -> 'md5:<hexdigest>' or 'sha256:<hexdigest>'
+    """
+    algorithms = {32: "md5", 40: "sha1", 64: "sha256"}
+    checksums = {}
+    for line in Path(path).read_text().splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        digest, name = parts
+        name = Path(name.lstrip("*")).name
+        checksums[name] = f"{algorithms.get(len(digest), 'sha256')}:{digest.lower()}"
+    return checksums
+
+
+def find_checksum(name, checksums=None, dest_path=None):
+    """
+    expected checksum for name: from a checksums dict or checksum list
+    file (see read_checksums), else from a sidecar file name.sha256 or
+    name.md5 in dest_path.  None if there is none
+    """
+    if checksums is not None:
+        if not isinstance(checksums, dict):
+            checksums = read_checksums(checksums)
+        if name in checksums:
+            return checksums[name]
+    if dest_path is not None:
+        for algorithm in ["sha256", "md5"]:
+            sidecar = Path(dest_path) / f"{name}.{algorithm}"
+            if sidecar.exists():
+                return f"{algorithm}:{sidecar.read_text().split()[0].lower()}"
+    return None
+
+
+class _StreamCheck:
+    """
+    checksum, size and leading bytes of a file computed while it streams
+    to disk, so it never has to be read back
+    """
+
+    def __init__(self, name, expected_checksum=None, expected_size=None):
+        self.name = name
+        self.expected_size = expected_size
+        self.expected_digest = None
+        algorithm = "sha256"
+        if expected_checksum:
+            algorithm, self.expected_digest = expected_checksum.split(":", 1)
+        self.hasher = hashlib.new(algorithm)
+        self.head = b""
+        self.nbytes = 0
+
+    def update(self, block):
+        self.hasher.update(block)
+        if len(self.head) < 8:
+            self.head += block[: 8 - len(self.head)]
+        self.nbytes += len(block)
+
+    @property
+    def checksum(self):
+        return f"{self.hasher.name}:{self.hasher.hexdigest()}"
+
+    def verify(self, content_length=None):
+        """raise IntegrityError unless the streamed file looks complete"""
+        for expected, what in [
+            (content_length, "Content-Length"),
+            (self.expected_size, "expected size"),
+        ]:
+            if expected is not None and self.nbytes != int(expected):
+                raise IntegrityError(
+                    f"{self.name}: got {self.nbytes} bytes, {what} is {expected}"
+                )
+        magic = magic_numbers.get(Path(self.name).suffix.lower())
+        if magic and not any(self.head.startswith(item) for item in magic):
+            suffix = Path(self.name).suffix
+            raise IntegrityError(
+                f"{self.name}: starts with {self.head!r}, not a {suffix} file"
+            )
+        if self.expected_digest and self.hasher.hexdigest() != self.expected_digest:
+            raise IntegrityError(
+                f"{self.name}: {self.hasher.name} {self.hasher.hexdigest()} "
+                f"!= expected {self.expected_digest}"
+            )
+
+
+def mirror_roots():
+    """
+    local mirror urls from the SATCODE_MIRRORS environment variable
+    (comma separated), tried before the root given to download, e.g.
+    SATCODE_MIRRORS=http://mirror.local:8000 for a satcode.mirror server
+    on the cluster's network
+    """
+    value = os.environ.get("SATCODE_MIRRORS", "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+#
+# seconds to wait for a connection, and for each block of the response,
+# before giving up on a root and trying the next one
+#
+http_timeout = (10.0, 60.0)
+
+
+def _resolve_roots(root):
+    """
+    the roots to try in order: the SATCODE_MIRRORS then root for a
+    single root, a list as given
+    """
+    if isinstance(root, (str, Path)):
+        return mirror_roots() + [str(root)]
+    return list(root)
+
+
+def _download_any(filename, roots, dest_folder, checksums, expected_size, timeout):
+    """
+    try each root in turn until one of them has a good copy of the file.
+    A copy that fails verification (e.g. a corrupt mirror) moves on to
+    the next root; if no root has a good copy the last IntegrityError is
+    raised
+    """
+    dest_path = Path() if dest_folder is None else Path(dest_folder).resolve()
+    filepath = dest_path / Path(filename).name
+    integrity_error = None
+    for root in roots:
+        try:
+            download(filename, (root,), dest_folder, checksums, expected_size, timeout)
+        except (requests.ConnectionError, requests.Timeout, RuntimeError) as e:
+            print(f"{root} failed: {e}")
+            continue
+        except IntegrityError as e:
+            print(f"{root} failed: {e}")
+            integrity_error = e
+            continue
+        if filepath.exists():
+            return None
+    if integrity_error is not None:
+        raise integrity_error
+    print(f"{filename} not found at any of {roots}")
+    return None
+
 
 def download(
     filename,
     root="https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads",
     dest_folder=None,
+    checksums=None,
+    expected_size=None,
+    timeout=http_timeout,
 ):
     """
     copy file filename from http://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads to 
@@ -51,18 +231,50 @@ def download(
     filename: string
       name of file to fetch from 
 
-    root: optional string 
-          to specifiy a different download url
+    root: optional string or list of strings
+          to specifiy a different download url.  A list is tried in
+          order until one root has the file, falling through on
+          connection errors, timeouts, missing files and copies that
+          fail verification.  Mirrors listed in the
+          SATCODE_MIRRORS environment variable are tried before a
+          single root; a list is used exactly as given, so callers
+          that pick their own roots (satcode.mirror filling itself
+          from upstream) aren't sent back to a mirror.  The command
+          line adds the mirrors in front of --root either way
 
     dest_folder: optional string or Path object
           to specifify a folder besides the current folder to put the files
           will be created it it doesn't exist
 
+    checksums: optional dict or path
+          filename -> 'sha256:<hex>' (or md5), or a checksum list file in
+          sha256sum format.  A sidecar file filename.sha256 or
+          filename.md5 in dest_folder is used if present
+
+    expected_size: optional int
+          bytes
+
+    timeout: float or (float, float)
+          seconds to connect and to wait for each block (requests
+          timeout); a root that stalls raises requests.Timeout, or is
+          skipped when there are more roots to try
+
+    The checksum, the size (against Content-Length and expected_size)
+    and the file's magic number (.hdf, .nc, .h5) are checked while the
+    file streams in, before the temporary file is renamed; a failure
+    removes the temporary file and raises IntegrityError
+
     Returns
     -------
 
     Side effect: Creates a copy of that file in the local directory
     """
+    roots = _resolve_roots(root)
+    if len(roots) > 1:
+        return _download_any(
+            filename, roots, dest_folder, checksums, expected_size, timeout
+        )
+    root = roots[0]
     filename = Path(filename)
     name_only = filename.name
     url = f"{root}/{name_only}"
@@ -92,16 +304,21 @@ def download(
 
     tempfile = str(filepath) + "_tmp"
     temppath = Path(tempfile)
+    check = _StreamCheck(
+        name_only, find_checksum(name_only, checksums, dest_path), expected_size
+    )
+    download_span = instrument.span("download", filename=name_only)
     try:
-        with open(temppath, "wb") as localfile:
+        with download_span, open(temppath, "wb") as localfile:
             print(f"writing temporary file {temppath}")
-            response = requests.get(url, stream=True)
+            with instrument.span("http_connect"):
+                response = requests.get(url, stream=True, timeout=timeout)
             #
             # treat a 'Not Found' response differently, since you want to catch
             # this and possibly continue with a new file
             #
             if not response.ok:
-                if response.reason == "Not Found":
+                if response.status_code == 404:
                     the_msg = 'requests.get() returned "Not found" with filename {}'.format(
                         filename
                     )
@@ -117,11 +334,17 @@ def download(
                     #
                 # clean up the temporary file
                 #
-            for block in response.iter_content(1024):
+            for block in response.iter_content(1 << 16):
                 if not block:
                     break
                 localfile.write(block)
-        the_size = temppath.stat().st_size
+                check.update(block)
+            download_span.add("bytes_read", check.nbytes)
+        content_length = response.headers.get("Content-Length")
+        if response.headers.get("Content-Encoding"):
+            content_length = None
+        check.verify(content_length)
+        the_size = check.nbytes
         print("downloaded {}\nsize = {}".format(filename, the_size))
         shutil.move(str(temppath), str(filepath))
         if the_size < 10.0e3:
@@ -131,10 +354,483 @@ def download(
     except NoDataException as e:
         print(e)
         print("clean up: removing {}".format(temppath))
-        temppath.unlink()
+        temppath.unlink(missing_ok=True)
+    except BaseException:
+        #
+        # a connection error or ctrl-c mid stream must not leave a partial
+        # file behind either
+        #
+        print("clean up: removing {}".format(temppath))
+        temppath.unlink(missing_ok=True)
+        raise
     return None
 
 
+def _write_block(localfile, check, block):
+    localfile.write(block)
+    check.update(block)
+
+
+async def _file_sink(path, queue, check):
+    """
+    write the blocks arriving on queue to path from a worker thread, so
+    the event loop never blocks on disk or hashing.  A None block ends
+    the file
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    localfile = await loop.run_in_executor(None, open, path, "wb")
+    try:
+        while True:
+            block = await queue.get()
+            if block is None:
+                break
+            await loop.run_in_executor(None, _write_block, localfile, check, block)
+    finally:
+        await loop.run_in_executor(None, localfile.close)
+
+
+async def adownload(
+    filename,
+    root="https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads",
+    dest_folder=None,
+    session=None,
+    timeout=600,
+    block_size=1 << 20,
+    max_blocks=8,
+    checksums=None,
+    expected_size=None,
+):
+    """
+    asyncio version of download, for callers that want to keep working
+    while files arrive.  Needs aiohttp.
+
+    The response is streamed into a queue of at most max_blocks blocks
+    that a thread writes to disk; when the disk falls behind, reading
+    from the socket waits (backpressure), so memory per download stays
+    below max_blocks * block_size.  Cancelling the task or hitting the
+    timeout removes the temporary file.
+
+    Parameters
+    ----------
+
+    filename, root, dest_folder:
+       as for download: a list of roots (or SATCODE_MIRRORS in front of
+       a single root) is tried in order, moving on after connection
+       errors, timeouts, missing files and copies that fail verification
+
+    session: optional aiohttp.ClientSession
+       shared between downloads; one is made for this file if missing
+
+    timeout: float
+       seconds for the whole file, per root
+
+    checksums, expected_size:
+       verified as in download, raising IntegrityError
+
+    Returns
+    -------
+
+    filepath: Path or None
+       None if the server has no such file
+    """
+    import asyncio
+
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("adownload needs aiohttp (conda install aiohttp)")
+    roots = _resolve_roots(root)
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+
+    def attempt(a_root):
+        return _adownload_from(
+            filename,
+            a_root,
+            dest_folder,
+            session,
+            timeout,
+            block_size,
+            max_blocks,
+            checksums,
+            expected_size,
+        )
+
+    try:
+        if len(roots) == 1:
+            return await attempt(roots[0])
+        integrity_error = None
+        for a_root in roots:
+            try:
+                filepath = await attempt(a_root)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                print(f"{a_root} failed: {e!r}")
+                continue
+            except IntegrityError as e:
+                print(f"{a_root} failed: {e}")
+                integrity_error = e
+                continue
+            if filepath is not None:
+                return filepath
+        if integrity_error is not None:
+            raise integrity_error
+        print(f"{filename} not found at any of {roots}")
+        return None
+    finally:
+        if own_session:
+            await session.close()
+
+
+async def _adownload_from(
+    filename,
+    root,
+    dest_folder,
+    session,
+    timeout,
+    block_size,
+    max_blocks,
+    checksums,
+    expected_size,
+):
+    """one attempt of adownload, from a single root"""
+    import asyncio
+    import aiohttp
+
+    filename = Path(filename)
+    name_only = filename.name
+    url = f"{root}/{name_only}".replace("\\", "/")
+    dest_path = Path() if dest_folder is None else Path(dest_folder).resolve()
+    dest_path.mkdir(parents=True, exist_ok=True)
+    filepath = dest_path / name_only
+    if filepath.exists():
+        print(f"{filepath} already exists, will not overwrite")
+        return filepath
+    temppath = Path(str(filepath) + "_tmp")
+    queue = asyncio.Queue(maxsize=max_blocks)
+    check = _StreamCheck(
+        name_only, find_checksum(name_only, checksums, dest_path), expected_size
+    )
+    sink = asyncio.ensure_future(_file_sink(temppath, queue, check))
+
+    async def feed(block):
+        """queue.put, but give up if the sink has died (e.g. disk full)"""
+        put = asyncio.ensure_future(queue.put(block))
+        await asyncio.wait({put, sink}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            sink.result()
+            raise RuntimeError(f"writing {temppath} stopped early")
+
+    download_span = instrument.span("adownload", filename=name_only)
+    try:
+        with download_span:
+            request = session.get(url, timeout=aiohttp.ClientTimeout(total=timeout))
+            async with request as response:
+                if response.status == 404:
+                    raise NoDataException(
+                        f'get returned "Not found" with filename {filename}'
+                    )
+                if response.status >= 400:
+                    raise RuntimeError(
+                        f"get returned {response.reason} with filename {filename}"
+                    )
+                content_length = response.content_length
+                if response.headers.get("Content-Encoding"):
+                    content_length = None
+                async for block in response.content.iter_chunked(block_size):
+                    await feed(block)
+            await feed(None)
+            await sink
+            download_span.add("bytes_read", check.nbytes)
+        check.verify(content_length)
+        shutil.move(str(temppath), str(filepath))
+        if check.nbytes < 10.0e3:
+            print(f"Warning -- {filepath} is tiny (smaller than 10 Kbyte)")
+        return filepath
+    except NoDataException as e:
+        print(e)
+        return None
+    finally:
+        if not sink.done():
+            sink.cancel()
+            try:
+                await sink
+            except (asyncio.CancelledError, Exception):
+                pass
+        if temppath.exists():
+            temppath.unlink()
+
+
+async def adownload_iter(
+    filenames,
+    root="https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads",
+    dest_folder=None,
+    concurrency=4,
+    **kwargs,
+):
+    """
+    download filenames at most concurrency at a time, yielding
+    (filename, filepath or exception) as each one finishes, so the
+    caller can start processing the first granules straight away.
+    kwargs are passed to adownload
+    """
+    import asyncio
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+
+        async def fetch_one(name):
+            async with semaphore:
+                try:
+                    path = await adownload(
+                        name, root, dest_folder, session=session, **kwargs
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    path = error
+                return name, path
+
+        tasks = [asyncio.ensure_future(fetch_one(name)) for name in filenames]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def adownload_many(filenames, **kwargs):
+    """
+    download all filenames concurrently (see adownload_iter)
+
+    Returns
+    -------
+
+    results: list
+       filepath, None or the exception raised, in the order of filenames
+    """
+    results = {}
+    async for name, path in adownload_iter(filenames, **kwargs):
+        results[name] = path
+    return [results[name] for name in filenames]
+
+
+default_root = "https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads"
+manifest_fields = ["filename", "root", "priority", "size", "checksum"]
+
+
+def read_manifest(path, root=default_root):
+    """
+    read a download manifest: a csv file with a header line or a json
+    list of objects, with the columns/keys of manifest_fields.  Only
+    filename is required
+
+    Returns
+    -------
+
+    entries: list of dict
+       root defaults to root, priority to 0, size and checksum to None
+    """
+    import csv
+    import json
+
+    path = Path(path)
+    if path.suffix == ".json":
+        rows = json.loads(path.read_text())
+    else:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    entries = []
+    for row in rows:
+        size = row.get("size")
+        entries.append(
+            dict(
+                filename=row["filename"],
+                root=row.get("root") or root,
+                priority=float(row.get("priority") or 0),
+                size=int(size) if size not in (None, "") else None,
+                checksum=row.get("checksum") or None,
+            )
+        )
+    return entries
+
+
+def plan_fetch(entries, dest_folder=None, order="priority"):
+    """
+    drop duplicate filenames (keeping the highest priority) and files
+    already in dest_folder, then sort
+
+    Parameters
+    ----------
+
+    order: str
+       'priority' (highest first, then largest) or 'largest' (largest
+       first, unknown sizes last), which keeps the pipe full at the end
+       of a batch instead of finishing on one big file
+
+    Returns
+    -------
+
+    todo: list of dict
+    present: list of str
+       filenames already downloaded
+    """
+    dest_path = Path() if dest_folder is None else Path(dest_folder)
+    unique = {}
+    for entry in entries:
+        name = Path(entry["filename"]).name
+        if name not in unique or entry["priority"] > unique[name]["priority"]:
+            unique[name] = dict(entry, filename=name)
+    todo, present = [], []
+    for name, entry in unique.items():
+        local = dest_path / name
+        if local.exists() and entry["size"] in (None, local.stat().st_size):
+            present.append(name)
+        else:
+            todo.append(entry)
+
+    def size(entry):
+        return -1 if entry["size"] is None else entry["size"]
+
+    if order == "largest":
+        todo.sort(key=lambda entry: -size(entry))
+    else:
+        todo.sort(key=lambda entry: (-entry["priority"], -size(entry)))
+    return todo, present
+
+
+def _unused_path(path):
+    """path, or path.1, path.2 ... if it is taken"""
+    candidate, number = Path(path), 0
+    while candidate.exists():
+        number += 1
+        candidate = Path(f"{path}.{number}")
+    return candidate
+
+
+def _fetch_locked(entry, dest_path):
+    """
+    download one manifest entry while holding an exclusive lock on
+    dest_path/filename.lock, so several processes working through
+    overlapping manifests fetch each file once: whoever gets the lock
+    second finds the file there when the lock is released.  A local
+    file whose size doesn't match the manifest (e.g. truncated by an
+    older version) is fetched again into a temporary folder; only once
+    the new copy has passed verification is it renamed over the old
+    one, which is kept as filename.bad (filename.bad.1 ... if that is
+    taken).  If the download fails the old file stays where it was.
+    The empty .lock files are left in place, removing them would race
+    with the next process opening them
+    """
+    import fcntl
+    import tempfile
+
+    name = entry["filename"]
+    filepath = dest_path / name
+    with open(dest_path / f"{name}.lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            instrument.count("downloads_waited")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            given = {name: entry["checksum"]} if entry["checksum"] else None
+            checksum = find_checksum(name, given, dest_path)
+            checksums = {name: checksum} if checksum else None
+            if not filepath.exists():
+                download(
+                    name,
+                    root=entry["root"],
+                    dest_folder=dest_path,
+                    checksums=checksums,
+                    expected_size=entry["size"],
+                )
+                return "downloaded" if filepath.exists() else "missing"
+            the_size = filepath.stat().st_size
+            if entry["size"] in (None, the_size):
+                return "present"
+            print(f"{filepath} is {the_size} bytes, expected {entry['size']}")
+            instrument.count("size_mismatch")
+            staging = Path(
+                tempfile.mkdtemp(prefix=f".{name}.", suffix="_tmp", dir=dest_path)
+            )
+            try:
+                download(
+                    name,
+                    root=entry["root"],
+                    dest_folder=staging,
+                    checksums=checksums,
+                    expected_size=entry["size"],
+                )
+                fresh = staging / name
+                if not fresh.exists():
+                    return "missing"
+                #
+                # keep the old copy under a new name with a hard link, so
+                # filepath always exists, then swap in the new one
+                #
+                bad = _unused_path(dest_path / f"{name}.bad")
+                os.link(filepath, bad)
+                os.replace(fresh, filepath)
+                print(f"replaced {filepath}, the old copy is {bad}")
+                return "replaced"
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fetch_manifest(manifest, dest_folder=None, workers=4, order="priority"):
+    """
+    download every file of a manifest that isn't in dest_folder yet,
+    workers at a time, in the order given by plan_fetch.  Safe to run
+    from several processes at once on the same dest_folder (uses
+    fcntl file locks, so unix only)
+
+    Parameters
+    ----------
+
+    manifest: str, Path or list of dict
+       a manifest file (see read_manifest) or its entries
+
+    Returns
+    -------
+
+    status: dict
+       filename -> 'downloaded', 'present', 'replaced' (a local copy
+       of the wrong size was downloaded again and kept as filename.bad),
+       'missing' (not on the server) or the exception raised
+    """
+    import concurrent.futures
+
+    entries = manifest if isinstance(manifest, list) else read_manifest(manifest)
+    dest_path = Path() if dest_folder is None else Path(dest_folder).resolve()
+    dest_path.mkdir(parents=True, exist_ok=True)
+    todo, present = plan_fetch(entries, dest_path, order)
+    status = {name: "present" for name in present}
+    with instrument.span("fetch_manifest") as the_span:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_fetch_locked, entry, dest_path): entry["filename"]
+                for entry in todo
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    status[name] = future.result()
+                except Exception as error:
+                    status[name] = error
+        the_span.add("files_requested", len(todo))
+        the_span.add("files_present", len(present))
+    return status
+
+
 def make_parser():
     """
     set up the command line arguments needed to call the program
@@ -143,11 +839,25 @@ def make_parser():
     parser = argparse.ArgumentParser(
         formatter_class=linebreaks, description=__doc__.lstrip()
     )
-    parser.add_argument("filename", type=str, help="name of file to download")
+    parser.add_argument(
+        "filename", type=str, nargs="?", help="name of file to download"
+    )
+    parser.add_argument(
+        "--manifest", default=None, help="csv or json list of files to download"
+    )
+    parser.add_argument("--dest_folder", default=None)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--order", choices=["priority", "largest"], default="priority")
     parser.add_argument(
         "--root",
+        nargs="+",
         default="https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads",
-        help="root of url, detaults to https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads",
+        help="root of url, detaults to https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads\n"
+        "several roots are tried in order (e.g. a satcode.mirror first),\n"
+        "after any mirrors in SATCODE_MIRRORS",
+    )
+    parser.add_argument(
+        "--checksums", default=None, help="checksum list in sha256sum/md5sum format"
     )
     return parser
 
@@ -155,7 +865,28 @@ def make_parser():
 def main(args=None):
     parser = make_parser()
     args = parser.parse_args(args)
-    download(args.filename, root=args.root)
+    #
+    # --root gives a list, which download takes as is, so add the
+    # SATCODE_MIRRORS here; dict.fromkeys drops repeats, keeping the order
+    #
+    roots = [args.root] if isinstance(args.root, str) else args.root
+    args.root = list(dict.fromkeys(mirror_roots() + roots))
+    if args.manifest:
+        entries = read_manifest(args.manifest, root=args.root)
+        status = fetch_manifest(
+            entries, args.dest_folder, workers=args.workers, order=args.order
+        )
+        for name, result in status.items():
+            print(f"{name}: {result}")
+        return
+    if args.filename is None:
+        parser.error("give a filename or --manifest")
+    download(
+        args.filename,
+        root=args.root,
+        dest_folder=args.dest_folder,
+        checksums=args.checksums,
+    )
 
 
 if __name__ == "__main__":
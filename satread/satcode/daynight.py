@@ -0,0 +1,283 @@
+"""
+  satcode.daynight
+  ________________
+
+  day/night and sun geometry prefiltering of MODIS granules without
+  opening the files.
+
+  The start time is in the file name (MYD021KM.A2013222.2105... is day
+  222 of 2013 at 21:05 UTC) and the footprint is in the catalog
+  (satcode.catalog), so the solar zenith angle at the granule centre and
+  corners can be computed for a whole catalog at once from a low
+  precision solar position (about 0.01 degree, plenty for a 2330 km wide
+  swath).  A granule is predicted Day when every sample has the sun above
+  the day threshold, Night when every sample is below it, and Both
+  otherwise.  Granules with a sample within a margin of the threshold
+  are ambiguous, and only for those is the DAYNIGHTFLAG looked up: from
+  the catalog row, or from the CoreMetadata.0 header of the file.
+
+  to run from the command line::
+
+    python -m satcode.daynight ../data/catalog.npz --want Day --max_zenith 70
+
+  to run from a python script::
+
+    from satcode.catalog import load_catalog
+    from satcode.daynight import prefilter
+    catalog = load_catalog('catalog.npz')
+    day = catalog[prefilter(catalog, want='Day', max_zenith=70)]
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+#
+# MODIS switches to day mode when the solar zenith is below 85 degrees
+#
+day_threshold = 85.0
+flags = np.array(["Day", "Night", "Both"])
+_j2000 = np.datetime64("2000-01-01T12:00:00", "ms")
+
+
+def filename_times(filenames):
+    """
+    start times encoded in MODIS file names (.AYYYYDDD.HHMM.), decoded
+    for the whole array at once from the bytes of the names
+
+    Returns
+    -------
+
+    times: datetime64[ms] array
+       NaT where a name doesn't follow the convention
+    """
+    names = np.asarray(filenames)
+    if names.dtype.kind != "S":
+        names = np.array([Path(str(name)).name for name in names], dtype="S")
+    names = np.ascontiguousarray(names, dtype=f"S{max(names.dtype.itemsize, 32)}")
+    chars = names.view(np.uint8).reshape(len(names), -1)
+    dot = np.argmax(chars == ord("."), axis=1)
+    #
+    # offsets from the first dot of the 11 digits YYYYDDD and HHMM
+    #
+    offsets = np.array([2, 3, 4, 5, 6, 7, 8, 10, 11, 12, 13])
+    positions = np.minimum(dot[:, np.newaxis] + offsets, chars.shape[1] - 1)
+    digits = np.take_along_axis(chars, positions, axis=1).astype(np.int64) - ord("0")
+    row = np.arange(len(names))
+    after = np.minimum(dot + 9, chars.shape[1] - 1)
+    valid = (
+        (chars[row, dot] == ord("."))
+        & (chars[row, np.minimum(dot + 1, chars.shape[1] - 1)] == ord("A"))
+        & (chars[row, after] == ord("."))
+        & np.all((digits >= 0) & (digits <= 9), axis=1)
+    )
+    year = digits[:, 0:4] @ np.array([1000, 100, 10, 1])
+    doy = digits[:, 4:7] @ np.array([100, 10, 1])
+    minutes = digits[:, 7:11] @ np.array([600, 60, 10, 1])
+    times = (
+        (year - 1970).astype("M8[Y]").astype("M8[ms]")
+        + (doy - 1).astype("m8[D]")
+        + minutes.astype("m8[m]")
+    )
+    times[~valid] = np.datetime64("NaT")
+    return times
+
+
+def solar_zenith(times, lons, lats):
+    """
+    solar zenith angle in degrees, broadcasting times against lons, lats
+
+    Low precision solar coordinates (Astronomical Almanac), with the
+    hour angle from Greenwich mean sidereal time
+    """
+    days = (np.asarray(times, dtype="M8[ms]") - _j2000) / np.timedelta64(1, "D")
+    anomaly = np.radians(357.529 + 0.98560028 * days)
+    mean_longitude = 280.459 + 0.98564736 * days
+    ecliptic = np.radians(
+        mean_longitude + 1.915 * np.sin(anomaly) + 0.020 * np.sin(2.0 * anomaly)
+    )
+    obliquity = np.radians(23.439 - 0.00000036 * days)
+    right_ascension = np.degrees(
+        np.arctan2(np.cos(obliquity) * np.sin(ecliptic), np.cos(ecliptic))
+    )
+    declination = np.arcsin(np.sin(obliquity) * np.sin(ecliptic))
+    sidereal = 280.46061837 + 360.98564736629 * days
+    #
+    # one time per granule against several sample points per granule
+    #
+    shape = np.shape(days) + (1,) * max(np.ndim(lons) - np.ndim(days), 0)
+    hour_angle = np.radians(
+        np.reshape(sidereal - right_ascension, shape) + np.asarray(lons)
+    )
+    declination = np.reshape(declination, shape)
+    lats = np.radians(lats)
+    cos_zenith = np.sin(lats) * np.sin(declination) + np.cos(lats) * np.cos(
+        declination
+    ) * np.cos(hour_angle)
+    return np.degrees(np.arccos(np.clip(cos_zenith, -1.0, 1.0)))
+
+
+def predict(times, lons, lats, threshold=day_threshold, margin=2.0):
+    """
+    Parameters
+    ----------
+
+    times: datetime64 array, shape (n,)
+
+    lons, lats: arrays, shape (n, k)
+       k sample points per granule, e.g. G-ring corners plus centre
+
+    threshold: float
+       solar zenith in degrees below which a sample is day
+
+    margin: float
+       degrees; samples closer than this to the threshold make the
+       prediction ambiguous
+
+    Returns
+    -------
+
+    flag: str array
+       'Day', 'Night' or 'Both'
+
+    ambiguous: bool array
+       True where the header should be consulted
+    """
+    zenith = solar_zenith(times, lons, lats)
+    day = zenith < threshold
+    flag = np.where(day.all(axis=1), 0, np.where(day.any(axis=1), 2, 1))
+    ambiguous = np.any(np.abs(zenith - threshold) < margin, axis=1)
+    ambiguous |= np.isnat(np.asarray(times, dtype="M8[ms]"))
+    return flags[flag], ambiguous
+
+
+def header_daynight(path):
+    """DAYNIGHTFLAG from the CoreMetadata.0 header only"""
+    from pyhdf.SD import SD, SDC
+    from satcode.catalog import core_fields
+
+    the_file = SD(str(path), SDC.READ)
+    metadata = the_file.attributes()["CoreMetadata.0"]
+    the_file.end()
+    return core_fields(metadata)["DAYNIGHTFLAG"]
+
+
+def granule_sun(catalog):
+    """
+    solar zenith at the centre of every catalogued granule at its
+    file name time (catalog start time if the name has none), plus the
+    predicted day/night flag.  The centre is recomputed from the corners
+    (satcode.catalog.footprint_centres), so it is right for granules
+    across the antimeridian even in catalogs with an older lon_0
+
+    Returns
+    -------
+
+    zenith: float array
+    flag: str array
+    ambiguous: bool array
+    """
+    from satcode.catalog import footprint_centres
+
+    records = catalog.records
+    times = filename_times(records["filename"])
+    times = np.where(np.isnat(times), records["start"], times)
+    corner_lons = records["lon_list"].astype(np.float64)
+    corner_lats = records["lat_list"].astype(np.float64)
+    lon_0, lat_0 = footprint_centres(corner_lons, corner_lats)
+    lons = np.column_stack([corner_lons, lon_0])
+    lats = np.column_stack([corner_lats, lat_0])
+    flag, ambiguous = predict(times, lons, lats)
+    zenith = solar_zenith(times, lons[:, -1], lats[:, -1])
+    return zenith, flag, ambiguous
+
+
+def prefilter(catalog, want="Day", max_zenith=None, read_header=False):
+    """
+    boolean mask of the catalog rows to keep
+
+    Parameters
+    ----------
+
+    catalog: satcode.catalog.Catalog
+
+    want: optional str
+       'Day' keeps granules that are at least partly in daylight (Day or
+       Both), 'Night' those at least partly dark, None skips the test
+
+    max_zenith: optional float
+       also require the solar zenith at the granule centre to be below this
+
+    read_header: bool
+       for ambiguous predictions, read the DAYNIGHTFLAG from the file
+       header instead of the catalog row
+    """
+    with instrument.span("prefilter") as the_span:
+        zenith, flag, ambiguous = granule_sun(catalog)
+        for index in np.flatnonzero(ambiguous):
+            if read_header:
+                flag[index] = header_daynight(catalog.path(index))
+            else:
+                flag[index] = catalog.records["daynight"][index].decode()
+        the_span.add("granules", len(catalog))
+        the_span.add("ambiguous", int(ambiguous.sum()))
+    keep = np.ones(len(catalog), dtype=bool)
+    if want is not None:
+        keep &= (flag == want) | (flag == "Both")
+    if max_zenith is not None:
+        keep &= zenith < max_zenith
+    return keep
+
+
+def filter_files(filenames, lons, lats, want="Day", max_zenith=None):
+    """
+    the same prefilter for files with no catalog, given the granule
+    centre of each (lons, lats arrays); ambiguous ones read their header
+    """
+    filenames = [str(name) for name in filenames]
+    times = filename_times(filenames)
+    lons = np.asarray(lons, dtype=np.float64)[:, np.newaxis]
+    lats = np.asarray(lats, dtype=np.float64)[:, np.newaxis]
+    flag, ambiguous = predict(times, lons, lats)
+    for index in np.flatnonzero(ambiguous):
+        flag[index] = header_daynight(filenames[index])
+    keep = np.ones(len(filenames), dtype=bool)
+    if want is not None:
+        keep &= (flag == want) | (flag == "Both")
+    if max_zenith is not None:
+        keep &= solar_zenith(times, lons[:, 0], lats[:, 0]) < max_zenith
+    return [name for name, good in zip(filenames, keep) if good]
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("catalog", type=str, help="catalog.npz from satcode.catalog")
+    parser.add_argument("--want", choices=["Day", "Night"], default="Day")
+    parser.add_argument("--max_zenith", type=float, default=None, help="degrees")
+    parser.add_argument(
+        "--read_header", action="store_true", help="read ambiguous flags from files"
+    )
+    return parser
+
+
+def main(args=None):
+    from satcode.catalog import load_catalog
+
+    parser = make_parser()
+    args = parser.parse_args(args)
+    catalog = load_catalog(args.catalog)
+    keep = prefilter(catalog, args.want, args.max_zenith, args.read_header)
+    for record in catalog[keep]:
+        print(record["start"], record["path"])
+
+
+if __name__ == "__main__":
+    main()
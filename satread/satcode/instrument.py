@@ -0,0 +1,290 @@
+"""
+  satcode.instrument
+  __________________
+
+  lightweight timing spans and counters for the satcode hot paths
+  (http downloads, hdf reads, metadata parsing, resampling, image writes).
+
+  Instrumentation is off by default.  While it is off, ``span`` returns
+  a shared do-nothing context manager and ``count`` returns immediately,
+  so the wired-in calls cost one global lookup each.
+
+  Turn it on from a python script::
+
+    from satcode import instrument
+    instrument.enable()
+    ... run the batch ...
+    instrument.print_summary()
+    instrument.export_chrome_trace('trace.json')   # open in chrome://tracing
+    instrument.export_jsonl('trace.jsonl')
+
+  or for a whole run by setting an environment variable, the trace is
+  written when python exits (chrome format if the name ends in .json,
+  json lines otherwise)::
+
+    SATCODE_TRACE=trace.json python cartopy_resample.py
+
+  to add your own spans::
+
+    with instrument.span('kd_tree', granule=name) as sp:
+        ...
+        sp.add('pixels_resampled', lons.size)
+
+    @instrument.traced('write_png')
+    def write_png(...):
+        ...
+"""
+import atexit
+import collections
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+_enabled = False
+_lock = threading.Lock()
+_events = []
+_counters = collections.Counter()
+#
+# the innermost open span of the running thread or asyncio task: each
+# task runs in its own copy of the context, so interleaved downloads
+# don't become each other's parents
+#
+_current = contextvars.ContextVar("satcode_span", default=None)
+
+
+def enable():
+    """start recording spans and counters"""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """stop recording; events recorded so far are kept until reset()"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """throw away all recorded spans and counters"""
+    with _lock:
+        _events.clear()
+        _counters.clear()
+
+
+class _NullSpan:
+    """
+    returned by span() when instrumentation is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, key, amount=1):
+        pass
+
+
+_null_span = _NullSpan()
+
+
+class Span:
+    """
+    a timed region.  Counters added with ``add`` (or with the module
+    level ``count`` while this span is the innermost one in the context)
+    are stored with the span and also summed into the global counters.
+    """
+
+    __slots__ = ("name", "fields", "counters", "start", "parent", "token")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.counters = {}
+        self.start = None
+        self.parent = None
+        self.token = None
+
+    def add(self, key, amount=1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.token = _current.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stop = time.perf_counter_ns()
+        _current.reset(self.token)
+        event = dict(
+            name=self.name,
+            start_us=self.start / 1.0e3,
+            dur_us=(stop - self.start) / 1.0e3,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            parent=None if self.parent is None else self.parent.name,
+            counters=self.counters,
+            fields=self.fields,
+        )
+        if exc_type is not None:
+            event["error"] = exc_type.__name__
+        with _lock:
+            _events.append(event)
+            _counters.update(self.counters)
+        return False
+
+
+def span(name, **fields):
+    """
+    context manager timing the enclosed block
+
+    Parameters
+    ----------
+
+    name: str
+       span name, e.g. 'download' or 'parseMeta'
+
+    fields: keyword arguments
+       extra json-serializable values stored with the span (filename etc.)
+    """
+    if not _enabled:
+        return _null_span
+    return Span(name, fields)
+
+
+def count(key, amount=1):
+    """
+    add amount to counter key on the innermost open span, or to the
+    global counters if no span is open in this thread or task
+    """
+    if not _enabled:
+        return
+    current = _current.get()
+    if current is not None:
+        current.add(key, amount)
+    else:
+        with _lock:
+            _counters[key] += amount
+
+
+def traced(name=None):
+    """
+    decorator wrapping every call of a function in a span.  The
+    enabled check happens per call, so decorated functions can be
+    imported before enable() is called
+    """
+
+    def decorator(func):
+        span_name = func.__qualname__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def events():
+    """copy of the recorded span events"""
+    with _lock:
+        return list(_events)
+
+
+def counters():
+    """copy of the summed counters"""
+    with _lock:
+        return dict(_counters)
+
+
+def summary():
+    """
+    Returns
+    -------
+
+    out: dict
+       span name -> dict(calls, total_s, max_s, counters)
+    """
+    out = {}
+    for event in events():
+        item = out.setdefault(
+            event["name"], dict(calls=0, total_s=0.0, max_s=0.0, counters={})
+        )
+        item["calls"] += 1
+        seconds = event["dur_us"] * 1.0e-6
+        item["total_s"] += seconds
+        item["max_s"] = max(item["max_s"], seconds)
+        for key, value in event["counters"].items():
+            item["counters"][key] = item["counters"].get(key, 0) + value
+    return out
+
+
+def print_summary():
+    """print one line per span name, slowest total first"""
+    table = sorted(summary().items(), key=lambda item: -item[1]["total_s"])
+    print(f"{'span':24s} {'calls':>7s} {'total s':>10s} {'max s':>10s}  counters")
+    for name, item in table:
+        counts = ", ".join(f"{key}={value}" for key, value in item["counters"].items())
+        print(
+            f"{name:24s} {item['calls']:7d} {item['total_s']:10.4f} "
+            f"{item['max_s']:10.4f}  {counts}"
+        )
+
+
+def export_jsonl(filename):
+    """write one json object per span"""
+    with open(filename, "w") as f:
+        for event in events():
+            f.write(json.dumps(event, default=str) + "\n")
+
+
+def export_chrome_trace(filename):
+    """
+    write the spans as complete ('X') events in the chrome trace event
+    format, viewable in chrome://tracing or https://ui.perfetto.dev
+    """
+    trace = []
+    for event in events():
+        args = dict(event["fields"])
+        args.update(event["counters"])
+        trace.append(
+            dict(
+                name=event["name"],
+                ph="X",
+                ts=event["start_us"],
+                dur=event["dur_us"],
+                pid=event["pid"],
+                tid=event["tid"],
+                args=args,
+            )
+        )
+    with open(filename, "w") as f:
+        json.dump(dict(traceEvents=trace, displayTimeUnit="ms"), f, default=str)
+
+
+def _export_at_exit(filename):
+    if filename.endswith(".json"):
+        export_chrome_trace(filename)
+    else:
+        export_jsonl(filename)
+
+
+_trace_file = os.environ.get("SATCODE_TRACE")
+if _trace_file:
+    enable()
+    atexit.register(_export_at_exit, _trace_file)
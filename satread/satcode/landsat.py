@@ -0,0 +1,469 @@
+"""
+  satcode.landsat
+  _______________
+
+  RGB composites and band indices (NDVI, NBR, thermal brightness
+  temperature) for a whole Landsat Level-1 scene, calibrated with the
+  coefficients in the scene's _MTL.txt file.
+
+  All the 30 m band GeoTIFFs of a scene share one grid, so the scene is
+  processed in aligned windows: for each window the bands a product
+  needs are read concurrently (one rasterio handle per band, GDAL
+  releases the GIL), calibrated in place in float32 and combined,
+  then the window is written to a tiled GeoTIFF.  Memory is bounded by
+  (2 x workers) x (bands per product) x (one window), never a float64 copy
+  of a band.
+
+  Band names are mapped to band numbers by spacecraft, so the same
+  products work for Landsat 4/5 TM, 7 ETM+ and 8/9 OLI/TIRS.
+
+  to run from the command line::
+
+    python -m satcode.landsat ../data/before_image --products true_color ndvi bt --out_folder=../data/landsat
+
+  to run from a python script::
+
+    from satcode.landsat import LandsatScene, make_product
+    scene = LandsatScene('../data/before_image')
+    make_product(scene, 'ndvi', 'ndvi.tif')
+    nbr = scene.compute('nbr')           # whole scene in memory, float32
+"""
+import argparse
+import concurrent.futures
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+band_numbers = {
+    "oli": dict(
+        coastal="1",
+        blue="2",
+        green="3",
+        red="4",
+        nir="5",
+        swir1="6",
+        swir2="7",
+        thermal="10",
+    ),
+    "tm": dict(
+        blue="1", green="2", red="3", nir="4", swir1="5", swir2="7", thermal="6"
+    ),
+    "etm": dict(
+        blue="1",
+        green="2",
+        red="3",
+        nir="4",
+        swir1="5",
+        swir2="7",
+        thermal="6_VCID_1",
+    ),
+}
+
+#
+# collection 1 TM/ETM+ MTL files leave out the thermal constants
+#
+thermal_constants = dict(tm=(607.76, 1260.56), etm=(666.09, 1282.71))
+
+#
+# product name -> (kind, band names)
+#
+products = dict(
+    true_color=("rgb", ("red", "green", "blue")),
+    false_color=("rgb", ("nir", "red", "green")),
+    swir=("rgb", ("swir2", "nir", "red")),
+    ndvi=("index", ("nir", "red")),
+    nbr=("index", ("nir", "swir2")),
+    ndwi=("index", ("green", "nir")),
+    bt=("bt", ("thermal",)),
+)
+
+
+def mtl_value(text):
+    """
+    one MTL value without evaluating it: a quoted string, else an int
+    or float, else the raw text (e.g. an unquoted date 2013-10-11)
+    """
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return text[1:-1]
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def read_mtl(filename):
+    """
+    parse a Landsat _MTL.txt file into nested dictionaries, one per
+    GROUP.  Values go through mtl_value, never eval, since the file
+    comes off the network
+    """
+    mtl = {}
+    stack = [mtl]
+    for line in Path(filename).read_text().splitlines():
+        if line.strip() == "END":
+            break
+        key, equals, text = line.partition("=")
+        if not equals:
+            continue
+        key = key.strip()
+        value = mtl_value(text)
+        if key == "GROUP":
+            stack[-1][value] = {}
+            stack.append(stack[-1][value])
+        elif key == "END_GROUP":
+            if len(stack) == 1:
+                raise ValueError(f"{filename}: END_GROUP = {value} without GROUP")
+            stack.pop()
+        else:
+            stack[-1][key] = value
+    return mtl
+
+
+def find_key(tree, key):
+    """
+    first value of key anywhere in the nested MTL dictionary
+    (the group names differ between collection 1 and 2)
+    """
+    if key in tree:
+        return tree[key]
+    for value in tree.values():
+        if isinstance(value, dict):
+            found = find_key(value, key)
+            if found is not None:
+                return found
+    return None
+
+
+class LandsatScene:
+    """
+    a Level-1 scene folder: the _MTL.txt file and its band GeoTIFFs
+
+    Attributes
+    ----------
+
+    mtl: dict
+       parsed metadata
+
+    sensor: str
+       'oli', 'tm' or 'etm', selects band_numbers
+
+    band_files: dict
+       band number (as in the file name, e.g. '10' or '6_VCID_1') -> Path
+
+    sun_elevation: float
+       degrees
+    """
+
+    def __init__(self, folder_or_mtl):
+        path = Path(folder_or_mtl)
+        if path.is_dir():
+            matches = sorted(path.glob("*_MTL.txt"))
+            if not matches:
+                raise FileNotFoundError(f"no _MTL.txt file in {path}")
+            path = matches[0]
+        self.mtl_file = path
+        self.mtl = read_mtl(path)
+        spacecraft = str(find_key(self.mtl, "SPACECRAFT_ID"))
+        number = int("".join(char for char in spacecraft if char.isdigit()))
+        self.sensor = "oli" if number >= 8 else "etm" if number == 7 else "tm"
+        self.sun_elevation = float(find_key(self.mtl, "SUN_ELEVATION"))
+        stem = path.name[: -len("_MTL.txt")]
+        self.band_files = {}
+        for tif in path.parent.glob(f"{stem}_B*.TIF"):
+            self.band_files[tif.stem[len(stem) + 2 :]] = tif
+        self._shape = None
+
+    def band_number(self, name):
+        return band_numbers[self.sensor][name]
+
+    def coefficients(self, name):
+        """
+        calibration for a band name
+
+        Returns
+        -------
+
+        dict with radiance (mult, add), and reflectance (mult, add) for
+        the reflective bands or k1, k2 for the thermal band
+        """
+        number = self.band_number(name)
+        coeffs = dict(
+            radiance=(
+                float(find_key(self.mtl, f"RADIANCE_MULT_BAND_{number}")),
+                float(find_key(self.mtl, f"RADIANCE_ADD_BAND_{number}")),
+            )
+        )
+        if name == "thermal":
+            k1 = find_key(self.mtl, f"K1_CONSTANT_BAND_{number}")
+            k2 = find_key(self.mtl, f"K2_CONSTANT_BAND_{number}")
+            if k1 is None:
+                k1, k2 = thermal_constants[self.sensor]
+            coeffs["k1"], coeffs["k2"] = float(k1), float(k2)
+        else:
+            mult = find_key(self.mtl, f"REFLECTANCE_MULT_BAND_{number}")
+            add = find_key(self.mtl, f"REFLECTANCE_ADD_BAND_{number}")
+            if mult is not None:
+                coeffs["reflectance"] = (float(mult), float(add))
+        return coeffs
+
+    def band_file(self, name):
+        number = self.band_number(name)
+        if number not in self.band_files:
+            raise KeyError(f"band {number} ({name}) missing from {self.mtl_file}")
+        return self.band_files[number]
+
+    @property
+    def profile(self):
+        """rasterio profile of the scene grid (from the red band)"""
+        import rasterio
+
+        with rasterio.open(self.band_file("red")) as src:
+            return src.profile.copy()
+
+    @property
+    def shape(self):
+        if self._shape is None:
+            profile = self.profile
+            self._shape = (profile["height"], profile["width"])
+        return self._shape
+
+    def read_window(self, names, window=None, workers=None):
+        """
+        read the same window of several bands concurrently
+
+        Returns
+        -------
+
+        dict: band name -> uint16 digital numbers
+        """
+        import rasterio
+
+        def read_one(name):
+            with rasterio.open(self.band_file(name)) as src:
+                return src.read(1, window=window)
+
+        with instrument.span("landsat_read", bands=len(names)) as the_span:
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers or len(names)
+            ) as pool:
+                arrays = dict(zip(names, pool.map(read_one, names)))
+            the_span.add("bytes_read", sum(item.nbytes for item in arrays.values()))
+        return arrays
+
+    def compute(self, product, window=None, **kwargs):
+        """
+        one product for a window (or the whole scene) as an array:
+        float32 with NaN fill for indices and bt (kelvin), uint8
+        (3, rows, cols) for rgb composites
+        """
+        kind, names = products[product]
+        dns = self.read_window(names, window)
+        return _kernels[kind](self, names, dns, **kwargs)
+
+
+def to_reflectance(scene, name, dn, sun_correct=True):
+    """
+    top of atmosphere reflectance in float32, NaN where dn is 0 (fill).
+    Written into one new float32 array, every step in place
+    """
+    coeffs = scene.coefficients(name)
+    out = dn.astype(np.float32)
+    if "reflectance" in coeffs:
+        mult, add = coeffs["reflectance"]
+        scale = 1.0
+        if sun_correct:
+            scale = 1.0 / math.sin(math.radians(scene.sun_elevation))
+        out *= np.float32(mult * scale)
+        out += np.float32(add * scale)
+    else:
+        #
+        # no reflectance coefficients: fall back to radiance
+        #
+        mult, add = coeffs["radiance"]
+        out *= np.float32(mult)
+        out += np.float32(add)
+    out[dn == 0] = np.nan
+    return out
+
+
+def to_brightness_temperature(scene, name, dn):
+    """
+    thermal band brightness temperature in kelvin, float32, in place:
+    bt = k2 / ln(k1 / L + 1)
+    """
+    coeffs = scene.coefficients(name)
+    mult, add = coeffs["radiance"]
+    out = dn.astype(np.float32)
+    out *= np.float32(mult)
+    out += np.float32(add)
+    np.divide(np.float32(coeffs["k1"]), out, out=out)
+    out += np.float32(1.0)
+    np.log(out, out=out)
+    np.divide(np.float32(coeffs["k2"]), out, out=out)
+    out[dn == 0] = np.nan
+    return out
+
+
+def _index_kernel(scene, names, dns):
+    """
+    normalized difference (a - b) / (a + b) from two reflectances,
+    reusing the reflectance buffers for the sum and the result
+    """
+    a = to_reflectance(scene, names[0], dns[names[0]], sun_correct=False)
+    b = to_reflectance(scene, names[1], dns[names[1]], sun_correct=False)
+    total = a + b
+    np.subtract(a, b, out=a)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        np.divide(a, total, out=a)
+    return a
+
+
+def _rgb_kernel(scene, names, dns, max_reflectance=0.3, gamma=2.2):
+    """
+    reflectance stretched to 0..max_reflectance, gamma corrected, uint8;
+    fill pixels are 0 in all three channels
+    """
+    out = np.zeros((3,) + dns[names[0]].shape, dtype=np.uint8)
+    for channel, name in enumerate(names):
+        refl = to_reflectance(scene, name, dns[name])
+        refl *= np.float32(1.0 / max_reflectance)
+        np.clip(refl, 0.0, 1.0, out=refl)
+        np.power(refl, np.float32(1.0 / gamma), out=refl)
+        refl *= np.float32(255.0)
+        np.nan_to_num(refl, copy=False, nan=0.0)
+        out[channel] = refl
+    return out
+
+
+def _bt_kernel(scene, names, dns):
+    return to_brightness_temperature(scene, names[0], dns[names[0]])
+
+
+_kernels = dict(index=_index_kernel, rgb=_rgb_kernel, bt=_bt_kernel)
+
+
+def windows(shape, size=1024):
+    """rasterio windows tiling shape, aligned on multiples of size"""
+    from rasterio.windows import Window
+
+    rows, cols = shape
+    for row in range(0, rows, size):
+        for col in range(0, cols, size):
+            yield Window(col, row, min(size, cols - col), min(size, rows - row))
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def make_product(scene, product, out_path, window_size=1024, workers=None, **kwargs):
+    """
+    compute a product window by window and write a tiled, compressed
+    GeoTIFF on the scene grid
+
+    Parameters
+    ----------
+
+    scene: LandsatScene
+
+    product: str
+       a key of products
+
+    window_size: int
+       rows and columns per window, a multiple of 16
+
+    workers: optional int
+       windows computed at once
+
+    kwargs:
+       passed to the kernel (max_reflectance, gamma for rgb)
+
+    Returns
+    -------
+
+    out_path: Path
+    """
+    import rasterio
+
+    kind = products[product][0]
+    profile = scene.profile
+    profile.update(
+        driver="GTiff",
+        tiled=True,
+        blockxsize=min(window_size, 512),
+        blockysize=min(window_size, 512),
+        compress="deflate",
+    )
+    if kind == "rgb":
+        profile.update(count=3, dtype="uint8", nodata=0, photometric="RGB")
+    else:
+        profile.update(count=1, dtype="float32", nodata=np.nan, predictor=3)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count()
+    all_windows = list(windows(scene.shape, window_size))
+    with instrument.span("landsat_product", product=product) as the_span:
+        with rasterio.open(out_path, "w", **profile) as dst:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                #
+                # a couple of windows per worker in flight at a time
+                #
+                for batch in _batches(all_windows, 2 * workers):
+                    results = pool.map(
+                        lambda window: scene.compute(product, window, **kwargs),
+                        batch,
+                    )
+                    for window, result in zip(batch, results):
+                        if result.ndim == 2:
+                            dst.write(result, 1, window=window)
+                        else:
+                            dst.write(result, window=window)
+        the_span.add("windows", len(all_windows))
+    return out_path
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("scene", type=str, help="scene folder or _MTL.txt file")
+    parser.add_argument(
+        "--products", nargs="+", choices=list(products), default=["true_color"]
+    )
+    parser.add_argument("--out_folder", type=str, default=".")
+    parser.add_argument("--window_size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, default=None)
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    scene = LandsatScene(args.scene)
+    stem = scene.mtl_file.name[: -len("_MTL.txt")]
+    for product in args.products:
+        out_path = Path(args.out_folder) / f"{stem}_{product}.tif"
+        make_product(
+            scene,
+            product,
+            out_path,
+            window_size=args.window_size,
+            workers=args.workers,
+        )
+        print(out_path)
+
+
+if __name__ == "__main__":
+    main()
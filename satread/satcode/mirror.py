@@ -0,0 +1,228 @@
+"""
+  satcode.mirror
+  ______________
+
+  a small http server that serves a local folder of granules to the
+  machines on a cluster or a laptop with no network, with directory
+  listings and byte range requests (so partial reads and resumed
+  downloads work).
+
+  With an upstream root the mirror fills itself: a request for a file it
+  doesn't have is fetched from upstream once (with the locking of
+  satcode.data_read.fetch_manifest, so simultaneous requests wait for
+  the same download) and then served from disk.
+
+  Point satcode.data_read at the mirror with a list of roots, or for
+  every download with an environment variable::
+
+    SATCODE_MIRRORS=http://mirror.local:8000 python -m satcode.pipeline ...
+
+  to run from the command line::
+
+    python -m satcode.mirror ../data --port 8000 --upstream https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads
+
+  to run from a python script::
+
+    from satcode.mirror import running_mirror
+    with running_mirror('../data') as root:
+        download('MYD021KM.A2013222.2105.061.2018047235850.hdf', root=[root, upstream])
+"""
+import argparse
+import contextlib
+import functools
+import html
+import http.server
+import io
+import os
+import re
+import shutil
+import threading
+import urllib.parse
+from pathlib import Path
+
+from satcode import instrument
+
+_range_pattern = re.compile(r"bytes=(\d*)-(\d*)$")
+#
+# the lock files and partial downloads of a fill in progress
+#
+_private_suffixes = (".lock", "_tmp")
+
+
+def _is_private(name):
+    return name.endswith(_private_suffixes)
+
+
+class MirrorHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    SimpleHTTPRequestHandler plus single byte ranges and fill-on-miss
+    """
+
+    def __init__(self, *args, upstream=None, quiet=False, **kwargs):
+        self.upstream = upstream
+        self.quiet = quiet
+        self._remaining = None
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        if not self.quiet:
+            super().log_message(*args)
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def _fill(self, path):
+        """fetch a missing top level file from upstream"""
+        from satcode.data_read import _fetch_locked
+
+        name = Path(path).name
+        if not self.upstream:
+            return
+        if Path(path).parent.resolve() != Path(self.directory).resolve():
+            return
+        with instrument.span("mirror_fill", filename=name):
+            #
+            # a list root so SATCODE_MIRRORS isn't prepended: a mirror that
+            # asked itself for the file would wait forever on its own .lock
+            #
+            entry = dict(filename=name, root=[self.upstream], checksum=None, size=None)
+            try:
+                _fetch_locked(entry, Path(self.directory))
+            except Exception as e:
+                self.log_error("upstream fetch of %s failed: %s", name, e)
+
+    def list_directory(self, path):
+        """directory listing without the .lock and _tmp files"""
+        try:
+            names = sorted(os.listdir(path), key=str.lower)
+        except OSError:
+            self.send_error(404, "No permission to list directory")
+            return None
+        lines = ["<!DOCTYPE HTML>", "<html>", "<body>", "<ul>"]
+        for name in names:
+            if _is_private(name):
+                continue
+            link = name + "/" if os.path.isdir(os.path.join(path, name)) else name
+            lines.append(
+                f'<li><a href="{urllib.parse.quote(link)}">{html.escape(link)}</a></li>'
+            )
+        lines.extend(["</ul>", "</body>", "</html>", ""])
+        encoded = "\n".join(lines).encode("utf-8", "surrogateescape")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        return io.BytesIO(encoded)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if _is_private(path):
+            self.send_error(404, "File not found")
+            return None
+        if not os.path.exists(path):
+            self._fill(path)
+        range_header = self.headers.get("Range")
+        if range_header is None or os.path.isdir(path) or not os.path.exists(path):
+            return super().send_head()
+        match = _range_pattern.match(range_header.strip())
+        size = os.path.getsize(path)
+        if match is None or match.groups() == ("", ""):
+            return super().send_head()
+        first, last = match.groups()
+        if first == "":
+            #
+            # bytes=-500 is the last 500 bytes
+            #
+            start, stop = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            stop = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > stop:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        the_file = open(path, "rb")
+        the_file.seek(start)
+        self._remaining = stop - start + 1
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{stop}/{size}")
+        self.send_header("Content-Length", str(self._remaining))
+        self.send_header("Last-Modified", self.date_time_string(os.stat(path).st_mtime))
+        self.end_headers()
+        return the_file
+
+    def copyfile(self, source, outputfile):
+        if self._remaining is None:
+            shutil.copyfileobj(source, outputfile, 1 << 20)
+            return
+        remaining, self._remaining = self._remaining, None
+        while remaining > 0:
+            block = source.read(min(1 << 20, remaining))
+            if not block:
+                break
+            outputfile.write(block)
+            remaining -= len(block)
+
+
+def make_server(directory, host="0.0.0.0", port=8000, upstream=None, quiet=False):
+    """
+    a ThreadingHTTPServer for directory; call serve_forever() on it
+    """
+    handler = functools.partial(
+        MirrorHandler, directory=str(directory), upstream=upstream, quiet=quiet
+    )
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+
+@contextlib.contextmanager
+def running_mirror(directory, upstream=None, host="127.0.0.1", port=0):
+    """
+    serve directory from a background thread for the duration of a with
+    block, yielding the root url
+    """
+    server = make_server(directory, host, port, upstream, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("directory", type=str, help="folder of granules to serve")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--upstream", type=str, default=None, help="root url to fill misses from"
+    )
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    server = make_server(args.directory, args.host, args.port, args.upstream)
+    print(f"serving {args.directory} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,7 @@ from pathlib import Path
 from pyhdf.SD import SD, SDC
 import sys
 
+from satcode import instrument
 
 
 def read_mda(attribute):
@@ -62,6 +63,14 @@ def read_mda(attribute):
     return mda
     
     
+def parse_time(date, time):
+    """
+    CoreMetadata.0 date ('2013-08-10') and time ('21:05:00.000000')
+    strings as a millisecond numpy.datetime64
+    """
+    return np.datetime64(f'{date}T{time}', 'ms')
+
+
 class metaParse:
     def __init__(self,metaDat):
         self.metaDat=str(metaDat).rstrip(' \t\r\n\0')
@@ -143,13 +152,23 @@ def parseMeta(filename):
         equator crossing date in UCT
     equatortime: str
         equator crossing time in UCT
+    start: np.datetime64
+        startdate and starttime parsed, millisecond precision
+    stop: np.datetime64
+        stopdate and stoptime parsed
+    equator: np.datetime64
+        equatordate and equatortime parsed
     nasaProductionDate: str
         date file was produced, in UCT
     """
     filename=str(filename)
-    the_file = SD(filename, SDC.READ)
-    metaDat=the_file.attributes()['CoreMetadata.0']
-    parseIt=metaParse(metaDat)
+    with instrument.span('parseMeta', filename=Path(filename).name):
+        with instrument.span('hdf_read_metadata') as the_span:
+            the_file = SD(filename, SDC.READ)
+            metaDat=the_file.attributes()['CoreMetadata.0']
+            the_span.add('bytes_read', len(metaDat))
+        with instrument.span('read_mda'):
+            parseIt=metaParse(metaDat)
     outDict={}
     outDict['orbit']=parseIt.value2['ORBITNUMBER']['VALUE']
     outDict['daynight']=parseIt.value3['DAYNIGHTFLAG']['VALUE']
@@ -161,6 +180,10 @@ def parseMeta(filename):
     outDict['equatortime']=parseIt.value2['EQUATORCROSSINGTIME']['VALUE']
     outDict['equatordate']=parseIt.value2['EQUATORCROSSINGDATE']['VALUE']
     outDict['nasaProductionDate']=parseIt.value3['PRODUCTIONDATETIME']['VALUE']
+    for key, date, time in [('start', 'startdate', 'starttime'),
+                            ('stop', 'stopdate', 'stoptime'),
+                            ('equator', 'equatordate', 'equatortime')]:
+        outDict[key] = parse_time(outDict[date], outDict[time])
     outDict['type'] = parseIt.value5
     outDict['sensor'] = parseIt.value6
     outDict.update(parseIt.value1)
@@ -0,0 +1,245 @@
+"""
+  satcode.overlay
+  _______________
+
+  coastline and gridline overlays for batches of quicklooks.
+
+  Adding cartopy.feature.GSHHSFeature and ax.gridlines to every figure
+  re-projects the coastline geometry for every plot.  When thousands of
+  images share one (projection, extent, size) the lines only need to be
+  projected and rasterized once: overlay_mask draws them off screen with
+  the Agg backend and keeps the result as a uint8 alpha mask, cached in
+  memory and optionally on disk.  composite then blends the mask onto
+  each image, which costs one pass over the pixels.
+
+  to run from a python script::
+
+    from satcode.overlay import colorize, composite, overlay_for_area
+    alpha = overlay_for_area(area_def, cache_dir='overlays')
+    rgba = colorize(image, cmap='viridis', vmin=200, vmax=300)
+    rgba = composite(rgba, alpha, color=(0, 0, 0))
+"""
+import collections
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+cache_size = 16
+_cache = collections.OrderedDict()
+
+
+def overlay_key(crs, extent, shape, **options):
+    """
+    hash identifying a (projection, extent, image shape, style) combination
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(crs.proj4_init.encode())
+    digest.update(str(tuple(float(value) for value in extent)).encode())
+    digest.update(str(tuple(shape)).encode())
+    digest.update(str(sorted(options.items())).encode())
+    return digest.hexdigest()
+
+
+def render_mask(
+    crs,
+    extent,
+    shape,
+    coastlines=True,
+    gridlines=True,
+    scale="coarse",
+    linewidth=1.0,
+    dpi=100,
+):
+    """
+    rasterize coastlines and gridlines without the cache
+
+    Parameters
+    ----------
+
+    crs: cartopy.crs.Projection
+
+    extent: sequence
+       [xleft, xright, ybot, ytop] in map coordinates, as for ax.set_extent
+
+    shape: tuple
+       (rows, cols) of the images the mask will be composited onto
+
+    coastlines, gridlines: bool
+       which layers to draw
+
+    scale: str
+       GSHHS resolution: 'coarse', 'low', 'intermediate', 'high' or 'full'
+
+    linewidth: float
+       in pixels
+
+    Returns
+    -------
+
+    alpha: uint8 array of shape (rows, cols)
+       255 on the lines, 0 elsewhere, antialiased in between
+    """
+    import cartopy.feature
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    rows, cols = shape
+    points = 72.0 / dpi
+    with instrument.span("render_overlay"):
+        fig = Figure(figsize=(cols / dpi, rows / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        ax = fig.add_axes([0, 0, 1, 1], projection=crs)
+        ax.patch.set_visible(False)
+        ax.spines["geo"].set_visible(False)
+        #
+        # set the limits directly so map coordinates line up with the
+        # image pixels, with no aspect ratio adjustment
+        #
+        ax.set_xlim(extent[0], extent[1])
+        ax.set_ylim(extent[2], extent[3])
+        ax.set_aspect("auto")
+        if coastlines:
+            ax.add_feature(
+                cartopy.feature.GSHHSFeature(
+                    scale=scale,
+                    levels=[1, 2, 3],
+                    facecolor="none",
+                    edgecolor="black",
+                    linewidth=linewidth * points,
+                )
+            )
+        if gridlines:
+            ax.gridlines(color="black", linewidth=linewidth * points)
+        canvas.draw()
+        alpha = np.asarray(canvas.buffer_rgba())[..., 3].copy()
+    return alpha
+
+
+def overlay_mask(crs, extent, shape, cache_dir=None, **options):
+    """
+    cached version of render_mask.  The in-memory cache holds the last
+    ``cache_size`` masks; with cache_dir they are also saved to and
+    loaded from that folder, keyed by overlay_key.  options are passed
+    to render_mask
+    """
+    key = overlay_key(crs, extent, shape, **options)
+    if key in _cache:
+        _cache.move_to_end(key)
+        instrument.count("overlay_cache_hits")
+        return _cache[key]
+    alpha = None
+    if cache_dir is not None:
+        cache_file = Path(cache_dir) / f"overlay_{key}.npz"
+        if cache_file.exists():
+            with np.load(cache_file) as npz:
+                alpha = npz["alpha"]
+            instrument.count("overlay_cache_hits")
+    if alpha is None:
+        instrument.count("overlay_cache_misses")
+        alpha = render_mask(crs, extent, shape, **options)
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(cache_file, alpha=alpha)
+    alpha.setflags(write=False)
+    _cache[key] = alpha
+    while len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    return alpha
+
+
+def overlay_for_area(area_def, cache_dir=None, **options):
+    """
+    overlay_mask for images resampled onto a pyresample AreaDefinition
+    """
+    crs = area_def.to_cartopy_crs()
+    x_min, y_min, x_max, y_max = area_def.area_extent
+    return overlay_mask(
+        crs, [x_min, x_max, y_min, y_max], area_def.shape, cache_dir, **options
+    )
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def colorize(image, cmap="viridis", vmin=None, vmax=None, bad=(0, 0, 0, 0)):
+    """
+    map a 2-d float image to rgba uint8 through a 256 entry lookup table
+
+    Parameters
+    ----------
+
+    image: array of shape (rows, cols)
+       NaN where there is no data
+
+    cmap: str or matplotlib colormap
+
+    vmin, vmax: optional float
+       color limits, default the finite min/max of image
+
+    bad: tuple
+       rgba color for NaN pixels
+
+    Returns
+    -------
+
+    rgba: uint8 array of shape (rows, cols, 4)
+    """
+    import matplotlib
+
+    if isinstance(cmap, str):
+        cmap = matplotlib.colormaps[cmap]
+    table = np.empty((257, 4), dtype=np.uint8)
+    table[:256] = np.round(cmap(np.linspace(0.0, 1.0, 256)) * 255)
+    table[256] = bad
+    image = np.asarray(image, dtype=np.float32)
+    if vmin is None:
+        vmin = float(np.nanmin(image))
+    if vmax is None:
+        vmax = float(np.nanmax(image))
+    scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+    with np.errstate(invalid="ignore"):
+        index = np.clip((image - vmin) * scale, 0, 255)
+    index = np.where(np.isnan(index), 256, index).astype(np.intp)
+    return table[index]
+
+
+def composite(rgba, alpha, color=(0, 0, 0), out=None):
+    """
+    blend a line color onto an rgb or rgba uint8 image using an overlay
+    mask as the opacity
+
+    Parameters
+    ----------
+
+    rgba: uint8 array of shape (rows, cols, 3 or 4)
+
+    alpha: uint8 array of shape (rows, cols)
+       from overlay_mask
+
+    color: tuple
+       rgb line color, 0-255
+
+    out: optional uint8 array
+       written in place (may be rgba itself)
+
+    Returns
+    -------
+
+    out: uint8 array like rgba, fully opaque where the lines are
+    """
+    if rgba.shape[:2] != alpha.shape:
+        raise ValueError(f"image shape {rgba.shape[:2]} != overlay {alpha.shape}")
+    if out is None:
+        out = rgba.copy()
+    weight = alpha.astype(np.uint16)[..., np.newaxis]
+    color = np.asarray(color, dtype=np.uint16)
+    blended = rgba[..., :3] * (255 - weight) + color * weight
+    out[..., :3] = (blended + 127) // 255
+    if out.shape[-1] == 4:
+        np.maximum(out[..., 3], alpha, out=out[..., 3])
+    return out
@@ -0,0 +1,667 @@
+"""
+  satcode.pipeline
+  ________________
+
+  builds the notebook chain
+
+    download -> parseMeta -> read lat/lon -> SwathDefinition -> resample -> write
+
+  as a lazy dask graph, one small graph per granule, combined across
+  granules so a month of data runs on all cores of one machine.
+
+  Each band of a granule is read, calibrated, resampled and written by
+  its own task, sharing one resampling-weights task per granule (see
+  satcode.resample for the nearest/bilinear/gaussian/ewa methods), and the
+  results go straight to disk.  Only file names flow back to the caller,
+  so memory is bounded by (number of workers) x (one band of one granule).
+
+  MODIS hdf4 can't be read from several threads at once, so the default
+  scheduler is a process pool.
+
+  to run from the command line::
+
+    python -m satcode.pipeline MYD021KM.A2013222.2105.061.2018047235850.hdf --bands 31 32 --out_folder=../data/resampled --workers 4
+
+  GOES ABI files and Landsat scene folders can be mixed in (see
+  satcode.readers); each file only writes the bands it has::
+
+    python -m satcode.pipeline MYD021KM.A2013222.2105.061.2018047235850.hdf OR_ABI-L1b-RadC-M6C13_G16_s2019208*.nc --bands 31 C13
+
+  to run from a python script::
+
+    from satcode.pipeline import build_graph, run
+    graph = build_graph(filenames, bands=['31', '32'], out_folder='resampled')
+    outputs = run(graph, workers=8, report='profile.jsonl')
+"""
+import argparse
+import json
+import os
+import warnings
+from pathlib import Path
+
+import dask
+import numpy as np
+
+from satcode import instrument
+
+default_root = "https://clouds.eos.ubc.ca/~phil/courses/atsc301/downloads"
+result_formats = {"npz": ".npz", "cog": ".tif"}
+result_keys = ["filename", "startdate", "starttime"]
+
+
+def fetch(filename, root=default_root, dest_folder=None):
+    """
+    download filename unless it is already a local file,
+    and return its local path
+    """
+    from satcode.data_read import download
+
+    filename = Path(filename)
+    if filename.exists():
+        return filename
+    dest_path = Path() if dest_folder is None else Path(dest_folder)
+    download(filename.name, root=root, dest_folder=dest_path)
+    return dest_path / filename.name
+
+
+def read_meta(path):
+    from satcode.modismeta_read import parseMeta
+
+    return parseMeta(path)
+
+
+def geolocation_file(path):
+    """
+    the MYD03/MOD03 file for the same granule, if it sits next to the
+    level1b file, otherwise None
+    """
+    path = Path(path)
+    parts = path.name.split(".")
+    if len(parts) < 4:
+        return None
+    geo_product = parts[0][:3] + "03"
+    matches = sorted(path.parent.glob(f"{geo_product}.{parts[1]}.{parts[2]}.*.hdf"))
+    return matches[0] if matches else None
+
+
+def read_geolocation(path, window=None):
+    """
+    Parameters
+    ----------
+
+    path: str or Path
+       level1b file
+
+    window: optional tuple
+       (row_start, row_stop, col_start, col_stop) in the geolocation
+       grid, to read only part of the swath (see satcode.roi)
+
+    Returns
+    -------
+
+    lons, lats: float32 arrays
+       full resolution from the matching MYD03 file if there is one,
+       otherwise the 5 km Latitude/Longitude from the level1b file
+
+    stride: int
+       1 for full resolution, 5 if the band data must be subsampled
+    """
+    from pyhdf.SD import SD, SDC
+
+    geo_path = geolocation_file(path)
+    stride = 1 if geo_path is not None else 5
+    source = geo_path if geo_path is not None else path
+    with instrument.span("read_geolocation", stride=stride) as the_span:
+        the_file = SD(str(source), SDC.READ)
+        if window is None:
+            lats = the_file.select("Latitude").get()
+            lons = the_file.select("Longitude").get()
+        else:
+            row0, row1, col0, col1 = window
+            start, count = (row0, col0), (row1 - row0, col1 - col0)
+            lats = the_file.select("Latitude").get(start=start, count=count)
+            lons = the_file.select("Longitude").get(start=start, count=count)
+        the_file.end()
+        the_span.add("bytes_read", lats.nbytes + lons.nbytes)
+    return lons, lats, stride
+
+
+def read_band(path, band, stride=1, window=None):
+    """
+    read one band from a level1b file and convert counts to radiance
+    (float32, NaN where the counts are fill or out of valid_range)
+
+    Parameters
+    ----------
+
+    path: str or Path
+       level1b hdf4 file
+
+    band: str
+       MODIS band name as in the band_names attribute, e.g. '31' or '13lo'
+
+    stride: int
+       take every stride-th pixel starting at stride//2, to match the
+       5 km geolocation when stride is 5
+
+    window: optional tuple
+       (row_start, row_stop, col_start, col_stop) in the geolocation grid
+       (so in 5 km pixels when stride is 5); only that part of the band is
+       read from the file
+    """
+    from pyhdf.SD import SD, SDC
+
+    the_file = SD(str(path), SDC.READ)
+    for name in the_file.datasets().keys():
+        if not name.startswith("EV_"):
+            continue
+        sds = the_file.select(name)
+        attrs = sds.attributes()
+        band_names = attrs["band_names"].split(",")
+        if band not in band_names:
+            continue
+        index = band_names.index(band)
+        with instrument.span("read_band", band=band) as the_span:
+            if window is None:
+                counts = sds[index]
+            else:
+                row0, row1, col0, col1 = window
+                offset = stride // 2
+                counts = sds.get(
+                    start=(index, row0 * stride + offset, col0 * stride + offset),
+                    count=(1, row1 - row0, col1 - col0),
+                    stride=(1, stride, stride),
+                )[0]
+            the_span.add("bytes_read", counts.nbytes)
+        the_file.end()
+        if stride > 1 and window is None:
+            start = stride // 2
+            counts = counts[start::stride, start::stride]
+        low, high = attrs["valid_range"]
+        radiance = counts.astype(np.float32)
+        radiance -= np.float32(attrs["radiance_offsets"][index])
+        radiance *= np.float32(attrs["radiance_scales"][index])
+        radiance[(counts < low) | (counts > high)] = np.nan
+        return radiance
+    the_file.end()
+    raise KeyError(f"band {band} not found in {path}")
+
+
+def plan_area(meta, lons, lats, proj_params=None):
+    """
+    target area for one granule: LAEA centred on the granule unless
+    proj_params are given.  The extent comes from the G-ring and the
+    decimated swath outline (satcode.area_plan), or the outline of the
+    finite pixels for a grid with off-earth corners (GOES); if a sample
+    of the swath falls outside it, fall back to projecting every pixel
+    """
+    from pyresample import SwathDefinition
+    from satcode import area_plan
+
+    if proj_params is None:
+        proj_params = area_plan.default_projection(meta)
+    if np.isfinite(lons).all() and np.isfinite(lats).all():
+        boundary_lons, boundary_lats = area_plan.swath_boundary(lons, lats)
+    else:
+        boundary_lons, boundary_lats = area_plan.finite_boundary(lons, lats)
+    area_def = area_plan.plan_area(
+        boundary_lons, boundary_lats, meta=meta, proj_params=proj_params
+    )
+    if area_plan.check_coverage(area_def, lons, lats) == 0.0:
+        return area_def
+    with instrument.span("plan_area_full"):
+        swath_def = SwathDefinition(lons, lats)
+        return swath_def.compute_optimal_bb_area(proj_dict=proj_params)
+
+
+def weights(lons, lats, stride, area_def, method="nearest", radius_of_influence=5000):
+    """
+    sparse resampling weights, computed once per granule and shared by
+    all bands.  With full resolution geolocation (stride 1) the bow-tie
+    duplicates are dropped first
+    """
+    from pyresample import SwathDefinition
+    from satcode.resample import compute_weights
+
+    swath_def = SwathDefinition(lons, lats)
+    if method == "ewa":
+        return compute_weights(swath_def, area_def, method)
+    return compute_weights(
+        swath_def,
+        area_def,
+        method,
+        deduplicate=stride == 1,
+        radius_of_influence=radius_of_influence,
+    )
+
+
+def roi_window(path, roi):
+    """
+    satcode.roi.find_window, raising ValueError if the granule misses
+    the region
+    """
+    from satcode.roi import find_window
+
+    window = find_window(path, **roi)
+    if window is None:
+        raise ValueError(f"{path} does not cover the region of interest {roi}")
+    return window
+
+
+def resample_band(radiance, the_weights):
+    return the_weights.apply(radiance)
+
+
+def write_result(image, area_def, meta, band, out_folder, fmt="npz"):
+    """
+    save image plus enough of the area definition to rebuild it
+    (see load_result) in a compressed .npz file, or as a cloud optimized
+    GeoTIFF (satcode.cog) when fmt is 'cog'
+
+    Returns
+    -------
+
+    out_path: Path
+    """
+    stem = f"{Path(meta['filename']).stem}_b{band}"
+    out_path = Path(out_folder) / (stem + result_formats[fmt])
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "cog":
+        from satcode.cog import write_cog
+
+        tags = {key: meta[key] for key in result_keys}
+        write_cog(image, area_def, out_path, tags=tags)
+        return out_path
+    with instrument.span("write_result"):
+        np.savez_compressed(
+            out_path,
+            image=np.asarray(image, dtype=np.float32),
+            crs_wkt=area_def.crs.to_wkt(),
+            area_extent=np.array(area_def.area_extent),
+            meta=json.dumps({key: meta[key] for key in result_keys}),
+        )
+    return out_path
+
+
+def load_result(path):
+    """
+    read a .npz or .tif file written by write_result
+
+    Returns
+    -------
+
+    image: float32 array
+    area_def: pyresample AreaDefinition
+    meta: dict
+    """
+    from pyresample.geometry import AreaDefinition
+
+    if Path(path).suffix == result_formats["cog"]:
+        import rasterio
+        from satcode.cog import read_cog
+
+        image, area_def = read_cog(path)
+        with rasterio.open(str(path)) as src:
+            tags = src.tags()
+        return image, area_def, {key: tags[key] for key in result_keys}
+    with np.load(path) as npz:
+        image = npz["image"]
+        rows, cols = image.shape
+        area_def = AreaDefinition(
+            "result",
+            "resampled granule",
+            "result",
+            str(npz["crs_wkt"]),
+            cols,
+            rows,
+            tuple(npz["area_extent"]),
+        )
+        meta = json.loads(str(npz["meta"]))
+    return image, area_def, meta
+
+
+def granule_graph(
+    filename,
+    bands=("31",),
+    out_folder=".",
+    root=default_root,
+    dest_folder=None,
+    proj_params=None,
+    method="nearest",
+    radius_of_influence=5000,
+    fmt="npz",
+    roi=None,
+):
+    """
+    lazy graph for one granule
+
+    roi: optional dict
+       bbox=... or point=..., radius_km=... (see satcode.roi); only the
+       swath window covering the region is read and resampled, onto a
+       grid planned around the region
+
+    Returns
+    -------
+
+    outputs: dask.delayed
+       computes to the list of .npz (or .tif for fmt='cog') files
+       written, one per band
+    """
+    delayed = dask.delayed
+    path = delayed(fetch, pure=True)(filename, root, dest_folder)
+    meta = delayed(read_meta, pure=True)(path)
+    window = None
+    if roi is not None:
+        window = delayed(roi_window, pure=True)(path, roi)
+    geo = delayed(read_geolocation, pure=True, nout=3)(path, window)
+    lons, lats, stride = geo
+    if roi is None:
+        area_def = delayed(plan_area, pure=True)(meta, lons, lats, proj_params)
+    else:
+        from satcode.roi import roi_area
+
+        area_def = delayed(roi_area, pure=True)(lons, lats, proj_params, **roi)
+    the_weights = delayed(weights, pure=True)(
+        lons, lats, stride, area_def, method, radius_of_influence
+    )
+    outputs = []
+    for band in bands:
+        radiance = delayed(read_band, pure=True)(path, band, stride, window)
+        image = delayed(resample_band, pure=True)(radiance, the_weights)
+        outputs.append(
+            delayed(write_result, pure=True)(
+                image, area_def, meta, band, out_folder, fmt
+            )
+        )
+    return delayed(list)(outputs)
+
+
+def reader_graph(
+    filename,
+    bands=("31",),
+    out_folder=".",
+    proj_params=None,
+    method="nearest",
+    radius_of_influence=5000,
+    fmt="npz",
+):
+    """
+    lazy graph for a local granule or scene of any sensor in
+    satcode.readers.  Swaths are resampled like granule_graph; gridded
+    data (Landsat, GOES) is written on its own grid unless proj_params
+    are given.  Only the bands the reader has are written (all of them
+    if bands is None), with a warning for the others; ValueError if it
+    has none of them.  The reader's chunked band and geolocation arrays
+    go into the graph as they are, one read task per chunk
+
+    Returns
+    -------
+
+    outputs: dask.delayed
+       computes to the list of files written, one per band
+    """
+    from satcode.readers import open_granule
+
+    delayed = dask.delayed
+    reader = open_granule(filename)
+    names = reader.band_names()
+    if bands is not None:
+        names = _check_bands(filename, reader.name, bands, names)
+    meta = delayed(reader.metadata, pure=True)()
+    if reader.kind == "grid" and proj_params is None:
+        area_def = delayed(reader.area, pure=True)()
+        the_weights = None
+    else:
+        #
+        # one delayed for the pair, so both arrays come from one read of
+        # each chunk, shared by plan_area and weights
+        #
+        lons, lats = delayed(reader.geolocation(), nout=2)
+        area_def = delayed(plan_area, pure=True)(meta, lons, lats, proj_params)
+        the_weights = delayed(weights, pure=True)(
+            lons, lats, reader.stride, area_def, method, radius_of_influence
+        )
+    outputs = []
+    for band in names:
+        image = reader.band(band)
+        if the_weights is not None:
+            image = delayed(resample_band, pure=True)(image, the_weights)
+        outputs.append(
+            delayed(write_result, pure=True)(
+                image, area_def, meta, band, out_folder, fmt
+            )
+        )
+    return delayed(list)(outputs)
+
+
+def _check_bands(filename, reader, bands, available):
+    """
+    the requested bands a file has, warning about the rest; ValueError
+    if it has none of them.  The warning names the reader, not the file,
+    so python shows it once for a run of files of the same sensor
+    """
+    found = [band for band in bands if band in available]
+    if not found:
+        raise ValueError(
+            f"{Path(filename).name} has none of the bands {list(bands)}; "
+            f"it has {list(available)}"
+        )
+    missing = [band for band in bands if band not in available]
+    if missing:
+        warnings.warn(f"{reader} files have no band {', '.join(missing)}")
+    return found
+
+
+def build_graph(filenames, **kwargs):
+    """
+    one graph per file, gathered into a single delayed list of lists.
+    MODIS level1b files go through granule_graph (downloading them if
+    needed), files that another satcode.readers reader recognizes (Landsat
+    scenes, GOES ABI) through reader_graph.  kwargs are passed on to
+    granule_graph, and the ones it shares with reader_graph to that,
+    with a warning naming the ones set away from their defaults (root,
+    roi ...) that reader_graph ignores;
+    each file gets only the bands it has (see _check_bands)
+    """
+    import inspect
+
+    from satcode.readers import ModisL1bReader, reader_for
+
+    parameters = inspect.signature(granule_graph).parameters
+    unknown = set(kwargs) - set(parameters)
+    if unknown:
+        raise ValueError(f"build_graph got unexpected arguments {sorted(unknown)}")
+    shared = ["bands", "out_folder", "proj_params", "method", "radius_of_influence"]
+    ignored = sorted(
+        key
+        for key, value in kwargs.items()
+        if key not in shared + ["fmt"] and value != parameters[key].default
+    )
+    graphs = []
+    for name in filenames:
+        try:
+            reader = reader_for(name).name
+        except ValueError:
+            reader = None
+        if reader in (None, "modis_l1b"):
+            modis_kwargs = dict(kwargs)
+            if "bands" in kwargs:
+                modis_kwargs["bands"] = _check_bands(
+                    name, "modis_l1b", kwargs["bands"], ModisL1bReader.known_bands
+                )
+            graphs.append(granule_graph(name, **modis_kwargs))
+            continue
+        if ignored:
+            warnings.warn(f"{reader} files ignore {', '.join(ignored)}")
+        reader_kwargs = {key: kwargs[key] for key in shared if key in kwargs}
+        reader_kwargs["fmt"] = kwargs.get("fmt", "npz")
+        graphs.append(reader_graph(name, **reader_kwargs))
+    return dask.delayed(list)(graphs)
+
+
+def run(graph, workers=None, scheduler="processes", report=None, progress=True):
+    """
+    compute a graph from build_graph
+
+    Parameters
+    ----------
+
+    graph: dask.delayed
+
+    workers: optional int
+       defaults to the number of cores
+
+    scheduler: str
+       'processes' (safe for pyhdf), 'threads' or 'synchronous'
+
+    report: optional str or Path
+       write one json line per task (key, function, start, end, worker)
+       plus a per-function summary to the screen
+
+    progress: bool
+       show a dask progress bar
+
+    Returns
+    -------
+
+    outputs: list of lists of Path
+    """
+    from dask.diagnostics import ProgressBar, Profiler, ResourceProfiler
+
+    workers = workers or os.cpu_count()
+    callbacks = []
+    if progress:
+        callbacks.append(ProgressBar())
+    profiler, resources = None, None
+    if report:
+        profiler = Profiler()
+        callbacks.append(profiler)
+        try:
+            import psutil  # noqa: F401 -- needed by ResourceProfiler
+
+            resources = ResourceProfiler(dt=0.5)
+            callbacks.append(resources)
+        except ImportError:
+            print("psutil not installed, skipping memory/cpu tracking")
+    with dask.config.set(scheduler=scheduler, num_workers=workers):
+        for callback in callbacks:
+            callback.register()
+        try:
+            (outputs,) = dask.compute(graph)
+        finally:
+            for callback in callbacks:
+                callback.unregister()
+    if report:
+        _write_report(report, profiler.results, resources.results if resources else [])
+    return outputs
+
+
+def _write_report(report, tasks, resources):
+    from dask.utils import key_split
+
+    totals = {}
+    with open(report, "w") as f:
+        for task in tasks:
+            func = key_split(task.key)
+            seconds = task.end_time - task.start_time
+            item = totals.setdefault(func, [0, 0.0])
+            item[0] += 1
+            item[1] += seconds
+            f.write(
+                json.dumps(
+                    dict(
+                        key=str(task.key),
+                        function=func,
+                        start=task.start_time,
+                        end=task.end_time,
+                        worker=task.worker_id,
+                    )
+                )
+                + "\n"
+            )
+    print(f"{'task':24s} {'count':>6s} {'total s':>10s}")
+    for func, (ntasks, seconds) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        print(f"{func:24s} {ntasks:6d} {seconds:10.3f}")
+    if resources:
+        peak_mem = max(item.mem for item in resources)
+        peak_cpu = max(item.cpu for item in resources)
+        print(f"peak memory {peak_mem:.1f} MB, peak cpu {peak_cpu:.0f}%")
+    print(f"task profile written to {report}")
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument(
+        "filenames",
+        type=str,
+        nargs="+",
+        help="level1b granules, or any file or scene folder satcode.readers knows",
+    )
+    parser.add_argument(
+        "--bands",
+        nargs="+",
+        default=["31"],
+        help="band names, e.g. 31 for MODIS, C13 for GOES, nir for Landsat",
+    )
+    parser.add_argument("--out_folder", type=str, default=".")
+    parser.add_argument(
+        "--method",
+        choices=["nearest", "bilinear", "gaussian", "ewa"],
+        default="nearest",
+    )
+    parser.add_argument("--format", choices=list(result_formats), default="npz")
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        default=None,
+        help="region of interest: lon_min lat_min lon_max lat_max",
+    )
+    parser.add_argument(
+        "--point", type=float, nargs=2, default=None, help="region of interest: lon lat"
+    )
+    parser.add_argument("--radius", type=float, default=None, help="km around --point")
+    parser.add_argument("--root", type=str, default=default_root)
+    parser.add_argument("--dest_folder", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--scheduler",
+        choices=["processes", "threads", "synchronous"],
+        default="processes",
+    )
+    parser.add_argument("--report", type=str, default=None, help="task profile jsonl")
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    roi = None
+    if args.bbox is not None or args.point is not None:
+        roi = dict(bbox=args.bbox, point=args.point, radius_km=args.radius)
+    graph = build_graph(
+        args.filenames,
+        bands=args.bands,
+        out_folder=args.out_folder,
+        method=args.method,
+        fmt=args.format,
+        root=args.root,
+        dest_folder=args.dest_folder,
+        roi=roi,
+    )
+    outputs = run(
+        graph, workers=args.workers, scheduler=args.scheduler, report=args.report
+    )
+    for files in outputs:
+        for name in files:
+            print(name)
+
+
+if __name__ == "__main__":
+    main()
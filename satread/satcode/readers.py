@@ -0,0 +1,629 @@
+"""
+  satcode.readers
+  _______________
+
+  a registry of granule readers with one lazy interface for MODIS
+  level1b (pyhdf), Landsat Level-1 scenes (rasterio) and GOES ABI L1b
+  (netCDF4), so batch pipelines can mix sensors and run them all on the
+  same scheduler (see satcode.pipeline.reader_graph).
+
+  Every reader has
+
+  * metadata(): a dict with at least filename, instrument, platform,
+    start, stop (datetime64), startdate, starttime (strings) and the
+    footprint (lon_list, lat_list, lon_0, lat_0)
+  * band_names(), and band(name) / bands(names) as chunked dask arrays
+    of calibrated float32, each chunk read from the file only when it is
+    computed
+  * geolocation(): lons, lats as chunked dask arrays on the band grid
+  * area(): a pyresample AreaDefinition for gridded data (Landsat, GOES)
+    or a SwathDefinition for swaths (MODIS)
+
+  Metadata and band lists are kept in one shared cache keyed by file and
+  modification time, and every chunk read is an instrument span, so the
+  profiles of satcode.pipeline.run look the same for every sensor.
+
+  New readers subclass GranuleReader and are added with @register.
+
+  to run from the command line::
+
+    python -m satcode.readers ../data/MYD021KM.A2013222.2105.061.2018047235850.hdf ../data/before_image
+
+  to run from a python script::
+
+    from satcode.readers import open_granule
+    reader = open_granule('OR_ABI-L1b-RadC-M6C13_G16_s20192081801000_e20192081806000_c20192081806000.nc')
+    bt = reader.band('C13', calibration='brightness_temperature').compute()
+"""
+import argparse
+import collections
+import re
+import threading
+from pathlib import Path
+
+import dask
+import dask.array as da
+import numpy as np
+
+from satcode import instrument
+
+registry = {}
+cache_size = 256
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+#
+# neither the hdf4 nor the netcdf4/hdf5 library is thread safe, so
+# chunk reads are serialized within a process
+#
+_read_lock = threading.Lock()
+
+
+def register(cls):
+    """class decorator adding a GranuleReader to the registry"""
+    registry[cls.name] = cls
+    return cls
+
+
+def reader_for(path):
+    """the registered reader class that recognizes path"""
+    for cls in registry.values():
+        if cls.matches(path):
+            return cls
+    raise ValueError(f"no reader for {path}; registered: {list(registry)}")
+
+
+def open_granule(path, reader=None):
+    """
+    a reader instance for path, by name (a key of registry) or detected
+    from the file name
+    """
+    cls = registry[reader] if reader is not None else reader_for(path)
+    return cls(path)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _window_blocks(shape, chunks):
+    """(row_start, row_stop, col_start, col_stop) of each chunk, row by row"""
+    row_chunks, col_chunks = da.core.normalize_chunks(chunks, shape)
+    row_starts = np.cumsum((0,) + row_chunks)
+    col_starts = np.cumsum((0,) + col_chunks)
+    return [
+        [
+            (
+                int(row_starts[i]),
+                int(row_starts[i + 1]),
+                int(col_starts[j]),
+                int(col_starts[j + 1]),
+            )
+            for j in range(len(col_chunks))
+        ]
+        for i in range(len(row_chunks))
+    ]
+
+
+class GranuleReader:
+    """
+    base class: subclasses set name, kind ('swath' or 'grid') and
+    calibrations, and implement matches, _read_metadata, _band_names,
+    shape, _read_block and _read_geolocation_block
+    """
+
+    name = None
+    kind = "grid"
+    calibrations = ("radiance",)
+    #
+    # subsampling of the band data to the geolocation grid, see
+    # satcode.pipeline.weights; None for gridded data
+    #
+    stride = None
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self.path)!r})"
+
+    @classmethod
+    def matches(cls, path):
+        raise NotImplementedError
+
+    def _cached(self, key, compute):
+        """compute() once per file version, in the shared LRU cache"""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        cache_key = (self.name, str(self.path.resolve()), mtime, key)
+        with _cache_lock:
+            if cache_key in _cache:
+                _cache.move_to_end(cache_key)
+                return _cache[cache_key]
+        value = compute()
+        with _cache_lock:
+            _cache[cache_key] = value
+            while len(_cache) > cache_size:
+                _cache.popitem(last=False)
+        return value
+
+    def metadata(self):
+        def compute():
+            meta = self._read_metadata()
+            if "lon_list" not in meta:
+                meta.update(self._footprint())
+            return meta
+
+        return dict(self._cached("metadata", compute))
+
+    def band_names(self):
+        return list(self._cached("band_names", self._band_names))
+
+    def default_chunks(self):
+        return (1024, 1024)
+
+    def _footprint(self):
+        """
+        corners and centre from the geolocation of five pixels; corners
+        off the earth (GOES full disk) are NaN
+        """
+        rows, cols = self.shape()
+        pixels = [
+            (0, 0),
+            (0, cols - 1),
+            (rows - 1, cols - 1),
+            (rows - 1, 0),
+            (rows // 2, cols // 2),
+        ]
+        lons, lats = [], []
+        for row, col in pixels:
+            lon, lat = self._read_geolocation_block((row, row + 1, col, col + 1))
+            lons.append(float(lon[0, 0]))
+            lats.append(float(lat[0, 0]))
+        return dict(lon_list=lons[:4], lat_list=lats[:4], lon_0=lons[4], lat_0=lats[4])
+
+    def _traced_block(self, band, window, calibration):
+        with instrument.span("reader_read", reader=self.name, band=band) as the_span:
+            block = self._read_block(band, window, calibration)
+            the_span.add("bytes_read", block.nbytes)
+        return block
+
+    def _traced_geolocation(self, window):
+        with instrument.span("reader_geolocation", reader=self.name) as the_span:
+            lons, lats = self._read_geolocation_block(window)
+            the_span.add("bytes_read", lons.nbytes + lats.nbytes)
+        return np.stack([lons, lats])
+
+    def band(self, name, chunks=None, calibration=None):
+        """
+        one band as a lazy float32 dask array with NaN fill, one file
+        read per chunk
+        """
+        if name not in self.band_names():
+            raise KeyError(f"band {name} not in {self.path}: {self.band_names()}")
+        calibration = calibration or self.calibrations[0]
+        if calibration not in self.calibrations:
+            raise ValueError(f"calibration must be one of {self.calibrations}")
+        blocks = _window_blocks(self.shape(), chunks or self.default_chunks())
+        read = dask.delayed(self._traced_block, pure=True)
+        return da.block(
+            [
+                [
+                    da.from_delayed(
+                        read(name, window, calibration),
+                        shape=(window[1] - window[0], window[3] - window[2]),
+                        dtype=np.float32,
+                    )
+                    for window in row
+                ]
+                for row in blocks
+            ]
+        )
+
+    def bands(self, names=None, chunks=None, calibration=None):
+        names = self.band_names() if names is None else names
+        return {name: self.band(name, chunks, calibration) for name in names}
+
+    def geolocation(self, chunks=None):
+        """lons, lats as lazy float64 dask arrays on the band grid"""
+        blocks = _window_blocks(self.shape(), chunks or self.default_chunks())
+        read = dask.delayed(self._traced_geolocation, pure=True)
+        stacked = da.block(
+            [
+                [
+                    da.from_delayed(
+                        read(window),
+                        shape=(2, window[1] - window[0], window[3] - window[2]),
+                        dtype=np.float64,
+                    )
+                    for window in row
+                ]
+                for row in blocks
+            ]
+        )
+        return stacked[0], stacked[1]
+
+    def area(self):
+        """SwathDefinition from the computed geolocation"""
+        from pyresample import SwathDefinition
+
+        lons, lats = dask.compute(*self.geolocation(), scheduler="synchronous")
+        return SwathDefinition(lons, lats)
+
+
+@register
+class ModisL1bReader(GranuleReader):
+    """
+    MODIS MYD021KM/MOD021KM (and HKM, QKM) hdf4 files, with the MYD03 file
+    next to it for full resolution geolocation (see
+    satcode.pipeline.read_geolocation); bands are radiance, subsampled to
+    the 5 km geolocation grid when there is no MYD03 file
+    """
+
+    name = "modis_l1b"
+    kind = "swath"
+    calibrations = ("radiance",)
+    #
+    # every band of a 1 km file, so band lists can be checked before
+    # the file is downloaded
+    #
+    known_bands = (
+        [str(number) for number in range(1, 13)]
+        + ["13lo", "13hi", "14lo", "14hi"]
+        + [str(number) for number in range(15, 37)]
+    )
+    _pattern = re.compile(r"M[OY]D02(1KM|HKM|QKM)\..*\.hdf$")
+
+    def __init__(self, path):
+        from satcode.pipeline import geolocation_file
+
+        super().__init__(path)
+        self.geo_path = geolocation_file(self.path)
+        self.stride = 1 if self.geo_path is not None else 5
+
+    @classmethod
+    def matches(cls, path):
+        return cls._pattern.match(Path(path).name) is not None
+
+    def _read_metadata(self):
+        from satcode.modismeta_read import parseMeta
+
+        meta = parseMeta(self.path)
+        meta["instrument"] = "modis"
+        meta["platform"] = "Aqua" if meta["filename"].startswith("MYD") else "Terra"
+        return meta
+
+    def _band_names(self):
+        from pyhdf.SD import SD, SDC
+
+        with _read_lock:
+            the_file = SD(str(self.path), SDC.READ)
+            names = []
+            for name in sorted(the_file.datasets()):
+                if name.startswith("EV_"):
+                    attrs = the_file.select(name).attributes()
+                    names.extend(attrs["band_names"].split(","))
+            the_file.end()
+        return names
+
+    def shape(self):
+        def compute():
+            from pyhdf.SD import SD, SDC
+
+            source = self.geo_path if self.geo_path is not None else self.path
+            with _read_lock:
+                the_file = SD(str(source), SDC.READ)
+                shape = tuple(the_file.select("Latitude").info()[2])
+                the_file.end()
+            return shape
+
+        return self._cached("shape", compute)
+
+    def default_chunks(self):
+        #
+        # whole scans, about 200 km along track
+        #
+        return (200 // self.stride, -1)
+
+    def _read_block(self, band, window, calibration):
+        from satcode.pipeline import read_band
+
+        with _read_lock:
+            return read_band(self.path, band, self.stride, window)
+
+    def _read_geolocation_block(self, window):
+        from satcode.pipeline import read_geolocation
+
+        with _read_lock:
+            lons, lats, _ = read_geolocation(self.path, window)
+        return lons.astype(np.float64), lats.astype(np.float64)
+
+
+@register
+class LandsatReader(GranuleReader):
+    """
+    Landsat Level-1 scene folder or _MTL.txt file (satcode.landsat);
+    bands are named as in satcode.landsat.band_numbers (red, nir,
+    thermal ...) and calibrated to top of atmosphere reflectance, or
+    brightness temperature in kelvin for the thermal band
+    """
+
+    name = "landsat_l1"
+    kind = "grid"
+    calibrations = ("reflectance",)
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._scene = None
+
+    @classmethod
+    def matches(cls, path):
+        path = Path(path)
+        if path.name.endswith("_MTL.txt"):
+            return True
+        return path.is_dir() and any(path.glob("*_MTL.txt"))
+
+    @property
+    def scene(self):
+        from satcode.landsat import LandsatScene
+
+        if self._scene is None:
+            self._scene = LandsatScene(self.path)
+        return self._scene
+
+    def _read_metadata(self):
+        from satcode.landsat import find_key
+        from satcode.modismeta_read import parse_time
+
+        mtl = self.scene.mtl
+        date = str(find_key(mtl, "DATE_ACQUIRED"))
+        time = str(find_key(mtl, "SCENE_CENTER_TIME")).rstrip("Z")[:15]
+        start = parse_time(date, time)
+        return dict(
+            filename=self.scene.mtl_file.name,
+            instrument=self.scene.sensor,
+            platform=str(find_key(mtl, "SPACECRAFT_ID")),
+            start=start,
+            stop=start,
+            startdate=date,
+            starttime=time,
+            sun_elevation=self.scene.sun_elevation,
+        )
+
+    def _band_names(self):
+        from satcode.landsat import band_numbers
+
+        return [
+            name
+            for name, number in band_numbers[self.scene.sensor].items()
+            if number in self.scene.band_files
+        ]
+
+    def shape(self):
+        return self._cached("shape", lambda: self.scene.shape)
+
+    def _read_block(self, band, window, calibration):
+        import rasterio
+        from rasterio.windows import Window
+        from satcode.landsat import to_brightness_temperature, to_reflectance
+
+        row0, row1, col0, col1 = window
+        with rasterio.open(self.scene.band_file(band)) as src:
+            dn = src.read(1, window=Window(col0, row0, col1 - col0, row1 - row0))
+        if band == "thermal":
+            return to_brightness_temperature(self.scene, band, dn)
+        return to_reflectance(self.scene, band, dn)
+
+    def _grid(self):
+        profile = self.scene.profile
+        return profile["crs"], profile["transform"]
+
+    def _read_geolocation_block(self, window):
+        import pyproj
+
+        crs, transform = self._cached("grid", self._grid)
+        row0, row1, col0, col1 = window
+        cols, rows = np.meshgrid(
+            np.arange(col0, col1) + 0.5, np.arange(row0, row1) + 0.5
+        )
+        x = transform.c + transform.a * cols + transform.b * rows
+        y = transform.f + transform.d * cols + transform.e * rows
+        transformer = pyproj.Transformer.from_crs(
+            pyproj.CRS(crs.to_wkt()), "EPSG:4326", always_xy=True
+        )
+        lons, lats = transformer.transform(x, y)
+        return np.asarray(lons), np.asarray(lats)
+
+    def area(self):
+        from pyresample.geometry import AreaDefinition
+
+        crs, transform = self._cached("grid", self._grid)
+        rows, cols = self.shape()
+        left, top = transform.c, transform.f
+        right = left + transform.a * cols
+        bottom = top + transform.e * rows
+        return AreaDefinition(
+            "landsat",
+            self.scene.mtl_file.stem,
+            "landsat",
+            crs.to_wkt(),
+            cols,
+            rows,
+            (left, bottom, right, top),
+        )
+
+
+@register
+class AbiL1bReader(GranuleReader):
+    """
+    GOES-R ABI L1b radiance files (OR_ABI-L1b-*.nc), one band each, named
+    C01 .. C16; radiance, or brightness temperature for the infrared
+    bands from the planck constants in the file
+    """
+
+    name = "abi_l1b"
+    kind = "grid"
+    calibrations = ("radiance", "brightness_temperature")
+
+    @classmethod
+    def matches(cls, path):
+        name = Path(path).name
+        return name.startswith("OR_ABI-L1b") and name.endswith(".nc")
+
+    def _open(self):
+        import netCDF4
+
+        return netCDF4.Dataset(str(self.path))
+
+    def _read_metadata(self):
+        with _read_lock, self._open() as nc:
+            start = np.datetime64(nc.time_coverage_start.rstrip("Z"), "ms")
+            stop = np.datetime64(nc.time_coverage_end.rstrip("Z"), "ms")
+            platform = nc.platform_ID
+        start_text = str(start)
+        return dict(
+            filename=self.path.name,
+            instrument="abi",
+            platform=platform,
+            start=start,
+            stop=stop,
+            startdate=start_text[:10],
+            starttime=start_text[11:],
+        )
+
+    def _band_names(self):
+        with _read_lock, self._open() as nc:
+            return [f"C{int(nc.variables['band_id'][0]):02d}"]
+
+    def shape(self):
+        def compute():
+            with _read_lock, self._open() as nc:
+                return nc.variables["Rad"].shape
+
+        return tuple(self._cached("shape", compute))
+
+    def _read_block(self, band, window, calibration):
+        row0, row1, col0, col1 = window
+        with _read_lock, self._open() as nc:
+            rad = nc.variables["Rad"]
+            rad.set_auto_maskandscale(False)
+            counts = rad[row0:row1, col0:col1]
+            fill = rad.getncattr("_FillValue")
+            scale, offset = rad.scale_factor, rad.add_offset
+            planck = {
+                name: float(nc.variables[name][...])
+                for name in ["planck_fk1", "planck_fk2", "planck_bc1", "planck_bc2"]
+            }
+        out = counts.astype(np.float32)
+        out *= np.float32(scale)
+        out += np.float32(offset)
+        out[counts == fill] = np.nan
+        if calibration == "brightness_temperature":
+            if planck["planck_fk1"] < 0:
+                raise ValueError(f"{band} is not an infrared band")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                np.divide(np.float32(planck["planck_fk1"]), out, out=out)
+                out += np.float32(1.0)
+                np.log(out, out=out)
+                np.divide(np.float32(planck["planck_fk2"]), out, out=out)
+            out -= np.float32(planck["planck_bc1"])
+            out /= np.float32(planck["planck_bc2"])
+        return out
+
+    def _grid(self):
+        """projection parameters and the x, y scan angles"""
+        with _read_lock, self._open() as nc:
+            proj = nc.variables["goes_imager_projection"]
+            params = dict(
+                proj="geos",
+                h=float(proj.perspective_point_height),
+                a=float(proj.semi_major_axis),
+                b=float(proj.semi_minor_axis),
+                lon_0=float(proj.longitude_of_projection_origin),
+                sweep=str(proj.sweep_angle_axis),
+                units="m",
+            )
+            #
+            # scan angles in float64 from the packed integers, so they are
+            # exactly evenly spaced like the area definition
+            #
+            angles = []
+            for name in "xy":
+                var = nc.variables[name]
+                var.set_auto_maskandscale(False)
+                angles.append(
+                    float(var.add_offset)
+                    + float(var.scale_factor) * np.asarray(var[:], dtype=np.float64)
+                )
+        return params, angles[0], angles[1]
+
+    def _read_geolocation_block(self, window):
+        import pyproj
+
+        params, x, y = self._cached("grid", self._grid)
+        row0, row1, col0, col1 = window
+        height = params["h"]
+        xx, yy = np.meshgrid(x[col0:col1] * height, y[row0:row1] * height)
+        transformer = pyproj.Transformer.from_crs(
+            pyproj.CRS(params), "EPSG:4326", always_xy=True
+        )
+        lons, lats = transformer.transform(xx, yy)
+        lons, lats = np.asarray(lons), np.asarray(lats)
+        #
+        # pixels off the earth's disk come back as inf
+        #
+        off_disk = ~(np.isfinite(lons) & np.isfinite(lats))
+        lons[off_disk] = np.nan
+        lats[off_disk] = np.nan
+        return lons, lats
+
+    def area(self):
+        from pyresample.geometry import AreaDefinition
+
+        params, x, y = self._cached("grid", self._grid)
+        height = params["h"]
+        half_x = abs(x[1] - x[0]) / 2.0
+        half_y = abs(y[1] - y[0]) / 2.0
+        extent = (
+            (x.min() - half_x) * height,
+            (y.min() - half_y) * height,
+            (x.max() + half_x) * height,
+            (y.max() + half_y) * height,
+        )
+        return AreaDefinition(
+            "abi",
+            self.path.stem,
+            "abi",
+            params,
+            len(x),
+            len(y),
+            extent,
+        )
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("paths", type=str, nargs="+", help="granules or scene folders")
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    for path in args.paths:
+        reader = open_granule(path)
+        meta = reader.metadata()
+        print(f"{path}: {reader.name} {meta['platform']} {meta['start']}")
+        print(f"  shape {reader.shape()}, bands {reader.band_names()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+  satcode.render
+  ______________
+
+  headless map rendering for production runs, replacing the notebook
+  plotting (plt.axes + display(fig)) for large batches.
+
+  A resampled image and its area definition go through
+  satcode.overlay.colorize, get the cached coastline/gridline mask blended
+  on, and are written as a PNG through an Agg canvas that is created
+  once per image size and reused for every map in the process, or as an
+  RGBA GeoTIFF (needs rasterio).  render_files spreads the .npz results
+  of satcode.pipeline over a process pool and reports the rate in maps
+  per second per core.
+
+  to run from the command line::
+
+    python -m satcode.render ../data/resampled/*.npz --out_folder=../data/maps --format png --workers 4 --vmin 200 --vmax 320 --target_rate 5
+
+  to run from a python script::
+
+    from satcode.render import render_map, render_files
+    render_map(image, area_def, 'b31.png', cmap='inferno', vmin=200, vmax=320)
+    outputs = render_files(npz_files, out_folder='maps', fmt='tif', workers=8)
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+from satcode.overlay import colorize, composite, overlay_for_area
+
+formats = {"png": ".png", "tif": ".tif"}
+_canvases = {}
+
+
+def _canvas(shape, dpi=100):
+    """
+    Agg canvas holding a single figimage the size of the map, one per
+    (rows, cols) in each process.  Only the image data changes between maps
+    """
+    if shape not in _canvases:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        rows, cols = shape
+        fig = Figure(figsize=(cols / dpi, rows / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        artist = fig.figimage(
+            np.zeros((rows, cols, 4), dtype=np.uint8), origin="upper", resize=False
+        )
+        _canvases[shape] = (canvas, artist)
+    return _canvases[shape]
+
+
+def write_png(rgba, filename):
+    canvas, artist = _canvas(rgba.shape[:2])
+    artist.set_data(rgba)
+    with instrument.span("write_png"):
+        canvas.print_png(str(filename))
+
+
+def write_geotiff(rgba, area_def, filename):
+    """
+    four band uint8 GeoTIFF georeferenced with the area definition
+    """
+    try:
+        import rasterio
+        from rasterio.transform import from_bounds
+    except ImportError:
+        raise ImportError("writing GeoTIFF needs rasterio (conda install rasterio)")
+    rows, cols = rgba.shape[:2]
+    x_min, y_min, x_max, y_max = area_def.area_extent
+    profile = dict(
+        driver="GTiff",
+        width=cols,
+        height=rows,
+        count=4,
+        dtype="uint8",
+        crs=rasterio.crs.CRS.from_wkt(area_def.crs.to_wkt()),
+        transform=from_bounds(x_min, y_min, x_max, y_max, cols, rows),
+        photometric="RGB",
+        compress="deflate",
+        tiled=True,
+    )
+    with instrument.span("write_geotiff"):
+        with rasterio.open(filename, "w", **profile) as dst:
+            dst.write(np.moveaxis(rgba, -1, 0))
+
+
+def render_map(
+    image,
+    area_def,
+    filename,
+    cmap="viridis",
+    vmin=None,
+    vmax=None,
+    overlay=True,
+    line_color=(0, 0, 0),
+    cache_dir=None,
+):
+    """
+    write one map
+
+    Parameters
+    ----------
+
+    image: 2-d float array
+       resampled onto area_def, NaN where there is no data
+
+    area_def: pyresample AreaDefinition
+
+    filename: str or Path
+       .png or .tif
+
+    cmap, vmin, vmax:
+       passed to satcode.overlay.colorize
+
+    overlay: bool
+       blend coastlines and gridlines onto the map
+
+    cache_dir: optional str or Path
+       where satcode.overlay keeps its masks between runs
+
+    Returns
+    -------
+
+    filename: Path
+    """
+    filename = Path(filename)
+    with instrument.span("render_map"):
+        rgba = colorize(image, cmap=cmap, vmin=vmin, vmax=vmax)
+        if overlay:
+            alpha = overlay_for_area(area_def, cache_dir=cache_dir)
+            composite(rgba, alpha, color=line_color, out=rgba)
+        if filename.suffix == formats["tif"]:
+            write_geotiff(rgba, area_def, filename)
+        else:
+            write_png(rgba, filename)
+    return filename
+
+
+def render_file(path, out_folder, fmt="png", **kwargs):
+    """
+    render one .npz result of satcode.pipeline; kwargs go to render_map
+    """
+    from satcode.pipeline import load_result
+
+    image, area_def, meta = load_result(path)
+    out_path = Path(out_folder) / (Path(path).stem + formats[fmt])
+    return render_map(image, area_def, out_path, **kwargs)
+
+
+def render_files(
+    paths, out_folder=".", fmt="png", workers=None, target_rate=None, **kwargs
+):
+    """
+    render many .npz results in a process pool
+
+    Parameters
+    ----------
+
+    paths: list of str or Path
+
+    fmt: str
+       'png' or 'tif'
+
+    workers: optional int
+       defaults to the number of cores
+
+    target_rate: optional float
+       maps per second per core to compare the run against
+
+    kwargs:
+       passed to render_map
+
+    Returns
+    -------
+
+    out_paths: list of Path
+       in the same order as paths
+    """
+    if fmt not in formats:
+        raise ValueError(f"fmt must be one of {list(formats)}, not {fmt}")
+    workers = workers or os.cpu_count()
+    Path(out_folder).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(render_file, path, out_folder, fmt, **kwargs) for path in paths
+        ]
+        out_paths = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    rate = len(out_paths) / elapsed / workers if elapsed > 0 else float("inf")
+    print(
+        f"{len(out_paths)} maps in {elapsed:.2f} s with {workers} workers: "
+        f"{rate:.2f} maps/s/core"
+    )
+    if target_rate is not None and rate < target_rate:
+        print(f"below the target of {target_rate} maps/s/core")
+    return out_paths
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("filenames", type=str, nargs="+", help="pipeline .npz files")
+    parser.add_argument("--out_folder", type=str, default=".")
+    parser.add_argument("--format", choices=list(formats), default="png")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cmap", type=str, default="viridis")
+    parser.add_argument("--vmin", type=float, default=None)
+    parser.add_argument("--vmax", type=float, default=None)
+    parser.add_argument("--no_overlay", action="store_true")
+    parser.add_argument("--cache_dir", type=str, default=None, help="overlay masks")
+    parser.add_argument("--target_rate", type=float, default=None)
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    outputs = render_files(
+        args.filenames,
+        out_folder=args.out_folder,
+        fmt=args.format,
+        workers=args.workers,
+        target_rate=args.target_rate,
+        cmap=args.cmap,
+        vmin=args.vmin,
+        vmax=args.vmax,
+        overlay=not args.no_overlay,
+        cache_dir=args.cache_dir,
+    )
+    for name in outputs:
+        print(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""
+  satcode.resample
+  ________________
+
+  one resampling entry point for swath -> area with four methods:
+
+  * nearest  -- pyresample kd-tree nearest neighbour
+  * bilinear -- pyresample bilinear corner weights
+  * gaussian -- kd-tree neighbours weighted by exp(-d**2/sigma**2)
+  * ewa      -- elliptical weighted averaging: each swath pixel spreads
+                over the output cells inside its projected footprint
+                ellipse (computed scan by scan, like ll2cr/fornav)
+
+  Every method is linear in the data, so the interpolation is computed
+  once per (swath geometry, target area, method) as a sparse
+  (n_target x n_source) matrix.  Each further band, or a whole stack of
+  bands, is then one sparse matrix product.  Weights are kept in a small
+  in-memory cache, keyed on the swath and area objects, and optionally
+  in a cache folder on disk, keyed on a hash of the geolocation.
+
+  to run from a python script::
+
+    from satcode.resample import resample
+    image = resample(swath_def, band31, area_def, method='ewa')
+    # the weights are cached -- band 32 costs one sparse mat-vec
+    image32 = resample(swath_def, band32, area_def, method='ewa')
+
+    from satcode.resample import get_weights
+    weights = get_weights(swath_def, area_def, method='bilinear', cache_dir='weights')
+    stack = weights.apply(np.stack([band31, band32]))
+"""
+import collections
+import hashlib
+import weakref
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse
+
+from satcode import instrument
+
+methods = ("nearest", "bilinear", "gaussian", "ewa")
+cache_size = 8
+_cache = collections.OrderedDict()
+
+
+class ResampleWeights:
+    """
+    sparse interpolation weights from a swath to an area
+
+    Attributes
+    ----------
+
+    matrix: scipy.sparse.csr_matrix
+       (n_target, n_source), rows sum to one or are empty
+
+    shape: tuple
+       target (rows, cols)
+
+    empty: int array
+       flat indices of target cells that receive no data
+
+    source_index: int array
+       nearest weights only, see the property
+    """
+
+    def __init__(self, matrix, shape, method):
+        matrix = scipy.sparse.csr_matrix(matrix, dtype=np.float32)
+        totals = np.asarray(matrix.sum(axis=1)).ravel()
+        with np.errstate(divide="ignore"):
+            scale = np.where(totals > 0, 1.0 / totals, 0.0).astype(np.float32)
+        self.matrix = scipy.sparse.diags(scale) @ matrix
+        self.matrix.sort_indices()
+        self.shape = tuple(shape)
+        self.method = method
+        self.empty = np.flatnonzero(totals == 0)
+        self._source_index = None
+
+    @property
+    def nbytes(self):
+        matrix = self.matrix
+        return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+    @property
+    def source_index(self):
+        """
+        for nearest weights: the flat swath index feeding each target
+        cell, -1 where the cell gets no data
+        """
+        if self._source_index is None:
+            matrix = self.matrix
+            index = np.full(matrix.shape[0], -1, dtype=np.int64)
+            filled = np.flatnonzero(np.diff(matrix.indptr) > 0)
+            index[filled] = matrix.indices[matrix.indptr[filled]]
+            self._source_index = index
+        return self._source_index
+
+    def apply(self, data, fill_value=np.nan, return_mask=False):
+        """
+        resample data with these weights
+
+        Parameters
+        ----------
+
+        data: array
+           swath shaped (rows, cols) or a stack (nbands, rows, cols)
+
+        fill_value: float or int
+           value for target cells with no data.  Nearest weights copy
+           the input values, so integer data (e.g. raw counts) keeps its
+           dtype and needs an integer fill_value
+
+        return_mask: bool
+           also return the validity mask packed 8 cells to a byte
+           (see unpack_mask)
+
+        Returns
+        -------
+
+        out: array of shape self.shape or (nbands,) + self.shape
+           float32, or the input dtype for nearest weights on integer data
+
+        mask: uint8 array, only if return_mask
+           np.packbits of the flattened valid cells, one row per band
+        """
+        data = np.asarray(data)
+        nsource = self.matrix.shape[1]
+        stacked = data.size != nsource
+        if self.method == "nearest":
+            out, valid = self._gather(
+                data.reshape(-1, nsource), fill_value, return_mask
+            )
+        else:
+            out, valid = self._product(
+                data.reshape(-1, nsource), fill_value, return_mask
+            )
+        out = out.reshape((-1,) + self.shape)
+        if not stacked:
+            out = out[0]
+        if not return_mask:
+            return out
+        mask = np.packbits(valid, axis=-1)
+        return out, (mask if stacked else mask[0])
+
+    def _gather(self, rows, fill_value, want_mask):
+        """
+        nearest neighbour: index the input instead of a matrix product,
+        writing the fill straight into the empty cells.  NaN inputs stay
+        NaN unless fill_value is something else
+        """
+        index = self.source_index
+        if np.issubdtype(rows.dtype, np.integer):
+            if not np.can_cast(np.min_scalar_type(fill_value), rows.dtype):
+                raise ValueError(
+                    f"integer output needs a fill_value that fits {rows.dtype}, "
+                    f"not {fill_value}"
+                )
+        else:
+            rows = rows.astype(np.float32, copy=False)
+        with instrument.span("apply_weights", method=self.method) as the_span:
+            out = np.take(rows, np.maximum(index, 0), axis=1)
+            out[:, self.empty] = fill_value
+            valid = None
+            if out.dtype.kind == "f" and (want_mask or not np.isnan(fill_value)):
+                finite = np.isfinite(out)
+                np.copyto(out, out.dtype.type(fill_value), where=~finite)
+                valid = finite & (index >= 0)
+            elif want_mask:
+                valid = np.broadcast_to(index >= 0, out.shape)
+            the_span.add("pixels_resampled", rows.size)
+        return out, valid
+
+    def _product(self, rows, fill_value, want_mask):
+        columns = rows.T.astype(np.float32, copy=False)
+        valid = np.isfinite(columns)
+        with instrument.span("apply_weights", method=self.method) as the_span:
+            if valid.all():
+                out = self.matrix @ columns
+                norm = None
+            else:
+                #
+                # renormalize over the valid inputs so one NaN doesn't
+                # wipe out every cell it contributes to
+                #
+                out = self.matrix @ np.where(valid, columns, 0.0)
+                norm = self.matrix @ valid.astype(np.float32)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out /= norm
+                out[norm == 0] = fill_value
+            out[self.empty] = fill_value
+            the_span.add("pixels_resampled", columns.size)
+        if not want_mask:
+            valid = None
+        elif norm is None:
+            cells = np.ones(self.matrix.shape[0], dtype=bool)
+            cells[self.empty] = False
+            valid = np.broadcast_to(cells, (columns.shape[1], len(cells)))
+        else:
+            valid = (norm > 0).T
+        return out.T, valid
+
+    def save(self, filename):
+        """write to a .npz file readable by ResampleWeights.load"""
+        filename = Path(filename)
+        scipy.sparse.save_npz(filename, self.matrix.tocoo())
+        np.savez(
+            filename.with_suffix(".meta.npz"), shape=self.shape, method=self.method
+        )
+
+    @classmethod
+    def load(cls, filename):
+        filename = Path(filename)
+        matrix = scipy.sparse.load_npz(filename)
+        with np.load(filename.with_suffix(".meta.npz")) as meta:
+            return cls(matrix, tuple(meta["shape"]), str(meta["method"]))
+
+
+def unpack_mask(mask, shape):
+    """
+    bool validity mask from the packed bits returned by apply(return_mask=True)
+
+    Parameters
+    ----------
+
+    mask: uint8 array
+       (nbytes,) or (nbands, nbytes)
+
+    shape: tuple
+       target (rows, cols), e.g. area_def.shape
+    """
+    ncells = int(np.prod(shape))
+    valid = np.unpackbits(mask, axis=-1, count=ncells).astype(bool)
+    return valid.reshape(mask.shape[:-1] + tuple(shape))
+
+
+def geometry_key(swath_def, area_def, method, **params):
+    """
+    hash identifying a (swath lon/lat, area, method, parameters) combination
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    lons, lats = swath_def.get_lonlats()
+    digest.update(np.ascontiguousarray(lons, dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(lats, dtype=np.float32).tobytes())
+    digest.update(str(lons.shape).encode())
+    digest.update(area_def.crs.to_wkt().encode())
+    digest.update(str((area_def.shape, area_def.area_extent)).encode())
+    digest.update(str((method, sorted(params.items()))).encode())
+    return digest.hexdigest()
+
+
+def _kd_neighbours(swath_def, area_def, radius_of_influence, neighbours):
+    """
+    kd-tree neighbours as flat (target, source, distance) triplets
+    """
+    from pyresample import kd_tree
+
+    valid_in, valid_out, index, distance = kd_tree.get_neighbour_info(
+        swath_def, area_def, radius_of_influence, neighbours=neighbours
+    )
+    source = np.flatnonzero(valid_in)
+    target = np.flatnonzero(valid_out)
+    index = index.reshape(len(target), -1)
+    distance = distance.reshape(len(target), -1)
+    ok = index < len(source)
+    rows = np.broadcast_to(target[:, np.newaxis], index.shape)[ok]
+    return rows, source[index[ok]], distance[ok]
+
+
+def _nearest(swath_def, area_def, radius_of_influence=5000, **unused):
+    rows, cols, _ = _kd_neighbours(swath_def, area_def, radius_of_influence, 1)
+    return rows, cols, np.ones(len(rows), dtype=np.float32)
+
+
+def _gaussian(swath_def, area_def, radius_of_influence=5000, neighbours=8, sigma=None):
+    sigma = radius_of_influence / 2.0 if sigma is None else sigma
+    rows, cols, distance = _kd_neighbours(
+        swath_def, area_def, radius_of_influence, neighbours
+    )
+    weights = np.exp(-((distance / sigma) ** 2)).astype(np.float32)
+    return rows, cols, weights
+
+
+def _bilinear(swath_def, area_def, radius_of_influence=5000, neighbours=32, **unused):
+    import warnings
+    from pyresample import bilinear
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        t, s, input_index, index = bilinear.get_bil_info(
+            swath_def, area_def, radius=radius_of_influence, neighbours=neighbours
+        )
+    input_index = np.asarray(input_index)
+    if input_index.dtype == bool:
+        input_index = np.flatnonzero(input_index)
+    t, s = np.asarray(t).ravel(), np.asarray(s).ravel()
+    corner_weights = np.stack(
+        [(1 - s) * (1 - t), s * (1 - t), (1 - s) * t, s * t], axis=1
+    )
+    index = np.asarray(index).reshape(-1, 4)
+    ok = np.isfinite(corner_weights) & (index < len(input_index)) & (index >= 0)
+    target = np.broadcast_to(np.arange(len(t))[:, np.newaxis], index.shape)
+    return target[ok], input_index[index[ok]], corner_weights[ok].astype(np.float32)
+
+
+def _ewa(
+    swath_def,
+    area_def,
+    rows_per_scan=10,
+    weight_min=0.01,
+    max_radius=10,
+    **unused,
+):
+    """
+    elliptical weighted averaging weights.  The footprint of a swath
+    pixel in output grid coordinates is J J^T, J being the jacobian of
+    (output col, row) with respect to (swath col, row).  Differences are
+    taken inside each scan so the bow-tie jumps between scans don't
+    inflate the ellipses.
+    """
+    lons, lats = swath_def.get_lonlats()
+    if lons.ndim != 2:
+        raise ValueError("ewa needs the 2-d swath, scan lines intact")
+    nrows, ncols = lons.shape
+    cols, rows = area_def.get_array_coordinates_from_lonlat(lons, lats)
+    cols = np.asarray(cols, dtype=np.float64).reshape(nrows, ncols)
+    rows = np.asarray(rows, dtype=np.float64).reshape(nrows, ncols)
+    per_scan = rows_per_scan if nrows % rows_per_scan == 0 else nrows
+    jacobian = []
+    for coord in (cols, rows):
+        d_col = np.gradient(coord, axis=1)
+        scans = coord.reshape(-1, per_scan, ncols)
+        d_row = np.gradient(scans, axis=1).reshape(nrows, ncols)
+        jacobian.append((d_col, d_row))
+    (ux, uy), (vx, vy) = jacobian
+    #
+    # footprint covariance, at least half an output cell so every
+    # output cell under the swath gets some weight
+    #
+    a = ux * ux + uy * uy + 0.25
+    b = ux * vx + uy * vy
+    c = vx * vx + vy * vy + 0.25
+    det = a * c - b * b
+    inv_a, inv_b, inv_c = c / det, -b / det, a / det
+    alpha = -np.log(weight_min)
+    half = np.ceil(np.sqrt(np.maximum(a, c))).astype(np.int64)
+    inside = np.isfinite(cols) & np.isfinite(rows) & np.isfinite(det)
+    inside &= (cols > -max_radius) & (cols < area_def.width + max_radius)
+    inside &= (rows > -max_radius) & (rows < area_def.height + max_radius)
+    half = np.clip(half, 1, max_radius)
+    out_rows, out_cols, out_weights = [], [], []
+    flat = np.arange(nrows * ncols).reshape(nrows, ncols)
+    for size in np.unique(half[inside]):
+        group = inside & (half == size)
+        source = flat[group]
+        u, v = cols[group], rows[group]
+        ia, ib, ic = inv_a[group], inv_b[group], inv_c[group]
+        u0, v0 = np.rint(u).astype(np.int64), np.rint(v).astype(np.int64)
+        for dv in range(-size, size + 1):
+            for du in range(-size, size + 1):
+                cu, cv = u0 + du, v0 + dv
+                du_ = cu - u
+                dv_ = cv - v
+                q = ia * du_ * du_ + 2.0 * ib * du_ * dv_ + ic * dv_ * dv_
+                ok = (
+                    (q <= 1.0)
+                    & (cu >= 0)
+                    & (cu < area_def.width)
+                    & (cv >= 0)
+                    & (cv < area_def.height)
+                )
+                out_rows.append(cv[ok] * area_def.width + cu[ok])
+                out_cols.append(source[ok])
+                out_weights.append(np.exp(-alpha * q[ok]).astype(np.float32))
+    if not out_rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float32)
+    return (
+        np.concatenate(out_rows),
+        np.concatenate(out_cols),
+        np.concatenate(out_weights),
+    )
+
+
+_builders = dict(nearest=_nearest, bilinear=_bilinear, gaussian=_gaussian, ewa=_ewa)
+
+
+def compute_weights(swath_def, area_def, method="nearest", deduplicate=False, **params):
+    """
+    build the sparse weights without looking in the cache
+
+    Parameters
+    ----------
+
+    swath_def: pyresample SwathDefinition
+
+    area_def: pyresample AreaDefinition
+
+    method: str
+       one of 'nearest', 'bilinear', 'gaussian', 'ewa'
+
+    deduplicate: bool
+       drop the MODIS bow-tie duplicates (see satcode.bowtie) before
+       building the weights.  The matrix still takes full swath arrays.
+       Ignored for ewa, which averages the overlap instead
+
+    params:
+       radius_of_influence (m, default 5000) for nearest/bilinear/gaussian,
+       neighbours and sigma (m) for gaussian, rows_per_scan and
+       weight_min for ewa
+
+    Returns
+    -------
+
+    weights: ResampleWeights
+    """
+    if method not in _builders:
+        raise ValueError(f"method must be one of {methods}, not {method}")
+    nsource = int(np.prod(swath_def.shape))
+    with instrument.span("compute_weights", method=method) as the_span:
+        if deduplicate and method != "ewa":
+            from satcode.bowtie import deduplicate as drop_bowtie
+
+            lons, lats = swath_def.get_lonlats()
+            reduced, index = drop_bowtie(lons, lats)
+            the_span.add("bowtie_pixels_dropped", nsource - len(index))
+            rows, cols, values = _builders[method](reduced, area_def, **params)
+            cols = index[cols]
+        else:
+            rows, cols, values = _builders[method](swath_def, area_def, **params)
+        matrix = scipy.sparse.coo_matrix(
+            (values, (rows, cols)), shape=(area_def.size, nsource)
+        )
+        the_span.add("pixels_resampled", nsource)
+    return ResampleWeights(matrix, area_def.shape, method)
+
+
+def get_weights(
+    swath_def, area_def, method="nearest", cache_dir=None, deduplicate=False, **params
+):
+    """
+    cached version of compute_weights.  The in-memory cache holds the
+    last ``cache_size`` weight sets, keyed on the identity of swath_def
+    and area_def, so reuse the same definition objects for every band
+    (or keep the returned ResampleWeights and call apply).  With
+    cache_dir the weights are also saved to and loaded from that
+    folder, keyed by geometry_key; only then are the lon/lat arrays
+    hashed
+    """
+    settings = (method, deduplicate, tuple(sorted(params.items())))
+    memory_key = (id(swath_def), id(area_def), settings)
+    if memory_key in _cache:
+        swath_ref, area_ref, weights = _cache[memory_key]
+        #
+        # an id can be reused once its object is gone, the weak
+        # references tell a live match from a stale entry
+        #
+        if swath_ref() is swath_def and area_ref() is area_def:
+            _cache.move_to_end(memory_key)
+            instrument.count("weight_cache_hits")
+            return weights
+        del _cache[memory_key]
+    weights = None
+    if cache_dir is not None:
+        key = geometry_key(
+            swath_def, area_def, method, deduplicate=deduplicate, **params
+        )
+        cache_file = Path(cache_dir) / f"{method}_{key}.npz"
+        if cache_file.exists():
+            with instrument.span("load_weights"):
+                weights = ResampleWeights.load(cache_file)
+            instrument.count("weight_cache_hits")
+    if weights is None:
+        instrument.count("weight_cache_misses")
+        weights = compute_weights(swath_def, area_def, method, deduplicate, **params)
+        if cache_dir is not None:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            weights.save(cache_file)
+    _cache[memory_key] = (weakref.ref(swath_def), weakref.ref(area_def), weights)
+    while len(_cache) > cache_size:
+        _cache.popitem(last=False)
+    return weights
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def resample(
+    swath_def,
+    data,
+    area_def,
+    method="nearest",
+    fill_value=np.nan,
+    cache_dir=None,
+    deduplicate=False,
+    return_mask=False,
+    **params,
+):
+    """
+    resample swath data onto area_def
+
+    Parameters
+    ----------
+
+    swath_def: pyresample SwathDefinition
+
+    data: array
+       (rows, cols) swath band, or (nbands, rows, cols) stack
+
+    area_def: pyresample AreaDefinition
+
+    method: str
+       'nearest', 'bilinear', 'gaussian' or 'ewa'
+
+    fill_value: float or int
+       for output cells with no input; an integer for integer data with
+       method='nearest', which keeps the input dtype
+
+    cache_dir: optional str or Path
+       keep the weights on disk between runs
+
+    deduplicate: bool
+       drop bow-tie duplicated pixels first (nearest/bilinear/gaussian)
+
+    return_mask: bool
+       also return the bit-packed validity mask (see unpack_mask)
+
+    params:
+       passed to compute_weights
+
+    Returns
+    -------
+
+    out: array with area_def.shape (or (nbands,) + area_def.shape)
+       float32 with fill_value (NaN by default) in empty cells, no post
+       pass needed; input dtype for integer data with method='nearest'
+
+    mask: uint8 array, only if return_mask
+    """
+    weights = get_weights(
+        swath_def,
+        area_def,
+        method,
+        cache_dir=cache_dir,
+        deduplicate=deduplicate,
+        **params,
+    )
+    return weights.apply(data, fill_value=fill_value, return_mask=return_mask)
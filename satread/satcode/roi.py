@@ -0,0 +1,372 @@
+"""
+  satcode.roi
+  ___________
+
+  region of interest subsetting at read time for MODIS granules.
+
+  Most analyses only need a small box (e.g. Vancouver in
+  cartopy_mapping) out of the 2030 x 1354 swath.  find_window reads a
+  decimated grid of the geolocation (pyhdf strided reads, every 10th
+  pixel) to find the row/column window of the swath that covers a
+  lon/lat box or a point plus radius.  Only that window of Latitude,
+  Longitude and each band is then read from the hdf files
+  (pyhdf start/count reads), and only the subset is resampled, onto a
+  grid planned around the region itself.
+
+  The window is padded by one decimation step, since the region can fall
+  between the decimated samples, and is extended to whole scans (10 rows
+  at 1 km) so the bow-tie duplicates can still be dropped.
+
+  to run from the command line::
+
+    python -m satcode.roi MYD021KM.A2013222.2105.061.2018047235850.hdf --point -123.1207 49.2827 --radius 150 --bands 31 --out_folder=../data/roi
+
+    python -m satcode.roi MYD021KM.A2013222.2105.061.2018047235850.hdf --bbox -126 48 -121 51
+
+  to run from a python script::
+
+    from satcode.roi import resample_roi
+    images, area_def = resample_roi(l1b_file, bands=['31'], point=(-123.1207, 49.2827), radius_km=150)
+"""
+import argparse
+
+import numpy as np
+
+from satcode import instrument
+
+earth_radius_km = 6371.0
+#
+# rows per scan at 1 km; the 5 km geolocation has 2
+#
+rows_per_scan = 10
+
+
+def _check_roi(bbox, point, radius_km):
+    if (bbox is None) == (point is None):
+        raise ValueError("give either bbox or point and radius_km")
+    if point is not None and radius_km is None:
+        raise ValueError("a point needs a radius_km")
+
+
+def great_circle_km(lons, lats, lon_0, lat_0):
+    """haversine distance from (lon_0, lat_0) on a sphere"""
+    lons, lats = np.radians(lons), np.radians(lats)
+    lon_0, lat_0 = np.radians(lon_0), np.radians(lat_0)
+    a = (
+        np.sin((lats - lat_0) / 2.0) ** 2
+        + np.cos(lats) * np.cos(lat_0) * np.sin((lons - lon_0) / 2.0) ** 2
+    )
+    return 2.0 * earth_radius_km * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def in_roi(lons, lats, bbox=None, point=None, radius_km=None, margin_km=0.0):
+    """
+    boolean mask of the lon/lat points inside the region, grown by
+    margin_km.  bbox is (lon_min, lat_min, lon_max, lat_max), with
+    lon_min > lon_max for a box across the dateline
+    """
+    _check_roi(bbox, point, radius_km)
+    lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, np.float64)
+    if point is not None:
+        return great_circle_km(lons, lats, *point) <= radius_km + margin_km
+    lon_min, lat_min, lon_max, lat_max = bbox
+    lat_margin = np.degrees(margin_km / earth_radius_km)
+    top = min(max(abs(lat_min), abs(lat_max)) + lat_margin, 89.0)
+    lon_margin = lat_margin / np.cos(np.radians(top))
+    width = (lon_max - lon_min) % 360.0 + 2.0 * lon_margin
+    east = (lons - (lon_min - lon_margin)) % 360.0
+    return (
+        (lats >= lat_min - lat_margin)
+        & (lats <= lat_max + lat_margin)
+        & ((east <= width) | (width >= 360.0))
+    )
+
+
+def find_window(path, bbox=None, point=None, radius_km=None, step=10):
+    """
+    swath window covering a region, from decimated geolocation
+
+    Parameters
+    ----------
+
+    path: str or Path
+       level1b file; the window is found in the MYD03 file next to it if
+       there is one (see satcode.pipeline.read_geolocation), otherwise in
+       its own 5 km Latitude/Longitude
+
+    bbox: optional tuple
+       (lon_min, lat_min, lon_max, lat_max) in degrees
+
+    point, radius_km: optional (lon, lat) tuple and float
+       a circle instead of a box
+
+    step: int
+       1 km pixels between the decimated samples
+
+    Returns
+    -------
+
+    window: tuple or None
+       (row_start, row_stop, col_start, col_stop) in the geolocation grid,
+       as taken by read_geolocation and read_band, or None if the granule
+       misses the region
+    """
+    from pyhdf.SD import SD, SDC
+    from satcode.pipeline import geolocation_file
+
+    _check_roi(bbox, point, radius_km)
+    geo_path = geolocation_file(path)
+    stride = 1 if geo_path is not None else 5
+    source = geo_path if geo_path is not None else path
+    step = max(step // stride, 1)
+    the_file = SD(str(source), SDC.READ)
+    with instrument.span("find_window", stride=stride) as the_span:
+        decimated = []
+        for name in ["Longitude", "Latitude"]:
+            sds = the_file.select(name)
+            nrows, ncols = sds.info()[2]
+            count = ((nrows - 1) // step + 1, (ncols - 1) // step + 1)
+            decimated.append(
+                sds.get(start=(0, 0), count=count, stride=(step, step)).astype(
+                    np.float64
+                )
+            )
+            sds.endaccess()
+        lons, lats = decimated
+        the_span.add("bytes_read", 4 * (lons.size + lats.size))
+    the_file.end()
+    #
+    # the region can sit between samples, so grow it by the largest
+    # distance between neighbouring samples
+    #
+    margin_km = 0.0
+    if lons.shape[0] > 1:
+        margin_km = max(
+            margin_km,
+            float(np.nanmax(great_circle_km(lons[1:], lats[1:], lons[:-1], lats[:-1]))),
+        )
+    if lons.shape[1] > 1:
+        along_row = great_circle_km(
+            lons[:, 1:], lats[:, 1:], lons[:, :-1], lats[:, :-1]
+        )
+        margin_km = max(margin_km, float(np.nanmax(along_row)))
+    hits = in_roi(lons, lats, bbox, point, radius_km, margin_km)
+    if not hits.any():
+        return None
+    rows = np.flatnonzero(hits.any(axis=1)) * step
+    cols = np.flatnonzero(hits.any(axis=0)) * step
+    scan = max(rows_per_scan // stride, 1)
+    row0 = max(rows[0] - step, 0) // scan * scan
+    row1 = min(-(-(rows[-1] + step + 1) // scan) * scan, nrows)
+    col0 = max(cols[0] - step, 0)
+    col1 = min(cols[-1] + step + 1, ncols)
+    return int(row0), int(row1), int(col0), int(col1)
+
+
+def roi_boundary(bbox=None, point=None, radius_km=None, samples=64):
+    """
+    outline of the region, densified so it projects to the right shape
+
+    Returns
+    -------
+
+    lons, lats: 1-d float64 arrays
+    """
+    _check_roi(bbox, point, radius_km)
+    if point is not None:
+        #
+        # destination points at radius_km on bearings around the circle
+        #
+        lon_0, lat_0 = np.radians(point)
+        bearing = np.linspace(0.0, 2.0 * np.pi, samples, endpoint=False)
+        angle = radius_km / earth_radius_km
+        lats = np.arcsin(
+            np.sin(lat_0) * np.cos(angle)
+            + np.cos(lat_0) * np.sin(angle) * np.cos(bearing)
+        )
+        lons = lon_0 + np.arctan2(
+            np.sin(bearing) * np.sin(angle) * np.cos(lat_0),
+            np.cos(angle) - np.sin(lat_0) * np.sin(lats),
+        )
+        return np.degrees(lons), np.degrees(lats)
+    lon_min, lat_min, lon_max, lat_max = bbox
+    lon_max = lon_min + (lon_max - lon_min) % 360.0
+    edge_lons = np.linspace(lon_min, lon_max, samples)
+    edge_lats = np.linspace(lat_min, lat_max, samples)
+    lons = np.concatenate(
+        [
+            edge_lons,
+            np.full(samples, lon_max),
+            edge_lons[::-1],
+            np.full(samples, lon_min),
+        ]
+    )
+    lats = np.concatenate(
+        [
+            np.full(samples, lat_min),
+            edge_lats,
+            np.full(samples, lat_max),
+            edge_lats[::-1],
+        ]
+    )
+    return lons, lats
+
+
+def roi_projection(bbox=None, point=None, radius_km=None):
+    """LAEA on a sphere centred on the region"""
+    from satcode.area_plan import default_projection
+
+    _check_roi(bbox, point, radius_km)
+    if point is not None:
+        lon_0, lat_0 = point
+    else:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        lon_0 = lon_min + ((lon_max - lon_min) % 360.0) / 2.0
+        lat_0 = (lat_min + lat_max) / 2.0
+    return default_projection(dict(lon_0=lon_0, lat_0=lat_0))
+
+
+def roi_area(
+    lons,
+    lats,
+    proj_params=None,
+    bbox=None,
+    point=None,
+    radius_km=None,
+    resolution=None,
+):
+    """
+    target grid covering the region, at the resolution of the swath
+    subset lons, lats unless resolution is given
+
+    Returns
+    -------
+
+    area_def: pyresample AreaDefinition
+    """
+    from satcode import area_plan
+
+    if proj_params is None:
+        proj_params = roi_projection(bbox, point, radius_km)
+    if resolution is None:
+        subset_lons, subset_lats = area_plan.swath_boundary(lons, lats)
+        subset = area_plan.plan_area(subset_lons, subset_lats, proj_params=proj_params)
+        resolution = subset.pixel_size_x
+    outline_lons, outline_lats = roi_boundary(bbox, point, radius_km)
+    return area_plan.plan_area(
+        outline_lons,
+        outline_lats,
+        proj_params=proj_params,
+        resolution=resolution,
+        area_id="roi",
+    )
+
+
+def read_roi(path, bands=("31",), bbox=None, point=None, radius_km=None, step=10):
+    """
+    read the window of the geolocation and the bands covering a region
+
+    Returns
+    -------
+
+    subset: dict or None
+       lons, lats, stride, window and radiance (dict band -> float32
+       array), or None if the granule misses the region
+    """
+    from satcode.pipeline import read_band, read_geolocation
+
+    window = find_window(path, bbox, point, radius_km, step)
+    if window is None:
+        return None
+    lons, lats, stride = read_geolocation(path, window)
+    radiance = {band: read_band(path, band, stride, window) for band in bands}
+    return dict(lons=lons, lats=lats, stride=stride, window=window, radiance=radiance)
+
+
+def resample_roi(
+    path,
+    bands=("31",),
+    bbox=None,
+    point=None,
+    radius_km=None,
+    proj_params=None,
+    resolution=None,
+    method="nearest",
+    radius_of_influence=5000,
+    step=10,
+):
+    """
+    read_roi, then resample the subset onto roi_area
+
+    Returns
+    -------
+
+    images: dict
+       band -> resampled float32 array
+
+    area_def: pyresample AreaDefinition
+
+    Raises
+    ------
+
+    ValueError if the granule misses the region
+    """
+    from satcode.pipeline import weights
+
+    subset = read_roi(path, bands, bbox, point, radius_km, step)
+    if subset is None:
+        raise ValueError(f"{path} does not cover the region of interest")
+    lons, lats, stride = subset["lons"], subset["lats"], subset["stride"]
+    area_def = roi_area(lons, lats, proj_params, bbox, point, radius_km, resolution)
+    the_weights = weights(lons, lats, stride, area_def, method, radius_of_influence)
+    images = {
+        band: the_weights.apply(radiance)
+        for band, radiance in subset["radiance"].items()
+    }
+    return images, area_def
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("filename", type=str, help="level1b granule")
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        default=None,
+        help="lon_min lat_min lon_max lat_max",
+    )
+    parser.add_argument("--point", type=float, nargs=2, default=None, help="lon lat")
+    parser.add_argument("--radius", type=float, default=None, help="km")
+    parser.add_argument("--bands", nargs="+", default=["31"], help="MODIS band names")
+    parser.add_argument(
+        "--out_folder", type=str, default=None, help="write the resampled bands"
+    )
+    parser.add_argument("--format", choices=["npz", "cog"], default="npz")
+    return parser
+
+
+def main(args=None):
+    from satcode.pipeline import read_meta, write_result
+
+    parser = make_parser()
+    args = parser.parse_args(args)
+    roi = dict(bbox=args.bbox, point=args.point, radius_km=args.radius)
+    window = find_window(args.filename, **roi)
+    print(f"window (rows, rows, cols, cols): {window}")
+    if window is None or args.out_folder is None:
+        return
+    images, area_def = resample_roi(args.filename, bands=args.bands, **roi)
+    meta = read_meta(args.filename)
+    for band, image in images.items():
+        print(write_result(image, area_def, meta, band, args.out_folder, args.format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,756 @@
+"""
+  satcode.synthetic
+  _________________
+
+  writes synthetic but realistically laid out satellite files so the
+  catalog, resampling and detection code can be load tested offline:
+
+  * MODIS Level1b (MYD021KM) hdf4 files with the real science dataset names,
+    uint16 scaled integers with radiance/reflectance scales and offsets,
+    5 km Latitude/Longitude and an ODL CoreMetadata.0 attribute that
+    parseMeta reads like the real thing
+  * MODIS geolocation (MYD03) hdf4 files with full resolution
+    Latitude/Longitude, bow-tie overlap included
+  * GOES-16 ABI L1b style netcdf4 files (Rad, DQF, x, y,
+    goes_imager_projection and planck constants)
+
+  Consecutive granules follow one another along a simple circular polar
+  orbit, 5 minutes (203 scans) per MODIS granule.
+
+  to run from the command line::
+
+    python -m satcode.synthetic --count 12 --dest_folder=../data/synthetic
+
+    python -m satcode.synthetic --kind goes --count 24 --rows 1500 --cols 2500
+
+  to run from a python script::
+
+    from satcode.synthetic import generate
+    files = generate('modis', count=4, dest_folder='synth', rows=1000, cols=1354)
+"""
+import argparse
+import datetime
+from pathlib import Path
+
+import numpy as np
+
+radius = 6_371_000.0  # meters, spherical earth
+aqua_height = 705_000.0  # meters
+rows_per_scan = 10
+modis_rows = 2030
+modis_cols = 1354
+max_scan_angle = 55.0  # degrees either side of nadir
+granule_minutes = 5
+orbit_minutes = 98.8
+
+#
+# MYD021KM science datasets: name, band names, reflective or not
+#
+l1b_datasets = [
+    ("EV_250_Aggr1km_RefSB", "1,2", True),
+    ("EV_500_Aggr1km_RefSB", "3,4,5,6,7", True),
+    (
+        "EV_1KM_RefSB",
+        "8,9,10,11,12,13lo,13hi,14lo,14hi,15,16,17,18,19,26",
+        True,
+    ),
+    ("EV_1KM_Emissive", "20,21,22,23,24,25,27,28,29,30,31,32,33,34,35,36", False),
+]
+
+
+def _unit_vectors(lons, lats):
+    lons, lats = np.deg2rad(lons), np.deg2rad(lats)
+    coslat = np.cos(lats)
+    return np.stack(
+        [coslat * np.cos(lons), coslat * np.sin(lons), np.sin(lats)], axis=-1
+    )
+
+
+def swath_geolocation(
+    rows=modis_rows,
+    cols=modis_cols,
+    start_lon=-115.0,
+    start_lat=60.0,
+    heading=190.0,
+    bowtie=True,
+):
+    """
+    lon/lat of every pixel of a MODIS-like cross-track scanner
+
+    The sub-satellite track is a great circle starting at
+    (start_lon, start_lat) with the given heading (degrees clockwise
+    from north).  Scans are 10 rows (10 km at nadir) apart.  With bowtie
+    True each row's along-track footprint grows with slant range, so
+    neighbouring scans overlap near the swath edges like real MODIS data.
+
+    Returns
+    -------
+
+    lons, lats: float32 arrays of shape (rows, cols)
+    """
+    start = _unit_vectors(start_lon, start_lat)
+    east = np.array(
+        [-np.sin(np.deg2rad(start_lon)), np.cos(np.deg2rad(start_lon)), 0.0]
+    )
+    north = np.cross(start, east)
+    theta = np.deg2rad(heading)
+    tangent = np.sin(theta) * east + np.cos(theta) * north
+    normal = np.cross(start, tangent)
+    #
+    # cross track: earth central angle beta for each scan angle
+    #
+    scan_angle = np.deg2rad(np.linspace(-max_scan_angle, max_scan_angle, cols))
+    beta = np.arcsin((radius + aqua_height) / radius * np.sin(scan_angle)) - scan_angle
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slant = np.where(
+            scan_angle == 0.0, aqua_height, radius * np.sin(beta) / np.sin(scan_angle)
+        )
+    growth = slant / aqua_height if bowtie else np.ones_like(slant)
+    #
+    # along track distance of each pixel in meters
+    #
+    row = np.arange(rows)
+    scan_center = (row // rows_per_scan) * rows_per_scan + (rows_per_scan - 1) / 2.0
+    offset = (row - scan_center)[:, np.newaxis] * growth[np.newaxis, :]
+    along = (scan_center[:, np.newaxis] + offset) * 1000.0 / radius
+    track = (
+        np.cos(along)[..., np.newaxis] * start
+        + np.sin(along)[..., np.newaxis] * tangent
+    )
+    beta = beta[np.newaxis, :, np.newaxis]
+    points = np.cos(beta) * track + np.sin(beta) * normal
+    lats = np.rad2deg(np.arcsin(np.clip(points[..., 2], -1.0, 1.0)))
+    lons = np.rad2deg(np.arctan2(points[..., 1], points[..., 0]))
+    return lons.astype(np.float32), lats.astype(np.float32)
+
+
+def next_start(start_lon, start_lat, heading, rows=modis_rows):
+    """
+    (lon, lat, heading) where the granule after this one begins
+    """
+    start = _unit_vectors(start_lon, start_lat)
+    east = np.array(
+        [-np.sin(np.deg2rad(start_lon)), np.cos(np.deg2rad(start_lon)), 0.0]
+    )
+    north = np.cross(start, east)
+    theta = np.deg2rad(heading)
+    tangent = np.sin(theta) * east + np.cos(theta) * north
+    angle = rows * 1000.0 / radius
+    point = np.cos(angle) * start + np.sin(angle) * tangent
+    new_tangent = -np.sin(angle) * start + np.cos(angle) * tangent
+    lat = np.rad2deg(np.arcsin(point[2]))
+    lon = np.rad2deg(np.arctan2(point[1], point[0]))
+    new_east = np.array([-np.sin(np.deg2rad(lon)), np.cos(np.deg2rad(lon)), 0.0])
+    new_north = np.cross(point, new_east)
+    new_heading = np.rad2deg(
+        np.arctan2(np.dot(new_tangent, new_east), np.dot(new_tangent, new_north))
+    )
+    return float(lon), float(lat), float(new_heading % 360.0)
+
+
+def _odl(node, indent=0):
+    """
+    serialize nested ("GROUP"|"OBJECT", name, content) tuples to ODL.
+    content is either a list of child nodes or a leaf value
+    """
+    kind, name, content = node
+    pad = "  " * indent
+    lines = [f"{pad}{kind:23s}= {name}"]
+    if isinstance(content, list):
+        if kind == "OBJECT":
+            lines.append(f'{pad}  {"CLASS":21s}= "1"')
+        for child in content:
+            lines.extend(_odl(child, indent + 1))
+    else:
+        num_val = len(content) if isinstance(content, tuple) else 1
+        if isinstance(content, str):
+            value = f'"{content}"'
+        elif isinstance(content, tuple):
+            value = "(" + ", ".join(repr(item) for item in content) + ")"
+        else:
+            value = repr(content)
+        lines.append(f"{pad}  {'NUM_VAL':21s}= {num_val}")
+        lines.append(f"{pad}  {'VALUE':21s}= {value}")
+    lines.append(f"{pad}{'END_' + kind:23s}= {name}")
+    return lines
+
+
+def core_metadata(
+    granule_id,
+    corner_lons,
+    corner_lats,
+    start_time=datetime.datetime(2013, 8, 10, 21, 5),
+    orbit=61523,
+    daynight="Day",
+    shortname="MYD021KM",
+    platform="Aqua",
+):
+    """
+    ODL CoreMetadata.0 text with the groups and objects of a real
+    collection 6.1 MODIS Level1b granule
+
+    Parameters
+    ----------
+
+    granule_id: str
+       LOCALGRANULEID, normally the file name
+
+    corner_lons, corner_lats: sequences of 4 floats
+       G-ring points
+
+    start_time: datetime
+       RANGEBEGINNING date/time, the granule lasts 5 minutes
+    """
+    stop_time = start_time + datetime.timedelta(minutes=granule_minutes)
+    equator_time = start_time - datetime.timedelta(minutes=orbit_minutes / 4.0)
+    gring_lons = tuple(round(float(item), 6) for item in corner_lons)
+    gring_lats = tuple(round(float(item), 6) for item in corner_lats)
+    tree = (
+        "GROUP",
+        "INVENTORYMETADATA",
+        [
+            (
+                "GROUP",
+                "ECSDATAGRANULE",
+                [
+                    ("OBJECT", "REPROCESSINGPLANNED", "further update is anticipated"),
+                    ("OBJECT", "REPROCESSINGACTUAL", "reprocessed"),
+                    ("OBJECT", "LOCALGRANULEID", granule_id),
+                    ("OBJECT", "DAYNIGHTFLAG", daynight),
+                    ("OBJECT", "PRODUCTIONDATETIME", "2018-02-16T23:58:50.000Z"),
+                    ("OBJECT", "LOCALVERSIONID", "6.2.2"),
+                ],
+            ),
+            (
+                "GROUP",
+                "ORBITCALCULATEDSPATIALDOMAIN",
+                [
+                    (
+                        "OBJECT",
+                        "ORBITCALCULATEDSPATIALDOMAINCONTAINER",
+                        [
+                            (
+                                "OBJECT",
+                                "EQUATORCROSSINGDATE",
+                                f"{equator_time:%Y-%m-%d}",
+                            ),
+                            (
+                                "OBJECT",
+                                "EQUATORCROSSINGTIME",
+                                f"{equator_time:%H:%M:%S.%f}",
+                            ),
+                            ("OBJECT", "ORBITNUMBER", orbit),
+                            (
+                                "OBJECT",
+                                "EQUATORCROSSINGLONGITUDE",
+                                round(float(np.mean(corner_lons)), 6),
+                            ),
+                        ],
+                    )
+                ],
+            ),
+            (
+                "GROUP",
+                "COLLECTIONDESCRIPTIONCLASS",
+                [("OBJECT", "SHORTNAME", shortname), ("OBJECT", "VERSIONID", 61)],
+            ),
+            (
+                "GROUP",
+                "SPATIALDOMAINCONTAINER",
+                [
+                    (
+                        "GROUP",
+                        "HORIZONTALSPATIALDOMAINCONTAINER",
+                        [
+                            (
+                                "GROUP",
+                                "GPOLYGON",
+                                [
+                                    (
+                                        "OBJECT",
+                                        "GPOLYGONCONTAINER",
+                                        [
+                                            (
+                                                "GROUP",
+                                                "GRINGPOINT",
+                                                [
+                                                    (
+                                                        "OBJECT",
+                                                        "GRINGPOINTLONGITUDE",
+                                                        gring_lons,
+                                                    ),
+                                                    (
+                                                        "OBJECT",
+                                                        "GRINGPOINTLATITUDE",
+                                                        gring_lats,
+                                                    ),
+                                                    (
+                                                        "OBJECT",
+                                                        "GRINGPOINTSEQUENCENO",
+                                                        (1, 2, 3, 4),
+                                                    ),
+                                                ],
+                                            ),
+                                            (
+                                                "GROUP",
+                                                "GRING",
+                                                [("OBJECT", "EXCLUSIONGRINGFLAG", "N")],
+                                            ),
+                                        ],
+                                    )
+                                ],
+                            )
+                        ],
+                    )
+                ],
+            ),
+            (
+                "GROUP",
+                "RANGEDATETIME",
+                [
+                    ("OBJECT", "RANGEENDINGDATE", f"{stop_time:%Y-%m-%d}"),
+                    ("OBJECT", "RANGEENDINGTIME", f"{stop_time:%H:%M:%S.%f}"),
+                    ("OBJECT", "RANGEBEGINNINGDATE", f"{start_time:%Y-%m-%d}"),
+                    ("OBJECT", "RANGEBEGINNINGTIME", f"{start_time:%H:%M:%S.%f}"),
+                ],
+            ),
+            (
+                "GROUP",
+                "ASSOCIATEDPLATFORMINSTRUMENTSENSOR",
+                [
+                    (
+                        "OBJECT",
+                        "ASSOCIATEDPLATFORMINSTRUMENTSENSORCONTAINER",
+                        [
+                            ("OBJECT", "ASSOCIATEDSENSORSHORTNAME", "MODIS"),
+                            ("OBJECT", "ASSOCIATEDPLATFORMSHORTNAME", platform),
+                            ("OBJECT", "ASSOCIATEDINSTRUMENTSHORTNAME", "MODIS"),
+                        ],
+                    )
+                ],
+            ),
+        ],
+    )
+    return "\n" + "\n".join(_odl(tree)) + "\n\nEND\n"
+
+
+def gring_corners(lons, lats):
+    """G-ring corners, counter clockwise starting from the last column of row 0"""
+    corners = (0, -1), (0, 0), (-1, 0), (-1, -1)
+    return (
+        [float(lons[row, col]) for row, col in corners],
+        [float(lats[row, col]) for row, col in corners],
+    )
+
+
+def _scene(shape, seed):
+    """smooth cloud-like field in [0, 1) with some speckle"""
+    rng = np.random.default_rng(seed)
+    rows, cols = shape
+    y = np.linspace(0.0, 1.0, rows, dtype=np.float32)[:, np.newaxis]
+    x = np.linspace(0.0, 1.0, cols, dtype=np.float32)[np.newaxis, :]
+    field = np.zeros(shape, dtype=np.float32)
+    for _ in range(6):
+        kx, ky, phase = rng.uniform(1.0, 12.0, 3)
+        field += np.sin(2 * np.pi * kx * x + phase) * np.cos(2 * np.pi * ky * y)
+    field = (field - field.min()) / (np.ptp(field) + 1.0e-6)
+    field += rng.normal(0.0, 0.02, shape).astype(np.float32)
+    return np.clip(field, 0.0, 0.999)
+
+
+def _set_dims(sds, names):
+    for index, name in enumerate(names):
+        sds.dim(index).setname(f"{name}:MODIS_SWATH_Type_L1B")
+
+
+def granule_name(shortname, start_time, production="2018047235850", ext="hdf"):
+    """MODIS style name, e.g. MYD021KM.A2013222.2105.061.2018047235850.hdf"""
+    return f"{shortname}.A{start_time:%Y%j.%H%M}.061.{production}.{ext}"
+
+
+def write_modis_l1b(
+    filename,
+    rows=modis_rows,
+    cols=modis_cols,
+    start_lon=-115.0,
+    start_lat=60.0,
+    heading=190.0,
+    start_time=datetime.datetime(2013, 8, 10, 21, 5),
+    orbit=61523,
+    daynight="Day",
+    seed=0,
+):
+    """
+    write a MYD021KM-like Level1b file
+
+    rows must be a multiple of 10 (one scan).  Latitude and Longitude are
+    stored at 5 km like the real product (every 5th pixel starting at 2).
+
+    Returns
+    -------
+
+    filename: Path
+    """
+    from pyhdf.SD import SD, SDC
+
+    filename = Path(filename)
+    lons, lats = swath_geolocation(rows, cols, start_lon, start_lat, heading)
+    corner_lons, corner_lats = gring_corners(lons, lats)
+    the_file = SD(str(filename), SDC.WRITE | SDC.CREATE)
+    the_file.attr("CoreMetadata.0").set(
+        SDC.CHAR,
+        core_metadata(
+            filename.name,
+            corner_lons,
+            corner_lats,
+            start_time=start_time,
+            orbit=orbit,
+            daynight=daynight,
+        ),
+    )
+    the_file.attr("Number of Scans").set(SDC.INT32, rows // rows_per_scan)
+    rng = np.random.default_rng(seed)
+    base = _scene((rows, cols), seed)
+    for name, band_names, reflective in l1b_datasets:
+        nbands = len(band_names.split(","))
+        sds = the_file.create(name, SDC.UINT16, (nbands, rows, cols))
+        _set_dims(sds, [f"Band_{name[3:]}", f"{rows_per_scan}*nscans", "Max_EV_frames"])
+        for band in range(nbands):
+            contrast = rng.uniform(0.3, 1.0)
+            counts = (base * contrast + rng.uniform(0.0, 1.0 - contrast)) * 32000.0
+            sds[band] = counts.astype(np.uint16)
+        sds.attr("band_names").set(SDC.CHAR, band_names)
+        sds.attr("valid_range").set(SDC.UINT16, [0, 32767])
+        sds.attr("_FillValue").set(SDC.UINT16, 65535)
+        sds.attr("radiance_scales").set(
+            SDC.FLOAT32, list(rng.uniform(1.0e-4, 4.0e-3, nbands))
+        )
+        sds.attr("radiance_offsets").set(
+            SDC.FLOAT32, list(rng.uniform(0.0, 2000.0, nbands))
+        )
+        sds.attr("radiance_units").set(SDC.CHAR, "Watts/m^2/micrometer/steradian")
+        if reflective:
+            sds.attr("reflectance_scales").set(
+                SDC.FLOAT32, list(rng.uniform(2.0e-5, 6.0e-5, nbands))
+            )
+            sds.attr("reflectance_offsets").set(SDC.FLOAT32, [316.9722] * nbands)
+            sds.attr("reflectance_units").set(SDC.CHAR, "none")
+        sds.endaccess()
+    for name, values in [("Latitude", lats), ("Longitude", lons)]:
+        decimated = np.ascontiguousarray(values[2::5, 2::5])
+        sds = the_file.create(name, SDC.FLOAT32, decimated.shape)
+        _set_dims(sds, ["2*nscans", "1KM_geo_dim"])
+        sds[:] = decimated
+        sds.attr("units").set(SDC.CHAR, "degrees")
+        sds.attr("_FillValue").set(SDC.FLOAT32, -999.0)
+        sds.endaccess()
+    the_file.end()
+    return filename
+
+
+def write_modis_03(
+    filename,
+    rows=modis_rows,
+    cols=modis_cols,
+    start_lon=-115.0,
+    start_lat=60.0,
+    heading=190.0,
+    start_time=datetime.datetime(2013, 8, 10, 21, 5),
+    orbit=61523,
+    daynight="Day",
+):
+    """
+    write a MYD03-like geolocation file with full resolution
+    Latitude, Longitude and SensorZenith (int16, scale 0.01)
+
+    Returns
+    -------
+
+    filename: Path
+    """
+    from pyhdf.SD import SD, SDC
+
+    filename = Path(filename)
+    lons, lats = swath_geolocation(rows, cols, start_lon, start_lat, heading)
+    corner_lons, corner_lats = gring_corners(lons, lats)
+    the_file = SD(str(filename), SDC.WRITE | SDC.CREATE)
+    the_file.attr("CoreMetadata.0").set(
+        SDC.CHAR,
+        core_metadata(
+            filename.name,
+            corner_lons,
+            corner_lats,
+            start_time=start_time,
+            orbit=orbit,
+            daynight=daynight,
+            shortname="MYD03",
+        ),
+    )
+    for name, values in [("Latitude", lats), ("Longitude", lons)]:
+        sds = the_file.create(name, SDC.FLOAT32, values.shape)
+        sds[:] = values
+        sds.attr("units").set(SDC.CHAR, "degrees")
+        sds.attr("_FillValue").set(SDC.FLOAT32, -999.0)
+        sds.endaccess()
+    scan_angle = np.abs(np.linspace(-max_scan_angle, max_scan_angle, cols))
+    zenith = np.arcsin((radius + aqua_height) / radius * np.sin(np.deg2rad(scan_angle)))
+    zenith = np.broadcast_to(np.rad2deg(zenith) * 100.0, (rows, cols))
+    sds = the_file.create("SensorZenith", SDC.INT16, (rows, cols))
+    sds[:] = zenith.astype(np.int16)
+    sds.attr("scale_factor").set(SDC.FLOAT64, 0.01)
+    sds.endaccess()
+    the_file.end()
+    return filename
+
+
+#
+# GOES-16 ABI fixed grid constants
+#
+goes_height = 35_786_023.0
+goes_semi_major = 6_378_137.0
+goes_semi_minor = 6_356_752.31414
+goes_lon_0 = -75.0
+#
+# band: (central wavelength um, planck_fk1, planck_fk2, planck_bc1, planck_bc2)
+#
+goes_bands = {
+    8: (6.19, 50241.0, 2447.8, 1.6172, 0.99919),
+    10: (7.34, 30780.0, 2081.0, 0.87, 0.99957),
+    11: (8.44, 20170.0, 1807.3, 0.43, 0.99972),
+    13: (10.33, 10803.0, 1392.7, 0.07552, 0.99975),
+    14: (11.19, 8510.2, 1286.7, 0.22516, 0.99920),
+    15: (12.27, 6454.6, 1173.0, 0.21702, 0.99916),
+}
+
+
+def goes_name(band, start_time, sector="RadC", satellite="G16"):
+    """ABI L1b file name, e.g. OR_ABI-L1b-RadC-M6C13_G16_s2019208...nc"""
+    stop_time = start_time + datetime.timedelta(minutes=granule_minutes)
+
+    def stamp(the_time):
+        return f"{the_time:%Y%j%H%M%S}{the_time.microsecond // 100000}"
+
+    return (
+        f"OR_ABI-L1b-{sector}-M6C{band:02d}_{satellite}_s{stamp(start_time)}"
+        f"_e{stamp(stop_time)}_c{stamp(stop_time)}.nc"
+    )
+
+
+def write_goes_l1b(
+    filename,
+    band=13,
+    rows=1500,
+    cols=2500,
+    start_time=datetime.datetime(2019, 7, 27, 18, 1),
+    seed=0,
+):
+    """
+    write an ABI L1b radiance file on the CONUS fixed grid (2 km infrared
+    pixels, 56 microradians), with scaled int16 Rad and the projection
+    variables satpy's abi_l1b reader expects
+
+    Returns
+    -------
+
+    filename: Path
+    """
+    import netCDF4
+
+    filename = Path(filename)
+    wavelength, fk1, fk2, bc1, bc2 = goes_bands[band]
+    step = 56.0e-6
+    x0, y0 = -0.101332, 0.128212  # upper left of the CONUS sector
+    with netCDF4.Dataset(str(filename), "w", format="NETCDF4") as nc:
+        nc.createDimension("y", rows)
+        nc.createDimension("x", cols)
+        nc.createDimension("band", 1)
+        nc.dataset_name = filename.name
+        nc.platform_ID = "G16"
+        nc.instrument_type = "GOES R Series Advanced Baseline Imager"
+        nc.scene_id = "CONUS"
+        stop_time = start_time + datetime.timedelta(minutes=granule_minutes)
+        nc.time_coverage_start = f"{start_time:%Y-%m-%dT%H:%M:%S}.0Z"
+        nc.time_coverage_end = f"{stop_time:%Y-%m-%dT%H:%M:%S}.0Z"
+        for name, start, sign, size in [("x", x0, 1.0, cols), ("y", y0, -1.0, rows)]:
+            var = nc.createVariable(name, "i2", (name,))
+            var.scale_factor = np.float32(sign * step)
+            var.add_offset = np.float32(start)
+            var.units = "rad"
+            var.axis = name.upper()
+            var.set_auto_maskandscale(False)
+            var[:] = np.arange(size, dtype=np.int16)
+        proj = nc.createVariable("goes_imager_projection", "i4")
+        proj.grid_mapping_name = "geostationary"
+        proj.perspective_point_height = goes_height
+        proj.semi_major_axis = goes_semi_major
+        proj.semi_minor_axis = goes_semi_minor
+        proj.inverse_flattening = 298.2572221
+        proj.latitude_of_projection_origin = 0.0
+        proj.longitude_of_projection_origin = goes_lon_0
+        proj.sweep_angle_axis = "x"
+        #
+        # brightness temperatures between 200 and 300 K, inverted planck
+        #
+        temps = 200.0 + 100.0 * _scene((rows, cols), seed)
+        rad = fk1 / (np.exp(fk2 / (bc1 + bc2 * temps)) - 1.0)
+        scale = float(rad.max()) / 4000.0
+        rad_var = nc.createVariable(
+            "Rad",
+            "i2",
+            ("y", "x"),
+            zlib=True,
+            chunksizes=(min(rows, 226), min(cols, 226)),
+            fill_value=np.int16(1023),
+        )
+        rad_var.scale_factor = np.float32(scale)
+        rad_var.add_offset = np.float32(0.0)
+        rad_var.units = "mW m-2 sr-1 (cm-1)-1"
+        rad_var.grid_mapping = "goes_imager_projection"
+        rad_var.set_auto_maskandscale(False)
+        rad_var[:] = np.round(rad / scale).astype(np.int16)
+        dqf = nc.createVariable(
+            "DQF", "i1", ("y", "x"), zlib=True, fill_value=np.int8(-1)
+        )
+        dqf[:] = np.zeros((rows, cols), dtype=np.int8)
+        for name, value in [
+            ("planck_fk1", fk1),
+            ("planck_fk2", fk2),
+            ("planck_bc1", bc1),
+            ("planck_bc2", bc2),
+            ("nominal_satellite_subpoint_lon", goes_lon_0),
+            ("nominal_satellite_subpoint_lat", 0.0),
+            ("nominal_satellite_height", goes_height / 1000.0),
+            ("esun", -999.0),
+            ("earth_sun_distance_anomaly_in_AU", 1.0),
+        ]:
+            var = nc.createVariable(name, "f4")
+            var[...] = value
+        band_id = nc.createVariable("band_id", "i1", ("band",))
+        band_id[:] = band
+        band_wavelength = nc.createVariable("band_wavelength", "f4", ("band",))
+        band_wavelength.units = "um"
+        band_wavelength[:] = wavelength
+        t = nc.createVariable("t", "f8")
+        t.units = "seconds since 2000-01-01 12:00:00"
+        t[...] = (start_time - datetime.datetime(2000, 1, 1, 12)).total_seconds()
+    return filename
+
+
+def generate(
+    kind="modis",
+    count=1,
+    dest_folder=".",
+    rows=None,
+    cols=None,
+    start_time=None,
+    band=13,
+    geolocation=True,
+):
+    """
+    write count consecutive synthetic granules
+
+    Parameters
+    ----------
+
+    kind: str
+       'modis' for MYD021KM (plus MYD03 when geolocation is True)
+       or 'goes' for ABI L1b CONUS files
+
+    count: int
+       number of consecutive granules (5 minutes apart)
+
+    dest_folder: str or Path
+       created if it doesn't exist
+
+    rows, cols: optional int
+       swath/grid size, defaults to a full MODIS granule (2030x1354)
+       or a CONUS infrared grid (1500x2500)
+
+    Returns
+    -------
+
+    filenames: list of Path
+    """
+    dest_path = Path(dest_folder)
+    dest_path.mkdir(parents=True, exist_ok=True)
+    step = datetime.timedelta(minutes=granule_minutes)
+    filenames = []
+    if kind == "modis":
+        rows = modis_rows if rows is None else rows // rows_per_scan * rows_per_scan
+        cols = modis_cols if cols is None else cols
+        the_time = start_time or datetime.datetime(2013, 8, 10, 21, 5)
+        lon, lat, heading = -115.0, 60.0, 190.0
+        for count_index in range(count):
+            args = dict(
+                rows=rows,
+                cols=cols,
+                start_lon=lon,
+                start_lat=lat,
+                heading=heading,
+                start_time=the_time,
+            )
+            name = granule_name("MYD021KM", the_time)
+            filenames.append(
+                write_modis_l1b(dest_path / name, seed=count_index, **args)
+            )
+            if geolocation:
+                name = granule_name("MYD03", the_time)
+                filenames.append(write_modis_03(dest_path / name, **args))
+            lon, lat, heading = next_start(lon, lat, heading, rows=modis_rows)
+            the_time += step
+    elif kind == "goes":
+        rows = 1500 if rows is None else rows
+        cols = 2500 if cols is None else cols
+        the_time = start_time or datetime.datetime(2019, 7, 27, 18, 1)
+        for count_index in range(count):
+            name = goes_name(band, the_time)
+            filenames.append(
+                write_goes_l1b(
+                    dest_path / name, band, rows, cols, the_time, count_index
+                )
+            )
+            the_time += step
+    else:
+        raise ValueError(f"kind must be 'modis' or 'goes', not {kind}")
+    print(f"wrote {len(filenames)} files to {dest_path}")
+    return filenames
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("--kind", choices=["modis", "goes"], default="modis")
+    parser.add_argument("--count", type=int, default=1, help="number of granules")
+    parser.add_argument("--dest_folder", type=str, default=".", help="output folder")
+    parser.add_argument("--rows", type=int, default=None)
+    parser.add_argument("--cols", type=int, default=None)
+    parser.add_argument("--band", type=int, default=13, help="ABI band for --kind goes")
+    parser.add_argument(
+        "--no-geolocation",
+        action="store_true",
+        help="don't write the MYD03 file for each MYD021KM granule",
+    )
+    return parser
+
+
+def main(args=None):
+    parser = make_parser()
+    args = parser.parse_args(args)
+    generate(
+        args.kind,
+        count=args.count,
+        dest_folder=args.dest_folder,
+        rows=args.rows,
+        cols=args.cols,
+        band=args.band,
+        geolocation=not args.no_geolocation,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+  satcode.tiles
+  _____________
+
+  web mercator (XYZ) tile pyramids from a resampled grid, written as a
+  z/x/y.png directory tree or a single MBTiles sqlite file, for the web
+  viewer.
+
+  Only the tiles that intersect the area are built.  For each tile at the
+  deepest zoom the 256 x 256 pixel centres are projected back into the
+  area's crs and looked up nearest neighbour in the grid; those lookup
+  indices depend only on the (area, tile) pair and are cached, so the
+  next band or date on the same area definition skips the projection.
+  The shallower zooms are built bottom up by averaging 2 x 2 blocks of
+  the four child tiles, one zoom level at a time with the tiles of a
+  level spread over a thread pool.  Tiles with no data are skipped.
+
+  to run from a python script::
+
+    from satcode.tiles import build_pyramid
+    build_pyramid(image, area_def, 'b31.mbtiles', min_zoom=3, vmin=200, vmax=320)
+    build_pyramid(image, area_def, 'tiles/b31', cmap='inferno')
+"""
+import collections
+import concurrent.futures
+import hashlib
+import math
+import sqlite3
+import struct
+import threading
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+from satcode.overlay import colorize
+
+tile_size = 256
+earth_radius = 6_378_137.0  # web mercator sphere, meters
+origin = math.pi * earth_radius
+cache_size = 4096
+_index_cache = collections.OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def area_key(area_def):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(area_def.crs.to_wkt().encode())
+    digest.update(str((area_def.shape, area_def.area_extent)).encode())
+    return digest.hexdigest()
+
+
+def tile_span(zoom):
+    """width of a tile in web mercator meters"""
+    return 2.0 * origin / 2**zoom
+
+
+def max_zoom_for(area_def):
+    """deepest zoom whose pixels are no coarser than the grid's pixels"""
+    resolution = min(area_def.pixel_size_x, area_def.pixel_size_y)
+    return max(0, math.ceil(math.log2(2.0 * origin / (tile_size * resolution))))
+
+
+def mercator_bounds(area_def):
+    """
+    (x_min, y_min, x_max, y_max) of the area in web mercator meters,
+    clipped to the mercator square
+    """
+    import pyproj
+
+    transformer = pyproj.Transformer.from_crs(area_def.crs, "EPSG:3857", always_xy=True)
+    bounds = transformer.transform_bounds(*area_def.area_extent, densify_pts=51)
+    bounds = np.nan_to_num(np.asarray(bounds), posinf=origin, neginf=-origin)
+    return tuple(np.clip(bounds, -origin, origin))
+
+
+def tile_range(bounds, zoom):
+    """
+    Returns
+    -------
+
+    xs, ys: range
+       XYZ tile columns and rows (y counted down from the north edge)
+    """
+    x_min, y_min, x_max, y_max = bounds
+    span = tile_span(zoom)
+    last = 2**zoom - 1
+    x0 = min(int((x_min + origin) // span), last)
+    x1 = min(int((x_max + origin) // span), last)
+    y0 = min(int((origin - y_max) // span), last)
+    y1 = min(int((origin - y_min) // span), last)
+    return range(x0, x1 + 1), range(y0, y1 + 1)
+
+
+def tile_index(area_def, zoom, x, y, key=None):
+    """
+    flat grid index of the pixel nearest each tile pixel, -1 outside the
+    area.  Cached on (area, zoom, x, y)
+
+    Returns
+    -------
+
+    index: int64 array of shape (tile_size, tile_size)
+    """
+    key = (key or area_key(area_def), zoom, x, y)
+    with _lock:
+        if key in _index_cache:
+            _index_cache.move_to_end(key)
+            instrument.count("tile_index_hits")
+            return _index_cache[key]
+    instrument.count("tile_index_misses")
+    span = tile_span(zoom)
+    pixel = span / tile_size
+    centres = (np.arange(tile_size) + 0.5) * pixel
+    mx = -origin + x * span + centres
+    my = origin - y * span - centres
+    mx, my = np.meshgrid(mx, my)
+    transformer = _transformer(area_def.crs.to_wkt())
+    ax, ay = transformer.transform(mx, my)
+    x_min, y_min, x_max, y_max = area_def.area_extent
+    with np.errstate(invalid="ignore"):
+        cols = np.floor((ax - x_min) / area_def.pixel_size_x)
+        rows = np.floor((y_max - ay) / area_def.pixel_size_y)
+    inside = (cols >= 0) & (cols < area_def.width) & (rows >= 0)
+    inside &= rows < area_def.height
+    index = np.full(mx.shape, -1, dtype=np.int64)
+    index[inside] = rows[inside].astype(np.int64) * area_def.width + cols[
+        inside
+    ].astype(np.int64)
+    with _lock:
+        _index_cache[key] = index
+        while len(_index_cache) > cache_size:
+            _index_cache.popitem(last=False)
+    return index
+
+
+def _transformer(crs_wkt):
+    """
+    mercator -> area crs transformers, one per crs and thread since
+    pyproj transformers can't be shared between threads
+    """
+    import pyproj
+
+    transformers = getattr(_local, "transformers", None)
+    if transformers is None:
+        transformers = _local.transformers = {}
+    if crs_wkt not in transformers:
+        transformers[crs_wkt] = pyproj.Transformer.from_crs(
+            "EPSG:3857", pyproj.CRS.from_wkt(crs_wkt), always_xy=True
+        )
+    return transformers[crs_wkt]
+
+
+def clear_cache():
+    with _lock:
+        _index_cache.clear()
+
+
+def _leaf(flat_image, area_def, key, zoom, x, y):
+    index = tile_index(area_def, zoom, x, y, key)
+    if (index < 0).all():
+        return None
+    tile = np.take(flat_image, np.maximum(index, 0))
+    tile[index < 0] = np.nan
+    if np.isnan(tile).all():
+        return None
+    return tile
+
+
+def _parent(children):
+    """
+    average 2 x 2 blocks of the four children, ignoring NaN
+
+    children: dict
+       (dx, dy) -> tile or missing
+    """
+    mosaic = np.full((2 * tile_size, 2 * tile_size), np.nan, dtype=np.float32)
+    for (dx, dy), tile in children.items():
+        mosaic[
+            dy * tile_size : (dy + 1) * tile_size, dx * tile_size : (dx + 1) * tile_size
+        ] = tile
+    blocks = mosaic.reshape(tile_size, 2, tile_size, 2)
+    valid = np.isfinite(blocks)
+    total = np.where(valid, blocks, 0.0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan).astype(np.float32)
+
+
+def encode_png(rgba):
+    """minimal rgba png encoder (zlib only, no image library needed)"""
+    rows, cols = rgba.shape[:2]
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    raw = np.zeros((rows, 1 + 4 * cols), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(rows, 4 * cols)
+    header = struct.pack(">IIBBBBB", cols, rows, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+class DirectoryWriter:
+    """z/x/y.png tree"""
+
+    def __init__(self, folder, **metadata):
+        self.folder = Path(folder)
+
+    def write(self, zoom, x, y, data):
+        path = self.folder / str(zoom) / str(x) / f"{y}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+    def close(self):
+        pass
+
+
+class MBTilesWriter:
+    """
+    MBTiles 1.3 sqlite file; rows are stored in TMS order (y flipped)
+    """
+
+    def __init__(self, filename, **metadata):
+        self.connection = sqlite3.connect(str(filename))
+        cursor = self.connection.cursor()
+        cursor.execute("create table if not exists metadata (name text, value text)")
+        cursor.execute(
+            "create table if not exists tiles (zoom_level integer, "
+            "tile_column integer, tile_row integer, tile_data blob)"
+        )
+        cursor.execute(
+            "create unique index if not exists tile_index "
+            "on tiles (zoom_level, tile_column, tile_row)"
+        )
+        cursor.execute("delete from metadata")
+        cursor.executemany(
+            "insert into metadata values (?, ?)",
+            [(key, str(value)) for key, value in metadata.items()],
+        )
+
+    def write(self, zoom, x, y, data):
+        self.connection.execute(
+            "insert or replace into tiles values (?, ?, ?, ?)",
+            (zoom, x, 2**zoom - 1 - y, sqlite3.Binary(data)),
+        )
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+def build_pyramid(
+    image,
+    area_def,
+    out,
+    min_zoom=0,
+    max_zoom=None,
+    cmap="viridis",
+    vmin=None,
+    vmax=None,
+    workers=None,
+    name=None,
+):
+    """
+    Parameters
+    ----------
+
+    image: 2-d float array
+       resampled onto area_def, NaN where there is no data
+
+    area_def: pyresample AreaDefinition
+
+    out: str or Path
+       ending in .mbtiles for an MBTiles file, else a folder for z/x/y.png
+
+    min_zoom, max_zoom: int
+       max_zoom defaults to max_zoom_for(area_def)
+
+    cmap, vmin, vmax:
+       passed to satcode.overlay.colorize; vmin/vmax default to the
+       image's range so every tile uses the same color scale
+
+    workers: optional int
+       threads per zoom level
+
+    Returns
+    -------
+
+    counts: dict
+       zoom -> number of tiles written
+    """
+    image = np.asarray(image, dtype=np.float32)
+    if vmin is None:
+        vmin = float(np.nanmin(image))
+    if vmax is None:
+        vmax = float(np.nanmax(image))
+    if max_zoom is None:
+        max_zoom = max_zoom_for(area_def)
+    bounds = mercator_bounds(area_def)
+    out = Path(out)
+    metadata = dict(
+        name=name or out.stem,
+        format="png",
+        type="overlay",
+        minzoom=min_zoom,
+        maxzoom=max_zoom,
+        bounds=",".join(f"{value:.6f}" for value in _lonlat_bounds(bounds)),
+    )
+    writer_class = MBTilesWriter if out.suffix == ".mbtiles" else DirectoryWriter
+    writer = writer_class(out, **metadata)
+    key = area_key(area_def)
+    flat_image = image.ravel()
+    counts = {}
+
+    def encode(tile):
+        return encode_png(colorize(tile, cmap=cmap, vmin=vmin, vmax=vmax))
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            xs, ys = tile_range(bounds, max_zoom)
+            jobs = [(x, y) for x in xs for y in ys]
+            with instrument.span("tile_leaves", zoom=max_zoom) as the_span:
+                tiles = pool.map(
+                    lambda xy: _leaf(flat_image, area_def, key, max_zoom, *xy), jobs
+                )
+                level = {xy: tile for xy, tile in zip(jobs, tiles) if tile is not None}
+                the_span.add("tiles", len(level))
+            for zoom in range(max_zoom, min_zoom - 1, -1):
+                if zoom < max_zoom:
+                    with instrument.span("tile_downsample", zoom=zoom) as the_span:
+                        families = collections.defaultdict(dict)
+                        for (x, y), tile in level.items():
+                            families[(x // 2, y // 2)][(x % 2, y % 2)] = tile
+                        parents = list(families)
+                        tiles = pool.map(lambda xy: _parent(families[xy]), parents)
+                        level = dict(zip(parents, tiles))
+                        the_span.add("tiles", len(level))
+                with instrument.span("tile_write", zoom=zoom):
+                    encoded = pool.map(encode, level.values())
+                    for (x, y), data in zip(level, encoded):
+                        writer.write(zoom, x, y, data)
+                counts[zoom] = len(level)
+    finally:
+        writer.close()
+    return counts
+
+
+def _lonlat_bounds(bounds):
+    x_min, y_min, x_max, y_max = bounds
+
+    def to_lonlat(x, y):
+        lon = math.degrees(x / earth_radius)
+        lat = math.degrees(2.0 * math.atan(math.exp(y / earth_radius)) - math.pi / 2)
+        return lon, lat
+
+    west, south = to_lonlat(x_min, y_min)
+    east, north = to_lonlat(x_max, y_max)
+    return west, south, east, north
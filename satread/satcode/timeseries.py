@@ -0,0 +1,296 @@
+"""
+  satcode.timeseries
+  __________________
+
+  values at a few sites (e.g. the Vancouver point in cartopy_mapping)
+  across years of MODIS granules, as a tidy table with one row per
+  site, granule and band.
+
+  The footprint catalog (satcode.catalog) prunes the granules that can't
+  see a site without opening them.  For the rest the nearest swath pixel
+  is found by inverting the geolocation: a decimated read narrows the
+  search to a small window (satcode.roi.find_window), and only that
+  window of Latitude/Longitude is read to pick the closest pixel.  Then
+  only that one pixel of each band is read.  Pixel locations are cached
+  per granule (in memory, and as json under cache_dir if given) so a
+  second run with other bands skips the geolocation entirely.  Granules
+  are processed in parallel on a process pool, since hdf4 isn't thread
+  safe.
+
+  to run from the command line::
+
+    python -m satcode.timeseries ../data/catalog.npz --site vancouver -123.1207 49.2827 --bands 31 32 --out vancouver.csv
+
+  to run from a python script::
+
+    from satcode.catalog import load_catalog
+    from satcode.timeseries import extract_points
+    rows = extract_points(load_catalog('catalog.npz'), {'vancouver': (-123.1207, 49.2827)}, bands=['31'])
+"""
+import argparse
+import concurrent.futures
+import csv
+import functools
+import json
+from pathlib import Path
+
+import numpy as np
+
+from satcode import instrument
+
+columns = [
+    "site",
+    "time",
+    "band",
+    "value",
+    "lon",
+    "lat",
+    "distance_km",
+    "row",
+    "col",
+    "stride",
+    "filename",
+]
+
+
+@functools.lru_cache(maxsize=4096)
+def locate(path, lon, lat, max_distance_km=5.0):
+    """
+    nearest swath pixel to (lon, lat)
+
+    Returns
+    -------
+
+    location: tuple or None
+       (row, col, stride, distance_km, pixel_lon, pixel_lat) with row, col
+       in the geolocation grid (see satcode.pipeline.read_geolocation), or
+       None if no pixel is within max_distance_km
+    """
+    from satcode.pipeline import read_geolocation
+    from satcode.roi import find_window, great_circle_km
+
+    window = find_window(path, point=(lon, lat), radius_km=max_distance_km)
+    if window is None:
+        return None
+    lons, lats, stride = read_geolocation(path, window)
+    distance = great_circle_km(lons, lats, lon, lat)
+    row, col = np.unravel_index(np.nanargmin(distance), distance.shape)
+    if distance[row, col] > max_distance_km:
+        return None
+    return (
+        int(row + window[0]),
+        int(col + window[2]),
+        int(stride),
+        float(distance[row, col]),
+        float(lons[row, col]),
+        float(lats[row, col]),
+    )
+
+
+def _cached_locations(path, sites, max_distance_km, cache_dir):
+    """locate every site, through the json cache for this granule"""
+    cache_path = None
+    cached = {}
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / (Path(path).stem + "_locations.json")
+        if cache_path.exists():
+            cached = json.loads(cache_path.read_text())
+    locations = {}
+    changed = False
+    for name, (lon, lat) in sites.items():
+        key = f"{lon:.6f},{lat:.6f},{max_distance_km}"
+        if key not in cached:
+            cached[key] = locate(str(path), lon, lat, max_distance_km)
+            changed = True
+        locations[name] = cached[key]
+    if cache_path is not None and changed:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(cached))
+    return locations
+
+
+def granule_values(record, sites, bands, max_distance_km=5.0, cache_dir=None):
+    """
+    tidy rows for the sites inside one catalogued granule
+
+    Parameters
+    ----------
+
+    record: dict
+       satcode.catalog record
+
+    sites: dict
+       name -> (lon, lat)
+
+    bands: list of str
+       MODIS band names
+    """
+    from satcode.pipeline import read_band
+
+    path = record["path"]
+    rows = []
+    with instrument.span("granule_values", filename=record["filename"]):
+        locations = _cached_locations(path, sites, max_distance_km, cache_dir)
+        for name, location in locations.items():
+            if location is None:
+                continue
+            row, col, stride, distance_km, pixel_lon, pixel_lat = location
+            window = (row, row + 1, col, col + 1)
+            for band in bands:
+                value = read_band(path, band, stride, window)[0, 0]
+                rows.append(
+                    dict(
+                        site=name,
+                        time=record["start"],
+                        band=band,
+                        value=float(value),
+                        lon=pixel_lon,
+                        lat=pixel_lat,
+                        distance_km=distance_km,
+                        row=row,
+                        col=col,
+                        stride=stride,
+                        filename=record["filename"],
+                    )
+                )
+    return rows
+
+
+def extract_points(
+    catalog,
+    sites,
+    bands=("31",),
+    workers=None,
+    max_distance_km=5.0,
+    cache_dir=None,
+    margin_km=10.0,
+    start=None,
+    stop=None,
+):
+    """
+    Parameters
+    ----------
+
+    catalog: satcode.catalog.Catalog
+       from build_catalog or load_catalog
+
+    sites: dict
+       name -> (lon, lat)
+
+    bands: list of str
+       MODIS band names
+
+    workers: optional int
+       processes
+
+    max_distance_km: float
+       sites further than this from every pixel of a granule are skipped
+
+    cache_dir: optional str or Path
+       keep the pixel location of each site in each granule here
+
+    margin_km: float
+       passed to satcode.catalog.covers
+
+    start, stop: optional str or datetime64
+       only granules overlapping this time window (satcode.catalog.TimeIndex)
+
+    Returns
+    -------
+
+    rows: list of dict
+       with the keys in columns, sorted by site, time and band
+    """
+    from satcode.catalog import TimeIndex, covers
+
+    if start is not None or stop is not None:
+        index = TimeIndex(catalog)
+        catalog = index.window(
+            index.starts[0] if start is None else start,
+            index.stops.max() if stop is None else stop,
+        )
+    #
+    # sites each granule has to look at, from the footprints alone
+    #
+    todo = {}
+    for name, (lon, lat) in sites.items():
+        inside = covers(catalog, lon, lat, margin_km)
+        for index in np.flatnonzero(inside):
+            todo.setdefault(int(index), {})[name] = (lon, lat)
+    rows = []
+    with instrument.span("extract_points") as the_span:
+        the_span.add("granules", len(todo))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(
+                    granule_values,
+                    catalog[index],
+                    granule_sites,
+                    list(bands),
+                    max_distance_km,
+                    cache_dir,
+                )
+                for index, granule_sites in todo.items()
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                rows.extend(future.result())
+    rows.sort(key=lambda row: (row["site"], row["time"], row["band"]))
+    return rows
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def make_parser():
+    """
+    set up the command line arguments needed to call the program
+    """
+    linebreaks = argparse.RawTextHelpFormatter
+    parser = argparse.ArgumentParser(
+        formatter_class=linebreaks, description=__doc__.lstrip()
+    )
+    parser.add_argument("catalog", type=str, help="catalog.npz from satcode.catalog")
+    parser.add_argument(
+        "--site",
+        nargs=3,
+        action="append",
+        required=True,
+        metavar=("NAME", "LON", "LAT"),
+        help="repeat for several sites",
+    )
+    parser.add_argument("--bands", nargs="+", default=["31"], help="MODIS band names")
+    parser.add_argument("--max_distance", type=float, default=5.0, help="km")
+    parser.add_argument("--cache_dir", type=str, default=None)
+    parser.add_argument("--start", type=str, default=None, help="e.g. 2013-08-01")
+    parser.add_argument("--stop", type=str, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", type=str, default="timeseries.csv")
+    return parser
+
+
+def main(args=None):
+    from satcode.catalog import load_catalog
+
+    parser = make_parser()
+    args = parser.parse_args(args)
+    sites = {name: (float(lon), float(lat)) for name, lon, lat in args.site}
+    rows = extract_points(
+        load_catalog(args.catalog),
+        sites,
+        bands=args.bands,
+        workers=args.workers,
+        max_distance_km=args.max_distance,
+        cache_dir=args.cache_dir,
+        start=args.start,
+        stop=args.stop,
+    )
+    write_csv(rows, args.out)
+    print(f"{len(rows)} rows written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
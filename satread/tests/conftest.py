@@ -0,0 +1,60 @@
+"""
+  shared fixtures: small synthetic granules (satcode.synthetic) and a
+  local http server standing in for the download site, so every test
+  runs offline
+"""
+import functools
+import http.server
+import threading
+
+import pytest
+
+from satcode import synthetic
+
+
+@pytest.fixture(scope="session")
+def granules(tmp_path_factory):
+    """a small MYD021KM/MYD03 pair, 40 rows (4 scans) by 60 columns"""
+    folder = tmp_path_factory.mktemp("granules")
+    return synthetic.generate("modis", count=1, dest_folder=folder, rows=40, cols=60)
+
+
+class _CountingHandler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class Upstream:
+    """a folder served over http; hits lists the paths requested"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        handler = functools.partial(_CountingHandler, directory=str(folder))
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.hits = []
+        self.hits = self.server.hits
+        self.root = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+@pytest.fixture
+def upstream(tmp_path, granules):
+    """Upstream serving a copy of the synthetic granules"""
+    folder = tmp_path / "upstream"
+    folder.mkdir()
+    for path in granules:
+        (folder / path.name).write_bytes(path.read_bytes())
+    with Upstream(folder) as server:
+        yield server
@@ -0,0 +1,25 @@
+"""
+  satcode.benchmark memory columns
+"""
+import numpy as np
+
+from satcode import benchmark
+
+
+def test_peak_rss_excludes_fixtures(monkeypatch, capsys):
+    fixture_size = 200 * 2**20
+
+    def setup(workdir, scale):
+        fixture = np.ones(fixture_size // 8)
+
+        def run():
+            return fixture.sum()
+
+        return run, "bytes", fixture.nbytes, None
+
+    monkeypatch.setitem(benchmark.stages, "fixture", setup)
+    (result,) = benchmark.run_benchmarks(["fixture"], repeat=2, isolate=False)
+    assert 0 <= result["peak_rss"] < fixture_size / 10
+    assert result["rss_growth"] < fixture_size / 10
+    benchmark.print_report([result])
+    assert "rss growth" in capsys.readouterr().out
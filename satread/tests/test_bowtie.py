@@ -0,0 +1,67 @@
+"""
+  MODIS bow-tie duplicate removal (satcode.bowtie) on synthetic swaths
+"""
+import warnings
+
+import numpy as np
+import pytest
+from pyhdf.SD import SD, SDC
+
+from satcode import synthetic
+from satcode.bowtie import bowtie_mask, deduplicate
+
+
+@pytest.fixture(scope="module")
+def full_width(tmp_path_factory):
+    """geolocation of a full width (1354 column) swath, 20 scans"""
+    folder = tmp_path_factory.mktemp("full_width")
+    paths = synthetic.generate("modis", dest_folder=folder, rows=200, cols=1354)
+    geolocation = [path for path in paths if path.name.startswith("MYD03")][0]
+    the_file = SD(str(geolocation), SDC.READ)
+    lons = the_file.select("Longitude").get()
+    lats = the_file.select("Latitude").get()
+    the_file.end()
+    return lons, lats
+
+
+def test_keep_fractions(full_width):
+    lons, lats = full_width
+    keep = bowtie_mask(lons, lats)
+    assert keep.shape == lons.shape
+    #
+    # no overlap near nadir, about a third dropped at the swath edges
+    #
+    assert keep[:, 600:750].mean() == 1.0
+    assert 0.5 < keep[:, :100].mean() < 0.75
+    assert 0.5 < keep[:, -100:].mean() < 0.75
+    assert 0.8 < keep.mean() < 0.9
+
+
+def test_chunking_does_not_change_mask(full_width):
+    lons, lats = full_width
+    whole = bowtie_mask(lons, lats, scans_per_chunk=100)
+    np.testing.assert_array_equal(bowtie_mask(lons, lats, scans_per_chunk=3), whole)
+
+
+def test_single_scan_keeps_everything(full_width):
+    lons, lats = full_width
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        keep = bowtie_mask(lons[:10], lats[:10])
+    assert keep.all()
+    swath_def, index = deduplicate(lons[:10], lats[:10], keep)
+    assert len(index) == keep.size
+
+
+def test_deduplicate_index(full_width):
+    lons, lats = full_width
+    keep = bowtie_mask(lons, lats)
+    swath_def, index = deduplicate(lons, lats, keep)
+    assert len(index) == keep.sum()
+    np.testing.assert_array_equal(swath_def.lons, lons.ravel()[index])
+
+
+def test_partial_scan_rejected(full_width):
+    lons, lats = full_width
+    with pytest.raises(ValueError):
+        bowtie_mask(lons[:15], lats[:15])
@@ -0,0 +1,83 @@
+"""
+  footprint tests for satcode.catalog on a hand made catalog, no hdf
+  files needed
+
+  to run from the satread folder::
+
+    python -m pytest tests
+"""
+import numpy as np
+
+from satcode.catalog import (
+    Catalog,
+    covering,
+    covers,
+    footprint_bbox,
+    footprint_centres,
+    record_dtype,
+)
+
+
+def make_catalog():
+    """two 10 degree square granules, over Vancouver and over Dakar"""
+    records = np.zeros(2, dtype=record_dtype)
+    records["filename"] = [b"vancouver.hdf", b"dakar.hdf"]
+    records["lon_list"] = [[-128, -118, -118, -128], [-22, -12, -12, -22]]
+    records["lat_list"] = [[44, 44, 54, 54], [10, 10, 20, 20]]
+    return Catalog(records, folders=["."])
+
+
+def test_covers_point_inside():
+    catalog = make_catalog()
+    assert covers(catalog, -123.1207, 49.2827).tolist() == [True, False]
+    assert covers(catalog, -17.4677, 14.7167).tolist() == [False, True]
+
+
+def test_covers_point_outside():
+    catalog = make_catalog()
+    assert not covers(catalog, 0.0, -60.0).any()
+
+
+def test_covers_antipode():
+    catalog = make_catalog()
+    lon, lat = -123.1207, 49.2827
+    assert not covers(catalog, lon + 180.0, -lat).any()
+    assert not covers(catalog, -17.4677 + 180.0, -14.7167).any()
+
+
+def test_covers_reversed_corner_order():
+    catalog = make_catalog()
+    catalog.records["lon_list"] = catalog.records["lon_list"][:, ::-1]
+    catalog.records["lat_list"] = catalog.records["lat_list"][:, ::-1]
+    assert covers(catalog, -123.1207, 49.2827).tolist() == [True, False]
+    assert not covers(catalog, -123.1207 + 180.0, -49.2827).any()
+
+
+def test_covering_empty():
+    catalog = Catalog()
+    assert len(covers(catalog, 0.0, 0.0)) == 0
+    assert len(covering(catalog, 0.0, 0.0)) == 0
+
+
+def test_footprint_across_antimeridian():
+    lons, lats = [170, -170, -170, 170], [0, 0, 10, 10]
+    assert footprint_bbox(lons, lats) == [170.0, 0.0, -170.0, 10.0]
+    lon_0, lat_0 = footprint_centres(np.array(lons), np.array(lats))
+    assert abs(abs(lon_0) - 180.0) < 1.0e-6
+    assert 4.9 < lat_0 < 5.2
+
+
+def test_footprint_ordinary_and_polar():
+    catalog = make_catalog()
+    records = catalog.records
+    assert footprint_bbox(records["lon_list"][0], records["lat_list"][0]) == [
+        -128.0,
+        44.0,
+        -118.0,
+        54.0,
+    ]
+    lon_0, lat_0 = footprint_centres(records["lon_list"], records["lat_list"])
+    np.testing.assert_allclose(lon_0, [-123.0, -17.0], atol=1.0e-4)
+    ring = [0, 90, 180, -90]
+    assert footprint_bbox(ring, [80] * 4) == [-180.0, 80.0, 180.0, 90.0]
+    assert footprint_bbox(ring, [-80] * 4) == [-180.0, -90.0, 180.0, -80.0]
@@ -0,0 +1,37 @@
+"""
+  day/night prefilter (satcode.daynight) on hand made catalog rows
+"""
+import numpy as np
+
+from satcode.catalog import Catalog, record_dtype
+from satcode.daynight import granule_sun, prefilter, solar_zenith
+
+
+def antimeridian_catalog(lon_0=0.0, lat_0=5.0):
+    """
+    one granule with corners at 170 and -170 at local noon on the
+    antimeridian, with the lon_0/lat_0 an older catalog stored for it
+    """
+    records = np.zeros(1, dtype=record_dtype)
+    records["filename"] = b"MYD021KM.A2013222.0000.061.2018047235850.hdf"
+    records["start"] = np.datetime64("2013-08-10T00:00")
+    records["daynight"] = b"Day"
+    records["lon_list"] = [[170, -170, -170, 170]]
+    records["lat_list"] = [[0, 0, 10, 10]]
+    records["lon_0"], records["lat_0"] = lon_0, lat_0
+    return Catalog(records, folders=["."])
+
+
+def test_granule_sun_antimeridian():
+    catalog = antimeridian_catalog()
+    zenith, flag, ambiguous = granule_sun(catalog)
+    expected = solar_zenith(np.datetime64("2013-08-10T00:00"), 180.0, 5.08)
+    assert abs(zenith[0] - expected) < 0.5
+    assert zenith[0] < 20.0
+    assert flag[0] == "Day" and not ambiguous[0]
+
+
+def test_prefilter_keeps_daylit_antimeridian_granule():
+    catalog = antimeridian_catalog()
+    assert prefilter(catalog, want="Day", max_zenith=30).tolist() == [True]
+    assert prefilter(catalog, want="Night").tolist() == [False]
@@ -0,0 +1,73 @@
+"""
+  fetch_manifest and its cross-process file locks (satcode.data_read)
+"""
+import concurrent.futures
+import multiprocessing
+
+import pytest
+
+from satcode.data_read import IntegrityError, fetch_manifest
+
+
+def entry(upstream, name, size=None):
+    return dict(
+        filename=name, root=[upstream.root], priority=0, size=size, checksum=None
+    )
+
+
+def test_fetch_downloads_then_present(upstream, tmp_path):
+    name = sorted(upstream.folder.iterdir())[0].name
+    dest = tmp_path / "dest"
+    assert fetch_manifest([entry(upstream, name)], dest) == {name: "downloaded"}
+    assert fetch_manifest([entry(upstream, name)], dest) == {name: "present"}
+    assert (dest / name).read_bytes() == (upstream.folder / name).read_bytes()
+
+
+def test_fetch_replaces_truncated_file(upstream, tmp_path):
+    source = sorted(upstream.folder.iterdir())[0]
+    good = source.read_bytes()
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / source.name).write_bytes(good[:500])
+    (dest / f"{source.name}.bad").write_bytes(b"older")
+    status = fetch_manifest([entry(upstream, source.name, len(good))], dest)
+    assert status == {source.name: "replaced"}
+    assert (dest / source.name).read_bytes() == good
+    assert (dest / f"{source.name}.bad").read_bytes() == b"older"
+    assert (dest / f"{source.name}.bad.1").read_bytes() == good[:500]
+
+
+def test_fetch_wrong_manifest_size_keeps_file(upstream, tmp_path):
+    source = sorted(upstream.folder.iterdir())[0]
+    good = source.read_bytes()
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / source.name).write_bytes(good)
+    status = fetch_manifest([entry(upstream, source.name, 10)], dest)
+    assert isinstance(status[source.name], IntegrityError)
+    assert (dest / source.name).read_bytes() == good
+    assert sorted(path.name for path in dest.iterdir()) == [
+        source.name,
+        f"{source.name}.lock",
+    ]
+
+
+def test_fetch_concurrent_processes_download_once(upstream, tmp_path):
+    names = sorted(path.name for path in upstream.folder.iterdir())
+    entries = [entry(upstream, name) for name in names]
+    dest = tmp_path / "dest"
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(4, mp_context=context) as pool:
+        futures = [pool.submit(fetch_manifest, entries, dest) for _ in range(4)]
+        results = [future.result() for future in futures]
+    for name in names:
+        outcomes = sorted(result[name] for result in results)
+        assert outcomes == ["downloaded"] + ["present"] * 3
+        assert (dest / name).read_bytes() == (upstream.folder / name).read_bytes()
+    assert sorted(upstream.hits) == sorted(f"/{name}" for name in names)
+
+
+@pytest.mark.parametrize("size", [None, 1])
+def test_fetch_missing_file(upstream, tmp_path, size):
+    status = fetch_manifest([entry(upstream, "nothere.hdf", size)], tmp_path)
+    assert status == {"nothere.hdf": "missing"}
@@ -0,0 +1,58 @@
+"""
+  Landsat _MTL.txt parsing (satcode.landsat.read_mtl)
+"""
+from satcode.landsat import LandsatScene, read_mtl
+from satcode.readers import open_granule
+
+mtl_text = """GROUP = L1_METADATA_FILE
+  GROUP = PRODUCT_METADATA
+    SPACECRAFT_ID = "LANDSAT_8"
+    DATE_ACQUIRED = 2013-10-11
+    SCENE_CENTER_TIME = "18:53:12.6743940Z"
+    WRS_PATH = 47
+  END_GROUP = PRODUCT_METADATA
+  GROUP = IMAGE_ATTRIBUTES
+    SUN_ELEVATION = 35.27395318
+    CLOUD_COVER = 1.5e+01
+    NOTE = __import__("os").remove("{victim}")
+  END_GROUP = IMAGE_ATTRIBUTES
+END_GROUP = L1_METADATA_FILE
+END
+"""
+
+
+def write_mtl(folder):
+    victim = folder / "victim.txt"
+    victim.write_text("still here")
+    path = folder / "LC08_L1TP_047026_20131011_20170429_01_T1_MTL.txt"
+    path.write_text(mtl_text.format(victim=victim))
+    return path, victim
+
+
+def test_read_mtl_values(tmp_path):
+    path, victim = write_mtl(tmp_path)
+    mtl = read_mtl(path)
+    product = mtl["L1_METADATA_FILE"]["PRODUCT_METADATA"]
+    image = mtl["L1_METADATA_FILE"]["IMAGE_ATTRIBUTES"]
+    assert product["SPACECRAFT_ID"] == "LANDSAT_8"
+    assert product["DATE_ACQUIRED"] == "2013-10-11"
+    assert product["WRS_PATH"] == 47
+    assert image["SUN_ELEVATION"] == 35.27395318
+    assert image["CLOUD_COVER"] == 15.0
+    assert image["NOTE"].startswith("__import__")
+    assert victim.read_text() == "still here"
+
+
+def test_landsat_reader_metadata(tmp_path):
+    path, victim = write_mtl(tmp_path)
+    scene = LandsatScene(tmp_path)
+    assert scene.sensor == "oli"
+    #
+    # _read_metadata: metadata() adds the footprint, which needs rasterio
+    #
+    meta = open_granule(path)._read_metadata()
+    assert meta["startdate"] == "2013-10-11"
+    assert meta["starttime"] == "18:53:12.674394"
+    assert str(meta["start"]) == "2013-10-11T18:53:12.674"
+    assert meta["platform"] == "LANDSAT_8"
+    assert victim.read_text() == "still here"
@@ -0,0 +1,100 @@
+"""
+  the satcode.mirror server and falling back between download roots
+"""
+import socket
+
+import pytest
+import requests
+
+from satcode.data_read import download
+from satcode.mirror import running_mirror
+
+
+@pytest.fixture
+def mirror_folder(tmp_path, granules):
+    folder = tmp_path / "mirror"
+    folder.mkdir()
+    source = granules[0]
+    (folder / source.name).write_bytes(source.read_bytes())
+    return folder
+
+
+def test_range_requests(mirror_folder, granules):
+    data = granules[0].read_bytes()
+    url_name = granules[0].name
+    with running_mirror(mirror_folder) as root:
+        url = f"{root}/{url_name}"
+        whole = requests.get(url)
+        assert whole.status_code == 200 and whole.content == data
+        assert whole.headers["Accept-Ranges"] == "bytes"
+        size = len(data)
+        for header, first, last in [
+            ("bytes=0-99", 0, 99),
+            ("bytes=100-", 100, size - 1),
+            ("bytes=-50", size - 50, size - 1),
+            (f"bytes=10-{size + 100}", 10, size - 1),
+        ]:
+            part = requests.get(url, headers={"Range": header})
+            assert part.status_code == 206
+            assert part.content == data[first : last + 1]
+            assert part.headers["Content-Range"] == f"bytes {first}-{last}/{size}"
+        beyond = requests.get(url, headers={"Range": f"bytes={size}-"})
+        assert beyond.status_code == 416
+        assert beyond.headers["Content-Range"] == f"bytes */{size}"
+
+
+def test_listing_hides_lock_and_temporary_files(mirror_folder, granules):
+    (mirror_folder / f"{granules[0].name}.lock").touch()
+    (mirror_folder / "partial.hdf_tmp").touch()
+    with running_mirror(mirror_folder) as root:
+        listing = requests.get(f"{root}/").text
+        assert granules[0].name in listing
+        assert ".lock" not in listing and "_tmp" not in listing
+        assert requests.get(f"{root}/partial.hdf_tmp").status_code == 404
+
+
+def test_fill_on_miss(upstream, tmp_path, monkeypatch):
+    monkeypatch.setenv("SATCODE_MIRRORS", "http://127.0.0.1:9")
+    name = sorted(path.name for path in upstream.folder.iterdir())[-1]
+    folder = tmp_path / "mirror"
+    folder.mkdir()
+    with running_mirror(folder, upstream=upstream.root) as root:
+        first = requests.get(f"{root}/{name}")
+        second = requests.get(f"{root}/{name}", headers={"Range": "bytes=0-3"})
+        missing = requests.get(f"{root}/nothere.hdf")
+    data = (upstream.folder / name).read_bytes()
+    assert first.status_code == 200 and first.content == data
+    assert second.status_code == 206 and second.content == data[:4]
+    assert missing.status_code == 404
+    assert (folder / name).read_bytes() == data
+    assert upstream.hits.count(f"/{name}") == 1
+
+
+def test_download_skips_corrupt_mirror(upstream, tmp_path):
+    name = sorted(path.name for path in upstream.folder.iterdir())[0]
+    corrupt = tmp_path / "corrupt"
+    corrupt.mkdir()
+    (corrupt / name).write_bytes(b"JUNK" + (upstream.folder / name).read_bytes())
+    dest = tmp_path / "dest"
+    with running_mirror(corrupt) as mirror:
+        download(name, root=[mirror, upstream.root], dest_folder=dest)
+    assert (dest / name).read_bytes() == (upstream.folder / name).read_bytes()
+
+
+def test_download_skips_stalled_root(upstream, tmp_path):
+    name = sorted(path.name for path in upstream.folder.iterdir())[0]
+    #
+    # accepts connections but never answers
+    #
+    stalled = socket.socket()
+    stalled.bind(("127.0.0.1", 0))
+    stalled.listen()
+    dead_root = f"http://127.0.0.1:{stalled.getsockname()[1]}"
+    dest = tmp_path / "dest"
+    try:
+        download(
+            name, root=[dead_root, upstream.root], dest_folder=dest, timeout=(1, 1)
+        )
+    finally:
+        stalled.close()
+    assert (dest / name).read_bytes() == (upstream.folder / name).read_bytes()
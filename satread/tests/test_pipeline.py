@@ -0,0 +1,67 @@
+"""
+  satcode.pipeline graphs for the satcode.readers sensors, on a synthetic
+  GOES ABI file
+"""
+import numpy as np
+import pytest
+
+from satcode import synthetic
+from satcode.pipeline import load_result, reader_graph
+from satcode.readers import AbiL1bReader, open_granule
+
+
+@pytest.fixture(scope="module")
+def goes(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("goes")
+    synthetic.generate("goes", count=1, dest_folder=folder, rows=150, cols=250)
+    return sorted(folder.glob("*.nc"))[0]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(AbiL1bReader, "default_chunks", lambda self: (64, 128))
+
+
+def task_names(graph):
+    return [key if isinstance(key, str) else key[0] for key in graph.__dask_graph__()]
+
+
+def count_calls(monkeypatch, name):
+    calls = []
+    method = getattr(AbiL1bReader, name)
+
+    def counted(self, *args):
+        calls.append(args)
+        return method(self, *args)
+
+    monkeypatch.setattr(AbiL1bReader, name, counted)
+    return calls
+
+
+def test_reader_graph_reads_chunks_as_tasks(goes, small_chunks, monkeypatch, tmp_path):
+    graph = reader_graph(str(goes), bands=None, out_folder=tmp_path)
+    reads = [name for name in task_names(graph) if "traced_block" in name]
+    assert len(reads) >= 3 * 2
+    calls = count_calls(monkeypatch, "_read_block")
+    (output,) = graph.compute(scheduler="threads")
+    assert len(calls) == 3 * 2
+    image, _, _ = load_result(output)
+    expected = open_granule(goes).band("C13").compute()
+    np.testing.assert_array_equal(image, expected)
+
+
+def test_reader_graph_resamples_chunked_geolocation(
+    goes, small_chunks, monkeypatch, tmp_path
+):
+    proj_params = dict(proj="laea", lon_0=-100, lat_0=35, ellps="WGS84")
+    graph = reader_graph(
+        str(goes), bands=None, out_folder=tmp_path, proj_params=proj_params
+    )
+    reads = [name for name in task_names(graph) if "traced_geolocation" in name]
+    assert len(reads) >= 3 * 2
+    calls = count_calls(monkeypatch, "_read_geolocation_block")
+    (output,) = graph.compute(scheduler="threads")
+    assert len(calls) == 3 * 2
+    image, area_def, _ = load_result(output)
+    assert image.shape == area_def.shape
+    assert np.isfinite(image).any()
@@ -0,0 +1,76 @@
+"""
+  sparse weight resampling (satcode.resample) on a synthetic granule
+"""
+import numpy as np
+import pytest
+from pyhdf.SD import SD, SDC
+from pyresample import AreaDefinition, SwathDefinition, kd_tree
+
+from satcode import instrument, resample
+
+
+@pytest.fixture(scope="module")
+def swath(granules):
+    geolocation = [path for path in granules if path.name.startswith("MYD03")][0]
+    the_file = SD(str(geolocation), SDC.READ)
+    lons = the_file.select("Longitude").get().astype(np.float64)
+    lats = the_file.select("Latitude").get().astype(np.float64)
+    the_file.end()
+    return SwathDefinition(lons, lats)
+
+
+@pytest.fixture(scope="module")
+def area(swath):
+    lons, lats = swath.get_lonlats()
+    proj = dict(
+        proj="laea", lon_0=float(lons.mean()), lat_0=float(lats.mean()), units="m"
+    )
+    return AreaDefinition(
+        "test", "test", "test", proj, 60, 10, swath_extent(swath, proj)
+    )
+
+
+def swath_extent(swath, proj):
+    import pyproj
+
+    lons, lats = swath.get_lonlats()
+    x, y = pyproj.Proj(proj)(lons, lats)
+    return (x.min(), y.min(), x.max(), y.max())
+
+
+def test_nearest_matches_pyresample(swath, area):
+    data = np.random.default_rng(0).random(swath.shape).astype(np.float32)
+    resample.clear_cache()
+    ours = resample.resample(
+        swath, data, area, method="nearest", radius_of_influence=60000
+    )
+    theirs = kd_tree.resample_nearest(
+        swath, data, area, radius_of_influence=60000, fill_value=None
+    )
+    assert ours.shape == area.shape
+    np.testing.assert_array_equal(np.isnan(ours), np.ma.getmaskarray(theirs))
+    valid = ~np.isnan(ours)
+    assert valid.mean() > 0.2
+    np.testing.assert_array_equal(ours[valid], np.ma.getdata(theirs)[valid])
+
+
+def test_weights_cached_per_geometry_object(swath, area, tmp_path):
+    resample.clear_cache()
+    instrument.reset()
+    instrument.enable()
+    try:
+        first = resample.get_weights(swath, area, "nearest")
+        assert resample.get_weights(swath, area, "nearest") is first
+        lons, lats = swath.get_lonlats()
+        rebuilt = SwathDefinition(lons.copy(), lats.copy())
+        assert resample.get_weights(rebuilt, area, "nearest") is not first
+        on_disk = resample.get_weights(swath, area, "bilinear", cache_dir=tmp_path)
+        resample.clear_cache()
+        loaded = resample.get_weights(rebuilt, area, "bilinear", cache_dir=tmp_path)
+        counts = instrument.counters()
+    finally:
+        instrument.disable()
+        instrument.reset()
+    assert counts["weight_cache_hits"] == 2
+    assert counts["weight_cache_misses"] == 3
+    assert (loaded.matrix != on_disk.matrix).nnz == 0
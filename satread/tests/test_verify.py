@@ -0,0 +1,70 @@
+"""
+  download verification while streaming (satcode.data_read._StreamCheck)
+"""
+import hashlib
+
+import pytest
+
+from satcode.data_read import IntegrityError, _StreamCheck, download
+
+hdf_magic = b"\x0e\x03\x13\x01"
+
+
+def streamed(name, data, checksum=None, size=None, block=7):
+    check = _StreamCheck(name, checksum, size)
+    for start in range(0, len(data), block):
+        check.update(data[start : start + block])
+    return check
+
+
+def test_stream_check_accepts_good_file():
+    data = hdf_magic + bytes(range(200))
+    digest = hashlib.sha256(data).hexdigest()
+    check = streamed("a.hdf", data, f"sha256:{digest}", len(data))
+    check.verify(str(len(data)))
+    assert check.checksum == f"sha256:{digest}"
+    assert check.nbytes == len(data)
+
+
+def test_stream_check_md5():
+    data = hdf_magic + b"abc"
+    streamed("a.hdf", data, f"md5:{hashlib.md5(data).hexdigest()}").verify()
+
+
+@pytest.mark.parametrize(
+    "name, data, checksum, size, content_length, message",
+    [
+        ("a.hdf", hdf_magic + b"x" * 50, None, None, 100, "Content-Length"),
+        ("a.hdf", hdf_magic + b"x" * 50, None, 100, None, "expected size"),
+        ("a.hdf", b"<html>not found</html>", None, None, None, "not a .hdf"),
+        ("a.nc", hdf_magic + b"x", None, None, None, "not a .nc"),
+        ("a.hdf", hdf_magic + b"x", "sha256:" + "0" * 64, None, None, "!= expected"),
+    ],
+)
+def test_stream_check_rejects_bad_data(
+    name, data, checksum, size, content_length, message
+):
+    check = streamed(name, data, checksum, size)
+    with pytest.raises(IntegrityError, match=message):
+        check.verify(content_length)
+
+
+def test_download_rejects_corrupt_file(upstream, tmp_path):
+    source = sorted(upstream.folder.iterdir())[0]
+    data = bytearray(source.read_bytes())
+    data[:4] = b"JUNK"
+    source.write_bytes(bytes(data))
+    dest = tmp_path / "dest"
+    with pytest.raises(IntegrityError):
+        download(source.name, root=[upstream.root], dest_folder=dest)
+    assert list(dest.iterdir()) == []
+
+
+def test_download_checks_sidecar_checksum(upstream, tmp_path):
+    source = sorted(upstream.folder.iterdir())[0]
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / f"{source.name}.sha256").write_text("0" * 64 + f"  {source.name}\n")
+    with pytest.raises(IntegrityError, match="sha256"):
+        download(source.name, root=[upstream.root], dest_folder=dest)
+    assert not (dest / source.name).exists()